@@ -1,11 +1,20 @@
-from datetime import datetime
-import re
-from typing import List, Dict, Any
-import pandas as pd
-from openpyxl.styles import PatternFill, Font, Alignment
-from openpyxl.utils import get_column_letter
+from datetime import datetime, timedelta
+import os
+import argparse
+from contextlib import nullcontext
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Union
+from collections import defaultdict, deque
+from operator import itemgetter
+import resultstore
+import logio
+import logformats
+import timeindex
+from parsecache import ParseCache
+from latency import CommandLatencyStats, PERCENTILES
+from excelwriter import BulkWorkbook
+import profiler as stage_profiler
 
-rootpath = 'D:/00_PROJECT/04_Python/LogAnalyzer/'  
+rootpath = logformats.DEFAULT_ROOT
 
 motion_dict = {
     '528': 'ADIT_UCS',
@@ -38,166 +47,378 @@ motion_dict = {
     '527': 'JOG_STOP'
 }
 
-def parse_log_line(line: str) -> Dict[str, Any]:
+# 控制日志行格式见 logformats 中登记的 'control' 格式: 10:00:00.123 [CmdID / UniID = [769 ][Exec][1 SHM_Updated]
+# 正则只编译一次; 不含 CmdID 的行在正则之前就被过滤
+CONTROL_FORMAT = logformats.get('control')
+LOG_LINE_PREFILTER = CONTROL_FORMAT.prefilter
+LOG_LINE_RE = CONTROL_FORMAT.regex
+
+# 控制日志只有时刻; 时刻落在 CLOCK_BASE 当天, 跨过午夜后依次加一天
+CLOCK_BASE = datetime(1900, 1, 1)
+# 时刻比上一行倒退超过该间隔视为跨日, 小的倒退按日志乱序处理
+ROLLOVER_GAP = timedelta(hours=12)
+ONE_DAY = timedelta(days=1)
+# 时间窗口查询: 窗口内开始的动作最长等待多久完成, 与异常检测的动作超时一致
+WINDOW_TAIL_MS = 600000
+
+parse_clock = logformats.parse_clock
+
+def parse_log_line(line: str, log_format: logformats.LogFormat = CONTROL_FORMAT) -> Optional[Dict[str, Any]]:
     """解析单行日志"""
     try:
-        # 正则表达式提取 CmdID、状态和动作
-        pattern = r'(\d{2}:\d{2}:\d{2}\.\d{3})\s+\[CmdID / UniID = \[(\d+)\s+\]\[(\w+)\]\[(\d+)\s+(.*?)\]'
-        match = re.match(pattern, line)
-        if match:
-            timestamp_str, cmd_id, status, action_code, action_stat = match.groups()
-            return {
-            'timestamp': datetime.strptime(timestamp_str, '%H:%M:%S.%f'),
-            'cmd_id': cmd_id.strip(),
-            'status': status.strip(),
-            'action_code': action_code.strip(),
-            'action_stat': action_stat.strip()
-        }
-        return None
+        # 正则表达式提取时间戳、CmdID、状态和动作
+        return log_format.match(line)
         
     except Exception as e:
         print(f"Error parsing line: {line}")
         print(f"Error details: {str(e)}")
         return None
 
-def parse_specific_actions(log_content: str) -> List[Dict[str, Any]]:
-    """解析特定动作的开始和结束"""
-    action_starts = {}
-    completed_actions = []
-    
-    for line in log_content.split('\n'):
-        if not line.strip():
-            continue
-            
-        parsed = parse_log_line(line)
-        if not parsed:
+def iter_lines(source: Union[str, os.PathLike, Iterable[str]]) -> Iterator[str]:
+    """逐行读取: source 为日志文件路径(str 或 PathLike), 或任意可迭代的行
+    字符串总是当作路径, 文件不存在时抛出 FileNotFoundError; 整段日志文本请用 io.StringIO(文本) 传入"""
+    if isinstance(source, (str, os.PathLike)):
+        # 压缩日志按魔数识别, 边解压边读
+        with logio.open_text(source) as file:
+            yield from file
+    else:
+        yield from source
+
+def iter_parsed_lines(lines: Iterable[str], log_format=None,
+                      previous: Optional[datetime] = None) -> Iterator[Dict[str, Any]]:
+    """先按格式的字面量(默认 CmdID)预过滤, 再解析; 检测跨日, 午夜之后的时间戳日期依次加一天
+    从日志中途开始读取时, previous 为之前最后一行的时间戳(含跨日天数)"""
+    log_format = logformats.REGISTRY.resolve(log_format, 'control')
+    day_offset = timedelta(0) if previous is None else ONE_DAY * (previous - CLOCK_BASE).days
+    for line in lines:
+        if not log_format.accepts(line):
             continue
-        
+        parsed = parse_log_line(line, log_format)
+        if parsed:
+            timestamp = parsed['timestamp'] + day_offset
+            if previous is not None and timestamp < previous - ROLLOVER_GAP:
+                day_offset += ONE_DAY
+                timestamp += ONE_DAY
+            parsed['timestamp'] = timestamp
+            previous = timestamp
+            yield parsed
+
+class ActionMatcher:
+    """按 cmd_id 配对 SHM_Updated 开始与 Finish 结束, 每个 cmd_id 一个先进先出队列"""
+    def __init__(self):
+        self.action_starts = defaultdict(deque)
+    def feed(self, parsed: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """输入一条解析结果, 配对成功时返回完成的动作, 否则返回 None"""
         cmd_id = parsed['cmd_id']
         action_stat = parsed['action_stat']
-        status = parsed['status']
         timestamp = parsed['timestamp']
         
         # 处理开始事件
         if 'SHM_Updated' in action_stat:
-            key = f"{cmd_id}_{timestamp.strftime('%H:%M:%S.%f')}"
-            print(key)
-            action_starts[key] = {
+            starts = self.action_starts[cmd_id]
+            start_info = {
                 'start_time': timestamp,
                 'cmd_id': cmd_id,
                 'action_stat': action_stat
             }
+            # 同一 cmd_id 同一时刻的重复开始覆盖前一条, 与原先以 "cmd_id_时间" 为键的行为一致
+            if starts and starts[-1]['start_time'] == timestamp:
+                starts[-1] = start_info
+            else:
+                starts.append(start_info)
         
-        # 处理结束事件
+        # 处理结束事件: 与该 cmd_id 最早的未完成开始配对
         elif 'Finish' in action_stat:
-            # 查找匹配的开始事件
-            matching_key = None
-            for key in list(action_starts.keys()):
-                if key.startswith(f"{cmd_id}_"):
-                    matching_key = key
-                    break
-            
-            if matching_key:
-                start_info = action_starts[matching_key]
+            starts = self.action_starts.get(cmd_id)
+            if starts:
+                start_info = starts.popleft()
                 duration = (timestamp - start_info['start_time']).total_seconds()
-                
-                completed_actions.append({
+                return {
                     'action_stat': start_info['action_stat'],
                     'cmd_id': cmd_id,
                     'start_time': start_info['start_time'],
                     'end_time': timestamp,
                     'duration': duration
-                })
-                
-                del action_starts[matching_key]
-    
+                }
+        return None
+    def discard(self, cmd_id: str, start_time: datetime) -> bool:
+        """丢弃超时未完成的开始事件, 避免之后的 Finish 与之误配"""
+        starts = self.action_starts.get(cmd_id)
+        if not starts:
+            return False
+        # 超时的通常是该 cmd_id 最早的一条
+        if starts[0]['start_time'] == start_time:
+            starts.popleft()
+            return True
+        for index, start_info in enumerate(starts):
+            if start_info['start_time'] == start_time:
+                del starts[index]
+                return True
+        return False
+    def pending_count(self) -> int:
+        """尚未等到 Finish 的开始事件数"""
+        return sum(len(starts) for starts in self.action_starts.values())
+    def get_state(self) -> List[List[Any]]:
+        """未完成的开始事件 [[cmd_id, 开始毫秒数, action_stat], ...], 用于写入时间索引"""
+        return [[cmd_id, (start_info['start_time'] - CLOCK_BASE) // timedelta(milliseconds=1),
+                 start_info['action_stat']]
+                for cmd_id, starts in self.action_starts.items() for start_info in starts]
+    def set_state(self, state: Optional[List[List[Any]]]):
+        """从 get_state 的结果恢复, 同一 cmd_id 的开始事件保持原有先后"""
+        self.action_starts = defaultdict(deque)
+        for cmd_id, start_ms, action_stat in state or []:
+            self.action_starts[cmd_id].append({
+                'start_time': CLOCK_BASE + timedelta(milliseconds=start_ms),
+                'cmd_id': cmd_id,
+                'action_stat': action_stat
+            })
+    def has_pending(self, start: datetime, end: datetime) -> bool:
+        """是否还有开始时间在 [start, end] 内、尚未等到 Finish 的开始事件"""
+        return any(start <= start_info['start_time'] <= end
+                   for starts in self.action_starts.values() for start_info in starts)
+
+def _stage(profiler, stage, items=None):
+    """一次性阶段的计时上下文, 未开启分阶段计时时不做任何事"""
+    return nullcontext() if profiler is None else profiler.stage(stage, items)
+
+def iter_specific_actions(source: Union[str, os.PathLike, Iterable[str]],
+                          detector=None, log_format=None, profiler=None) -> Iterator[Dict[str, Any]]:
+    """流式解析: 读取 → 预过滤 → 解析 → 配对, 动作按完成顺序逐个产出
+    detector 为 anomaly.ControlAnomalyDetector 时同时做超时和耗时异常检测, 结果在 detector.findings
+    log_format 为格式名或 logformats.LogFormat, 默认为 'control'
+    profiler 为 profiler.StageProfiler 时分别统计读取、解析和配对各阶段"""
+    lines = iter_lines(source)
+    if profiler is None:
+        return _match_actions(iter_parsed_lines(lines, log_format), detector)
+    lines = profiler.iterate('control.read', lines, len)
+    parsed_lines = profiler.iterate('control.parse', iter_parsed_lines(lines, log_format), source='control.read')
+    return profiler.iterate('control.match', _match_actions(parsed_lines, detector))
+
+def _match_actions(parsed_lines: Iterable[Dict[str, Any]], detector=None) -> Iterator[Dict[str, Any]]:
+    matcher = ActionMatcher()
+    for parsed in parsed_lines:
+        if detector is not None:
+            detector.feed(parsed, matcher)
+        action = matcher.feed(parsed)
+        if action:
+            if detector is not None:
+                detector.complete(action)
+            yield action
+    if detector is not None:
+        detector.finish()
+
+class MatcherTracker:
+    """建立时间索引时同步做开始/结束配对, 每个索引点记录未完成的开始事件
+    从索引点开始的窗口查询恢复该状态后, 配对结果与从头读取完全相同"""
+    def __init__(self, log_format: logformats.LogFormat):
+        self.log_format = log_format
+        self.matcher = ActionMatcher()
+        self.parsed = None
+    def line_time(self, line: str) -> Optional[int]:
+        """行内时刻的当日毫秒数; 跨日由索引按时刻倒退检测后把含天数的时间传给 feed"""
+        self.parsed = parse_log_line(line, self.log_format) if self.log_format.accepts(line) else None
+        if self.parsed is None:
+            return None
+        return (self.parsed['timestamp'] - CLOCK_BASE) // timedelta(milliseconds=1)
+    def feed(self, t: int):
+        self.parsed['timestamp'] = CLOCK_BASE + timedelta(milliseconds=t)
+        self.matcher.feed(self.parsed)
+    def get_state(self):
+        return self.matcher.get_state()
+    def set_state(self, state):
+        self.matcher.set_state(state)
+
+def time_index(log_path: str, log_format=None, index_path: Optional[str] = None) -> timeindex.TimeIndex:
+    """控制日志的稀疏时间索引, 没有索引时建立, 日志增长后只续建新增部分
+    索引中的时间为自首日零点起的毫秒数, 即 CLOCK_BASE 加跨日天数后的时间戳"""
+    if logio.is_compressed(log_path):
+        raise ValueError(f'压缩日志不支持按时间定位: {log_path}')
+    log_format = logformats.REGISTRY.resolve(log_format, 'control')
+    tracker = MatcherTracker(log_format)
+    index = timeindex.TimeIndex(log_path, tracker.line_time, log_format.name, rollover=True,
+                                index_path=index_path, tracker=tracker)
+    index.update()
+    return index
+
+def iter_window_actions(log_path: str, start_ms: int, end_ms: int, index: Optional[timeindex.TimeIndex] = None,
+                        log_format=None, tail_ms: int = WINDOW_TAIL_MS) -> Iterator[Dict[str, Any]]:
+    """时间窗口查询: 产出开始时间在 [start_ms, end_ms] 内的动作, 时间为自首日零点起的毫秒数
+    按索引定位到 start_ms 之前最近的索引点, 恢复该处未完成的开始事件后只解析窗口所在的一段,
+    结果与全量解析后按开始时间筛选相同; 窗口内开始的动作都已完成, 或已超过 end_ms + tail_ms 时停止读取"""
+    log_format = logformats.REGISTRY.resolve(log_format, 'control')
+    index = index or time_index(log_path, log_format)
+    offset, last_ms, state = index.seek(start_ms)
+    previous = None if last_ms is None else CLOCK_BASE + timedelta(milliseconds=last_ms)
+    start = CLOCK_BASE + timedelta(milliseconds=start_ms)
+    end = CLOCK_BASE + timedelta(milliseconds=end_ms)
+    stop = end + timedelta(milliseconds=tail_ms)
+    matcher = ActionMatcher()
+    matcher.set_state(state)
+    for parsed in iter_parsed_lines(timeindex.iter_lines_from(log_path, offset), log_format, previous):
+        action = matcher.feed(parsed)
+        if action and start <= action['start_time'] <= end:
+            yield action
+        timestamp = parsed['timestamp']
+        if timestamp > end and (timestamp > stop or not matcher.has_pending(start, end)):
+            break
+
+def log_first_day(log_path: str, actions: List[Dict[str, Any]]):
+    """控制日志首行所在日期: 文件修改日期是最后写入的那天, 减去动作时间中已累计的跨日天数"""
+    last_day = datetime.fromtimestamp(os.path.getmtime(log_path)).date()
+    if not actions:
+        return last_day
+    last_end = max(action['end_time'] for action in actions)
+    return last_day - timedelta(days=(last_end - CLOCK_BASE).days)
+
+def sort_actions(actions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """按开始时间稳定排序; 动作基本按开始时间到达, 内置排序对近乎有序的输入很快,
+    也省去逐个转换为 datetime64 的开销"""
+    return sorted(actions, key=itemgetter('start_time'))
+
+def parse_specific_actions(source: Union[str, os.PathLike, Iterable[str]],
+                           log_format=None, profiler=None) -> List[Dict[str, Any]]:
+    """解析特定动作的开始和结束"""
+    actions = list(iter_specific_actions(source, log_format=log_format, profiler=profiler))
     # 按开始时间排序
-    return sorted(completed_actions, key=lambda x: x['start_time'])
-
-def create_excel_report(actions: List[Dict[str, Any]], output_file: str):
-    """创建Excel报告"""
-    # 准备时间线数据
-    timeline_data = [{
-        '开始时间': action['start_time'].strftime('%H:%M:%S.%f'),
-        '结束时间': action['end_time'].strftime('%H:%M:%S.%f'),
-        '指令ID': motion_dict[action['cmd_id']],
-        '耗时(秒)': round(action['duration'], 3)
-    } for action in actions]
-    
-    # 计算统计信息
-    stats = {}
-    for action in actions:
-        name = action['cmd_id']
-        if name not in stats:
-            stats[name] = {
-                'count': 0,
-                'total_time': 0,
-                'min_time': float('inf'),
-                'max_time': 0
-            }
-        
-        s = stats[name]
-        s['count'] += 1
-        s['total_time'] += action['duration']
-        s['min_time'] = min(s['min_time'], action['duration'])
-        s['max_time'] = max(s['max_time'], action['duration'])
+    with _stage(profiler, 'control.sort', len(actions)):
+        return sort_actions(actions)
+
+def analyze_actions(log_path: str, cache: Optional[ParseCache] = None, detector=None, log_format=None,
+                    profiler=None):
+    """解析控制日志文件, 返回 (按开始时间排序的动作, 耗时统计); 日志未变化时从缓存读取
+    需要异常检测(detector)时总是重新解析"""
+    log_format = logformats.REGISTRY.resolve(log_format, 'control')
+    # 缓存类别即格式名, 同一文件按不同格式解析的结果分开缓存
+    cache_kind = log_format.name
+    if detector is not None:
+        cache = None
+    if cache is not None:
+        cached = cache.get(log_path, cache_kind)
+        if cached is not None:
+            return cached
+    # 耗时分位数统计在动作完成时流式累计
+    stats = CommandLatencyStats()
+    actions = stats.observe(iter_specific_actions(log_path, detector, log_format, profiler))
+    if profiler is not None:
+        actions = profiler.iterate('control.stats', actions)
+    actions = list(actions)
+    with _stage(profiler, 'control.sort', len(actions)):
+        actions = sort_actions(actions)
+    if cache is not None:
+        cache.put(log_path, cache_kind, (actions, stats))
+    return actions, stats
+
+def _sketch_stats_rows(stats: CommandLatencyStats) -> List[Dict[str, Any]]:
+    """由耗时统计草图生成统计表各行"""
+    stats_data = []
+    for name, s in stats.histograms.items():
+        row = {
+            '指令ID': name,
+            '执行次数': s.count,
+            '平均耗时(秒)': round(s.mean, 3),
+            '最短耗时(秒)': round(s.min, 3),
+            '最长耗时(秒)': round(s.max, 3),
+            '总耗时(秒)': round(s.total, 3)
+        }
+        for p in PERCENTILES:
+            row[f'P{p}耗时(秒)'] = round(s.quantile(p / 100), 3)
+        stats_data.append(row)
+    return stats_data
+
+def _vector_stats(cmd_ids: 'pd.Series', durations: 'pd.Series') -> 'pd.DataFrame':
+    """按指令分组整列计算耗时统计, 分位数为精确值"""
+    import pandas as pd
+    grouped = durations.groupby(cmd_ids, sort=False)
+    summary = pd.DataFrame({
+        '执行次数': grouped.count(),
+        '平均耗时(秒)': grouped.mean(),
+        '最短耗时(秒)': grouped.min(),
+        '最长耗时(秒)': grouped.max(),
+        '总耗时(秒)': grouped.sum()
+    })
+    for p in PERCENTILES:
+        summary[f'P{p}耗时(秒)'] = grouped.quantile(p / 100)
+    summary = summary.round(3)
+    summary.insert(0, '指令ID', summary.index)
+    return summary.reset_index(drop=True)
+
+def create_excel_report(actions: List[Dict[str, Any]], output_file: str,
+                        stats: Optional[CommandLatencyStats] = None,
+                        anomalies: Optional[List[Dict[str, Any]]] = None, profiler=None):
+    """创建Excel报告; stats 为动作完成时已累计的耗时统计, 未提供时由 actions 计算
+    anomalies 为异常检测结果, 非空时写入单独的异常事件表"""
+    with _stage(profiler, 'control.export', len(actions)):
+        _write_excel_report(actions, output_file, stats, anomalies)
+
+def _write_excel_report(actions, output_file, stats, anomalies):
+    # 导出时才加载 pandas, 只看汇总时不需要
+    import pandas as pd
+    # 整列计算时间线: 耗时由时间戳相减得到, 跨日的动作也为正
+    df = pd.DataFrame(actions, columns=['cmd_id', 'start_time', 'end_time'])
+    start_time = pd.to_datetime(df['start_time'])
+    end_time = pd.to_datetime(df['end_time'])
+    durations = (end_time - start_time).dt.total_seconds()
+    timeline_data = pd.DataFrame({
+        '开始时间': start_time.dt.strftime('%H:%M:%S.%f'),
+        '结束时间': end_time.dt.strftime('%H:%M:%S.%f'),
+        '指令ID': df['cmd_id'].map(lambda cmd_id: motion_dict.get(cmd_id, cmd_id)),
+        '耗时(秒)': durations.round(3)
+    })
     
-    stats_data = [{
-        '指令ID': name,
-        '执行次数': s['count'],
-        '平均耗时(秒)': round(s['total_time'] / s['count'], 3),
-        '最短耗时(秒)': round(s['min_time'], 3),
-        '最长耗时(秒)': round(s['max_time'], 3),
-        '总耗时(秒)': round(s['total_time'], 3)
-    } for name, s in stats.items()]
+    # 计算统计信息: 有流式累计的统计时用其分位数, 否则按指令分组整列计算
+    if stats is not None:
+        stats_data = pd.DataFrame(_sketch_stats_rows(stats))
+    else:
+        stats_data = _vector_stats(df['cmd_id'], durations)
     
-    # 创建Excel写入器
-    with pd.ExcelWriter(output_file, engine='openpyxl') as writer:
-        # 写入时间线sheet
-        pd.DataFrame(timeline_data).to_excel(writer, sheet_name='动作时间线', index=False)
-        
-        # 写入统计信息sheet
-        pd.DataFrame(stats_data).to_excel(writer, sheet_name='统计信息', index=False)
-        
-        # 格式化Excel
-        workbook = writer.book
-        
-        for sheet_name in ['动作时间线', '统计信息']:
-            sheet = workbook[sheet_name]
-            
-            # 设置列宽
-            for column in sheet.columns:
-                max_length = 0
-                column_letter = get_column_letter(column[0].column)
-                
-                for cell in column:
-                    try:
-                        max_length = max(max_length, len(str(cell.value)))
-                    except:
-                        pass
-                
-                adjusted_width = (max_length + 2)
-                sheet.column_dimensions[column_letter].width = adjusted_width
-            
-            # 设置标题行格式
-            for cell in sheet[1]:
-                cell.fill = PatternFill(start_color="CCE5FF", end_color="CCE5FF", fill_type="solid")
-                cell.font = Font(bold=True)
-                cell.alignment = Alignment(horizontal='center', vertical='center')
+    # 批量写出, 列宽由写入时记录的字符串长度得出, 不再逐个单元格回读
+    with BulkWorkbook(output_file) as book:
+        header_format = book.add_format({
+            'bold': True, 'bg_color': '#CCE5FF', 'align': 'center', 'valign': 'vcenter'})
+        for sheet_name, df in (('动作时间线', timeline_data), ('统计信息', stats_data)):
+            book.write_table(sheet_name, list(df.columns), df.itertuples(index=False, name=None),
+                             header_format=header_format)
+        if anomalies:
+            columns = list(anomalies[0])
+            book.write_table('异常事件', columns, ([item[name] for name in columns] for item in anomalies),
+                             header_format=header_format)
 
 def main():
+    parser = argparse.ArgumentParser(description='控制日志动作分析')
+    parser.add_argument('--excel', action='store_true', help='同时生成Excel报告')
+    parser.add_argument('--no-cache', action='store_true', help='不使用解析缓存, 强制重新解析')
+    parser.add_argument('--anomalies', action='store_true', help='检测超时未完成和耗时异常的动作')
+    stage_profiler.add_arguments(parser)
+    args = parser.parse_args()
+    profiler = stage_profiler.from_args(args)
     try:
-        # 读取日志文件
-        with open(rootpath + 'ctrl.txt', 'r') as file:
-            log_content = file.read()
+        # 逐行流式读取日志文件
+        log_path = rootpath + 'ctrl.txt'
         
         print("开始解析日志...")
-        actions = parse_specific_actions(log_content)
+        cache = None if args.no_cache else ParseCache(rootpath + 'analysis_results/cache')
+        detector = None
+        if args.anomalies:
+            from anomaly import ControlAnomalyDetector
+            detector = ControlAnomalyDetector()
+        actions, stats = analyze_actions(log_path, cache, detector, profiler=profiler)
         print(f"成功解析 {len(actions)} 个动作")
+        anomalies = detector.findings if detector else None
+        if detector:
+            print(f"发现 {len(anomalies)} 个异常")
+        
+        # 结果库是主要输出; 控制日志只有时刻, 首日由文件修改日期减去跨日天数得出
+        store_dir = rootpath + 'analysis_results/store'
+        log_day = log_first_day(log_path, actions)
+        with _stage(profiler, 'control.store', len(actions)):
+            resultstore.save_actions(actions, store_dir, os.path.basename(log_path), log_day)
+            resultstore.save_latency(stats, store_dir, os.path.basename(log_path), log_day)
+        print(f"已保存到结果库: {store_dir}")
         
-        print("\n创建Excel报告...")
-        create_excel_report(actions, rootpath + '动作分析报告.xlsx')
-        print("Excel报告已成功生成: 动作分析报告.xlsx")
+        if args.excel:
+            print("\n创建Excel报告...")
+            create_excel_report(actions, rootpath + '动作分析报告.xlsx', stats, anomalies, profiler)
+            print("Excel报告已成功生成: 动作分析报告.xlsx")
         
         # 打印预览
         print("\n动作时间线预览 (前5条记录):")
@@ -208,6 +429,7 @@ def main():
             print(f"结束时间: {action['end_time'].strftime('%H:%M:%S.%f')}")
             print(f"耗时: {action['duration']:.3f}秒")
             print("-" * 80)
+        stage_profiler.finish(profiler, args)
     
     except Exception as e:
         print(f"程序执行出错: {str(e)}")
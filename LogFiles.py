@@ -1,13 +1,359 @@
-import re
-from datetime import datetime
+from datetime import datetime, date, timedelta, time as dt_time
 from collections import defaultdict
-import pandas as pd
+from functools import lru_cache
 import os
+import re
+import sys
+import mmap
+import csv
+import json
+import time
+import argparse
+from contextlib import nullcontext
+import resultstore
+import logio
+import logformats
+import timeindex
+from parsecache import ParseCache
+from excelwriter import BulkWorkbook, excel_clock
+import profiler as stage_profiler
+
+rootpath = logformats.DEFAULT_ROOT
+# 通信日志行格式见 logformats 中登记的 'comm' 格式: Debug: 2024-09-24 10:00:00.123: Snd: 05
+# 正则只编译一次; 先做前缀判断, 时刻按固定偏移换算, 不再经过 strptime
+COMM_FORMAT = logformats.get('comm')
+LOG_LINE_PREFIX = COMM_FORMAT.prefilter
+LOG_LINE_RE = COMM_FORMAT.regex
+
+def ms_to_time(ms):
+    """毫秒时间戳(或当日毫秒数)转换为当日时刻 datetime.time"""
+    return dt_time(ms // 3600000 % 24, ms // 60000 % 60, ms // 1000 % 60, ms % 1000 * 1000)
+
+# 时间戳统一为自 1970-01-01 起的毫秒数(按日志本地时间, 不做时区换算), 跨日相减仍正确
+MS_PER_DAY = 86400000
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+@lru_cache(maxsize=64)
+def date_to_epoch_ms(date_str):
+    """'YYYY-MM-DD' 当日零点的毫秒时间戳; 一份日志只有少数几个日期, 结果缓存"""
+    return (date.fromisoformat(date_str).toordinal() - _EPOCH_ORDINAL) * MS_PER_DAY
+
+@lru_cache(maxsize=64)
+def epoch_ms_to_date(day_index):
+    """自 1970-01-01 起的天数转换为 'YYYY-MM-DD', 同一天共用同一字符串"""
+    return sys.intern(date.fromordinal(_EPOCH_ORDINAL + day_index).isoformat())
+
+def epoch_ms_to_datetime(ms):
+    return datetime(1970, 1, 1) + timedelta(milliseconds=ms)
+
+def parse_frame(line, log_format=COMM_FORMAT):
+    """快速解析一行日志, 返回 (日期, 当日毫秒数, 方向, 数据), 不匹配时返回 None"""
+    return log_format.parse(line)
+
+class Frame:
+    """单帧通信记录; __slots__ 存储, 每帧约 60 字节, 远小于原先的字典"""
+    __slots__ = ('ms', 'direction', 'data')
+    def __init__(self, ms, direction, data):
+        self.ms = ms                # 毫秒时间戳, 含日期
+        self.direction = direction  # 'Snd' / 'Rcv'
+        self.data = data            # 十六进制报文字符串
+    @property
+    def timestamp(self):
+        """当日时刻"""
+        return ms_to_time(self.ms)
+    @property
+    def date(self):
+        """'YYYY-MM-DD', 由时间戳推出"""
+        return epoch_ms_to_date(self.ms // MS_PER_DAY)
+    def __getitem__(self, key):
+        # 兼容原先按字典键访问的写法
+        return getattr(self, key)
+    def __eq__(self, other):
+        if not isinstance(other, Frame):
+            return NotImplemented
+        return (self.ms == other.ms and self.direction == other.direction
+                and self.data == other.data)
+    __hash__ = None
+    def __repr__(self):
+        return f'Frame({self.ms}, {self.direction!r}, {self.data!r})'
+
+# 方向只有两种取值, 共用同一个字符串对象
+_DIRECTIONS = {'Snd': 'Snd', 'Rcv': 'Rcv'}
+
+def frame_to_parsed(frame):
+    """parse_frame 的结果转换为 Frame; 日期无效(如 2024-13-45)时返回 None, 与不匹配的行一样计为未解析"""
+    date_str, ms, direction, data = frame
+    try:
+        day_ms = date_to_epoch_ms(date_str)
+    except ValueError:
+        return None
+    # 05/04/06 等单字节控制帧占大多数, 驻留后各帧共用
+    if len(data) == 2:
+        data = sys.intern(data)
+    return Frame(day_ms + ms, _DIRECTIONS[direction], data)
+
+def split_ranges(path, parts):
+    """按换行符边界把文件切成约 parts 段 (起始, 结束) 字节区间"""
+    size = os.path.getsize(path)
+    if size == 0:
+        return []
+    step = max(size // parts, 1)
+    bounds = [0]
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        pos = step
+        while pos < size:
+            newline = mm.find(b'\n', pos)
+            if newline == -1:
+                break
+            bounds.append(newline + 1)
+            pos = newline + 1 + step
+    if bounds[-1] != size:
+        bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+# 二进制解析: 在整块缓冲区上用 bytes 正则 findall, 不逐行解码、strip, 与 'comm' 格式的结果相同
+# 字段间只允许空格和制表符, 匹配不会跨行; 毫秒 1~3 位, 与文本正则一致
+COMM_BYTES_RE = re.compile(
+    rb'^[ \t]*Debug:[ \t]+(\d{4}-\d{2}-\d{2}[ \t]+\d{2}:\d{2}:\d{2})\.(\d{1,3}):'
+    rb'[ \t]+(Snd|Rcv):[ \t]+([^\r\n]+)', re.MULTILINE)
+_BYTE_DIRECTIONS = {b'Snd': 'Snd', b'Rcv': 'Rcv'}
+# 每秒约有几十帧, 按 '日期 时:分:秒' 缓存该秒的毫秒时间戳; 超过上限时清空, 内存不随日志增长
+SECOND_CACHE_SIZE = 4096
+
+def iter_binary_records(blocks):
+    """blocks 为 logio.iter_line_blocks 的 (缓冲区, 起始, 结束), 产出 (毫秒时间戳, 方向, 数据)
+    时间按秒缓存, 05/04/06 等短报文按字节串缓存, 每帧只新建报文较长时的数据字符串"""
+    seconds = {}
+    short_data = {}
+    directions = _BYTE_DIRECTIONS
+    findall = COMM_BYTES_RE.findall
+    for buffer, start, end in blocks:
+        for stamp, frac, direction, data in findall(buffer, start, end):
+            base = seconds.get(stamp)
+            if base is None:
+                if len(seconds) >= SECOND_CACHE_SIZE:
+                    seconds.clear()
+                try:
+                    day_ms = date_to_epoch_ms(stamp[:10].decode('ascii'))
+                except ValueError:
+                    continue  # 日期无效, 与文本解析一样跳过该行
+                # 按固定偏移取字段, int() 直接接受 bytes
+                base = seconds[stamp] = (day_ms + int(stamp[-8:-6]) * 3600000
+                                         + int(stamp[-5:-3]) * 60000 + int(stamp[-2:]) * 1000)
+            data = data.rstrip()
+            if not data:
+                continue  # 数据只有空白, 文本正则同样不匹配
+            if len(data) <= 2:
+                text = short_data.get(data)
+                if text is None:
+                    text = short_data[data] = sys.intern(data.decode('utf-8', 'replace'))
+            else:
+                text = data.decode('utf-8', 'replace')
+            yield base + int(frac), directions[direction], text
+
+def _count_block_lines(blocks):
+    """分阶段计时用: 附上每块的行数 (缓冲区, 起始, 结束, 行数); 复制块内容即读入了 mmap 页面"""
+    for buffer, start, end in blocks:
+        data = buffer[start:end]
+        yield buffer, start, end, data.count(b'\n') + (not data.endswith(b'\n'))
+
+def parse_range(path, start, end, log_format=COMM_FORMAT, binary=False):
+    """子进程任务: 解析文件 [start, end) 字节区间内的所有帧
+    binary 为 True 时在 mmap 区间上直接匹配, 返回 (毫秒时间戳, 方向, 数据)"""
+    if binary:
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return list(iter_binary_records([(mm, start, end)]))
+    frames = []
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for raw in mm[start:end].splitlines():
+            frame = log_format.parse(raw.decode('utf-8', 'replace').strip())
+            if frame:
+                frames.append(frame)
+    return frames
+
+# 主报文协议表: 动作字节(第二个字节) -> (最少字节数, 格式模板[, 子动作缺省模板])
+# 模板参数依次为第三个字节起的各字节; 模板为字典时按第三个字节(子动作)再查一级,
+# 子动作字节数不足或未登记时使用缺省模板
+ACTION_TABLE = {
+    # 1. 读取状态
+    0x01: (2, '读取状态'),
+    0x08: (3, '设置速度:{0}'),
+    0x06: (2, '清除错误'),
+    0x22: (2, '整机复位'),
+    # 2. 执行Macro动作
+    0x21: (3, {
+        0x04: (6, '取片 站点{1} 层数{2} 手臂{3}'),
+        0x05: (6, '放片 站点{1} 层数{2} 手臂{3}'),
+        0x0c: (6, '准备 站点{1} 层数{2} 手臂{3} '),
+    }, '执行Macro动作{0}'),
+    # 3. 完成
+    0x62: (3, {
+        0x21: (3, 'Macro Finish'),
+        0x08: (3, '速度已设定'),
+        0x06: (3, '错误已清除'),
+    }, '动作 0x{0:02x} 已完成'),
+    # 4. 失败
+    0x63: (5, '执行0x{0:02x}失败 类型:0x{1:02x}, 代码:0x{2:02x}'),
+    # 5. IO事件触发
+    0x70: (4, 'IO事件触发 新:0x{0:02x}, 旧:0x{1:02X}'),
+    # 6. 模式切换事件
+    0x71: (3, '模式切换到:0x{0:02x}'),
+    0x61: (2, '状态已获取'),
+}
+# 7. 未知消息
+UNKNOWN_ACTION = '其他消息 0x{0:02x}'
+INCOMPLETE_DATA = '数据不完整'
+DECODE_CACHE_SIZE = 4096
+# 增量分析每产出多少个序列保存一次检查点
+CHECKPOINT_SEQUENCES = 1000
+# 时间窗口查询: 窗口内开始的序列最长等待多久闭合, 与关联分析的通信序列窗口一致
+WINDOW_TAIL_MS = 60000
+
+def _compile_template(min_len, template, default=None):
+    """把协议表中的一项编译为 decoder(payload), 字节数不足时返回 None"""
+    if isinstance(template, dict):
+        sub_decoders = {sub: _compile_template(*entry) for sub, entry in template.items()}
+        fallback = _compile_template(min_len, default)
+        def decoder(payload):
+            if len(payload) < min_len:
+                return None
+            sub_decoder = sub_decoders.get(payload[2])
+            result = sub_decoder(payload) if sub_decoder else None
+            return fallback(payload) if result is None else result
+    elif '{' not in template:
+        def decoder(payload):
+            return template if len(payload) >= min_len else None
+    else:
+        render = template.format
+        def decoder(payload):
+            return render(*payload[2:]) if len(payload) >= min_len else None
+    return decoder
+
+# 导入时编译一次
+_ACTION_DECODERS = {action: _compile_template(*entry) for action, entry in ACTION_TABLE.items()}
+
+@lru_cache(maxsize=DECODE_CACHE_SIZE)
+def decode_payload(payload):
+    """按协议表解析主报文字节; 相同报文大量重复, 结果按报文缓存"""
+    if len(payload) < 2:  # 确保至少有两个字节
+        return INCOMPLETE_DATA
+    action_byte = payload[1]  # 第二个字节是动作类型
+    decoder = _ACTION_DECODERS.get(action_byte)
+    if decoder is None:
+        return UNKNOWN_ACTION.format(action_byte)
+    result = decoder(payload)
+    return INCOMPLETE_DATA if result is None else result
+
+def decoder_cache_stats():
+    """主报文解析缓存的命中统计"""
+    info = decode_payload.cache_info()
+    total = info.hits + info.misses
+    return {
+        'hits': info.hits,
+        'misses': info.misses,
+        'size': info.currsize,
+        'hit_rate': info.hits / total if total else 0.0
+    }
+
+def load_checkpoint(path):
+    """读取增量分析检查点: 已处理字节偏移、文件 inode、未闭合序列和结果文件已写出的字节数"""
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {'offset': 0, 'inode': None, 'sequences': {}, 'output_size': 0}
+
+def save_checkpoint(path, checkpoint):
+    """先写临时文件再替换, 避免中途退出留下损坏的检查点"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+def truncate_output(output_path, checkpoint_path):
+    """结果文件截断到检查点记录的长度: 中途退出时检查点之后写出的行会在下次重新产出, 先删去避免重复
+    没有检查点时从头分析, 结果文件清空; 旧检查点没有记录长度时不处理"""
+    size = load_checkpoint(checkpoint_path).get('output_size')
+    if size is not None and os.path.exists(output_path) and os.path.getsize(output_path) > size:
+        with open(output_path, 'r+b') as f:
+            f.truncate(size)
+
+def extract_main_data(sequence):
+    """提取序列中的主体报文帧数据"""
+    main_data = []
+    found_04 = False
+    direction04 = 'Rcv'
+    for msg in sequence:
+        if found_04 and msg.data != '06' or (msg.data == '06' and msg.direction == 'Rcv'):  # 在找到04之后，06之前的都是主体报文
+            main_data.append(msg.data)
+        if msg.data == '04':
+            found_04 = True
+            direction04 = msg.direction
+        elif msg.data == '06' and msg.direction == direction04 :
+            break
+    return main_data
+
+class SequenceAssembler:
+    """ENQ(05)…ACK(06) 通信序列重组, 内存只保留未闭合的序列"""
+    def __init__(self):
+        self.current_send_sequence = []
+        self.current_receive_sequence = []
+    def get_state(self):
+        """未闭合序列, 用于写入检查点"""
+        return {
+            'send': [[f.ms, f.direction, f.data] for f in self.current_send_sequence],
+            'receive': [[f.ms, f.direction, f.data] for f in self.current_receive_sequence]
+        }
+    def set_state(self, state):
+        """从检查点恢复未闭合序列"""
+        self.current_send_sequence = [self._frame_from_state(f) for f in state.get('send', [])]
+        self.current_receive_sequence = [self._frame_from_state(f) for f in state.get('receive', [])]
+    @staticmethod
+    def _frame_from_state(item):
+        # 旧检查点为 [当日毫秒数, 方向, 数据, 日期]
+        if len(item) == 4:
+            ms, direction, data, date_str = item
+            return Frame(date_to_epoch_ms(date_str) + ms, direction, data)
+        return Frame(*item)
+    def feed(self, parsed):
+        """输入一帧, 有序列闭合时返回 (类型, 序列), 否则返回 None"""
+        completed = None
+        # 处理发送数据的通信序列
+        if parsed.direction == 'Snd' and parsed.data == '05':
+            if self.current_send_sequence:
+                completed = ('send', self.current_send_sequence)
+            self.current_send_sequence = [parsed]
+            return completed
+        # 处理接收数据的通信序列
+        if parsed.direction == 'Rcv' and parsed.data == '05':
+            if self.current_receive_sequence:
+                completed = ('receive', self.current_receive_sequence)
+            self.current_receive_sequence = [parsed]
+            return completed
+        # 更新发送序列
+        if self.current_send_sequence:
+            self.current_send_sequence.append(parsed)
+            if parsed.direction == 'Rcv' and parsed.data == '06':
+                completed = ('send', self.current_send_sequence)
+                self.current_send_sequence = []
+        # 更新接收序列
+        if self.current_receive_sequence:
+            self.current_receive_sequence.append(parsed)
+            if parsed.direction == 'Snd' and parsed.data == '06':
+                completed = ('receive', self.current_receive_sequence)
+                self.current_receive_sequence = []
+        return completed
 
-rootpath = 'D:/00_PROJECT/04_Python/LogAnalyzer/' 
 class LogAnalyzer:
-    def __init__(self, log_file_path):
+    def __init__(self, log_file_path, log_format=None, profiler=None, binary=None):
         self.log_file_path = log_file_path
+        # 日志行格式: 格式名或 logformats.LogFormat, 默认为 'comm'
+        self.log_format = logformats.REGISTRY.resolve(log_format, 'comm')
+        # 二进制解析只适用于内置 'comm' 格式; None 时该格式自动使用
+        if binary is None:
+            binary = self.log_format is COMM_FORMAT
+        elif binary and self.log_format is not COMM_FORMAT:
+            raise ValueError(f'二进制解析只支持内置的 comm 格式, 当前为 {self.log_format.name}')
+        self.binary = binary
         self.send_sequences = []    
         self.receive_sequences = [] 
         # 用于存储Excel数据的列表
@@ -15,176 +361,257 @@ class LogAnalyzer:
             'send': [],
             'receive': []
         }
+        # 异常检测结果, 见 anomaly.CommAnomalyDetector
+        self.anomalies = []
+        # 分阶段计时, 见 profiler.StageProfiler; 未开启时各阶段不做任何包装
+        self.profiler = profiler
+        if profiler is not None:
+            profiler.watch_cache(decoder_cache_stats)
+            self.parse_main_data = profiler.wrap('comm.decode', self.parse_main_data)
+            self.sequence_to_excel_row = profiler.wrap('comm.rows', self.sequence_to_excel_row)
+    def _stage(self, stage, items=None):
+        """一次性阶段的计时上下文, 未开启分阶段计时时不做任何事"""
+        return nullcontext() if self.profiler is None else self.profiler.stage(stage, items)
     def parse_log_line(self, line):
-        pattern = r'Debug:\s+(\d{4}-\d{2}-\d{2}\s+\d{2}:\d{2}:\d{2}\.(\d{3}|\d{1}|\d{2})):\s+(Snd|Rcv):\s+(.+)'
-        match = re.match(pattern, line)
-        
-        if match:
-            # 获取毫秒部分并确保它是3位数
-            timestamp_str = match.group(1)
-            time_parts = timestamp_str.split('.')
-            ms_part = time_parts[1].zfill(3) if len(time_parts) > 1 else '000'
-            
-            # 重构时间戳字符串
-            time_without_date = timestamp_str.split(' ')[1].split('.')[0]
-            full_time_str = f"{time_without_date}.{ms_part}"
-            
-            timestamp = datetime.strptime(full_time_str, '%H:%M:%S.%f').time()
-            direction = match.group(3)
-            data = match.group(4).strip()
-            return {
-                'timestamp': timestamp,
-                'direction': direction,
-                'data': data
-            }
+        frame = self.log_format.parse(line)
+        if frame:
+            return frame_to_parsed(frame)
         return None
-    def analyze_log(self):
-        with open(self.log_file_path, 'r') as f:
-            current_send_sequence = []
-            current_receive_sequence = []
-            
-            for line in f:
-                parsed = self.parse_log_line(line.strip())
-                #print(parsed)
-                if not parsed:
-                    continue
-                
-                # 处理发送数据的通信序列
-                if parsed['direction'] == 'Snd' and parsed['data'] == '05':
-                    if current_send_sequence:
-                        self.send_sequences.append(current_send_sequence)
-                    current_send_sequence = [parsed]
-                    continue
-                    
-                # 处理接收数据的通信序列
-                if parsed['direction'] == 'Rcv' and parsed['data'] == '05':
-                    if current_receive_sequence:
-                        self.receive_sequences.append(current_receive_sequence)
-                    current_receive_sequence = [parsed]
-                    continue
-                    # 更新发送序列
-                if current_send_sequence:
-                    current_send_sequence.append(parsed)
-                    if parsed['direction'] == 'Rcv' and parsed['data'] == '06':
-                        self.send_sequences.append(current_send_sequence)
-                        current_send_sequence = []
-                
-                # 更新接收序列
-                if current_receive_sequence:
-                    current_receive_sequence.append(parsed)
-                    if parsed['direction'] == 'Snd' and parsed['data'] == '06':
-                        self.receive_sequences.append(current_receive_sequence)
-                        current_receive_sequence = []
+    def iter_parsed(self):
+        """串行解析日志, 压缩日志边解压边解析"""
+        if self.binary:
+            yield from self._iter_parsed_binary()
+            return
+        with logio.open_text(self.log_file_path) as f:
+            if self.profiler is None:
+                yield from self._parse_lines(f)
+            else:
+                lines = self.profiler.iterate('comm.read', f, len)
+                yield from self.profiler.iterate('comm.parse', self._parse_lines(lines), source='comm.read')
+    def _parse_lines(self, lines):
+        for line in lines:
+            parsed = self.parse_log_line(line.strip())
+            if parsed:
+                yield parsed
+    def _iter_parsed_binary(self):
+        """按约 4MB 的整行块读取, 块内直接匹配 bytes, 不为每行建立 str"""
+        blocks = logio.iter_line_blocks(self.log_file_path)
+        if self.profiler is None:
+            for record in iter_binary_records(blocks):
+                yield Frame(*record)
+            return
+        # 读取阶段逐块统计行数, 同时读入 mmap 页面, 缺页耗时不计入解析; 未匹配的行数与文本解析一样可得
+        blocks = self.profiler.iterate('comm.read', _count_block_lines(blocks),
+                                       lambda block: block[2] - block[1], count=lambda block: block[3])
+        records = self.profiler.iterate('comm.parse', iter_binary_records(block[:3] for block in blocks),
+                                        source='comm.read')
+        for record in records:
+            yield Frame(*record)
+    def iter_parsed_parallel(self, workers):
+        """mmap 后按换行边界切块, 多进程解析, 再按块顺序输出各帧"""
+        # 进程池模块加载较慢, 只在多进程解析时导入
+        from concurrent.futures import ProcessPoolExecutor
+        # 块数取进程数的4倍, 各块耗时不均时也能让进程保持忙碌
+        ranges = split_ranges(self.log_file_path, workers * 4)
+        if not ranges:
+            return
+        starts = [start for start, _ in ranges]
+        ends = [end for _, end in ranges]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # map 按提交顺序返回结果, 跨块的序列由后续单一状态机按原顺序拼接
+            for frames in executor.map(parse_range, [self.log_file_path] * len(ranges), starts, ends,
+                                       [self.log_format] * len(ranges), [self.binary] * len(ranges)):
+                if self.binary:
+                    for record in frames:
+                        yield Frame(*record)
+                else:
+                    for frame in frames:
+                        parsed = frame_to_parsed(frame)
+                        if parsed:
+                            yield parsed
+    def iter_parsed_incremental(self, checkpoint):
+        """从检查点记录的字节偏移继续解析, 边读边把新偏移写回 checkpoint"""
+        if logio.is_compressed(self.log_file_path):
+            raise ValueError(f'压缩日志不支持增量分析: {self.log_file_path}')
+        stat = os.stat(self.log_file_path)
+        offset = checkpoint['offset']
+        # inode 变化或文件变短说明日志已轮转, 从新文件开头读取
+        if checkpoint['inode'] != stat.st_ino or stat.st_size < offset:
+            offset = 0
+        checkpoint['offset'] = offset
+        checkpoint['inode'] = stat.st_ino
+        with open(self.log_file_path, 'rb') as f:
+            f.seek(offset)
+            for raw in f:
+                if not raw.endswith(b'\n'):
+                    break  # 末尾还没写完的半行留到下次处理
+                offset += len(raw)
+                parsed = self.parse_log_line(raw.decode('utf-8', 'replace').strip())
+                if parsed:
+                    # 暂停在产出处时 checkpoint 即为已读到的位置, 可随时保存
+                    checkpoint['offset'] = offset
+                    yield parsed
+        checkpoint['offset'] = offset
+    def iter_sequences(self, workers=None, checkpoint_path=None, detector=None, output_size=None):
+        """读取日志, 每个通信序列闭合时立即产出 (类型, 序列)
+        workers>1 时多进程解析; 指定 checkpoint_path 时只处理上次之后新增的内容
+        detector 为 anomaly.CommAnomalyDetector 时逐帧做异常检测, 结果存入 self.anomalies
+        增量模式下每产出 CHECKPOINT_SEQUENCES 个序列及读完时保存检查点; output_size() 返回结果文件
+        已写出的字节数(调用方须在取下一个序列前写出上一个), 与进度一起保存, 见 truncate_output"""
+        sequences = self._assemble_sequences(workers, checkpoint_path, detector, output_size)
+        if self.profiler is not None:
+            sequences = self.profiler.iterate('comm.assemble', sequences)
+        return sequences
+    def _assemble_sequences(self, workers, checkpoint_path, detector, output_size):
+        assembler = SequenceAssembler()
+        if checkpoint_path:
+            checkpoint = load_checkpoint(checkpoint_path)
+            assembler.set_state(checkpoint['sequences'])
+            parsed_frames = self.iter_parsed_incremental(checkpoint)
+        elif workers and workers > 1 and not logio.is_compressed(self.log_file_path):
+            # 压缩日志无法按字节区间切分, 走串行流式解压
+            parsed_frames = self.iter_parsed_parallel(workers)
+        else:
+            parsed_frames = None
+        if parsed_frames is None:
+            parsed_frames = self.iter_parsed()
+        elif self.profiler is not None:
+            # 增量和多进程解析不区分读取与解析, 计为同一阶段
+            parsed_frames = self.profiler.iterate('comm.parse', parsed_frames)
+        detector_feed = None
+        if detector is not None:
+            detector_feed = detector.feed
+            if self.profiler is not None:
+                detector_feed = self.profiler.wrap('comm.detect', detector_feed)
+        unsaved = 0
+        for parsed in parsed_frames:
+            if detector_feed is not None:
+                self.anomalies.extend(detector_feed(parsed))
+            completed = assembler.feed(parsed)
+            if completed:
+                yield completed
+                if checkpoint_path:
+                    # 调用方已处理完产出的序列, 此时保存的进度与已写出的结果一致
+                    unsaved += 1
+                    if unsaved >= CHECKPOINT_SEQUENCES:
+                        self._save_checkpoint(checkpoint_path, checkpoint, assembler, output_size)
+                        unsaved = 0
+        if detector is not None and not checkpoint_path:
+            # 增量模式下未闭合的 ENQ 可能在之后新增的内容中闭合, 不在此处报告
+            self.anomalies.extend(detector.finish())
+        if checkpoint_path:
+            self._save_checkpoint(checkpoint_path, checkpoint, assembler, output_size)
+    def _save_checkpoint(self, checkpoint_path, checkpoint, assembler, output_size):
+        checkpoint['sequences'] = assembler.get_state()
+        if output_size is not None:
+            checkpoint['output_size'] = output_size()
+        save_checkpoint(checkpoint_path, checkpoint)
+    def _line_time(self, line):
+        """行的毫秒时间戳, 用于建立时间索引"""
+        parsed = self.parse_log_line(line)
+        return parsed.ms if parsed else None
+    def time_index(self, index_path=None):
+        """日志的稀疏时间索引 (timeindex.TimeIndex), 没有索引时建立, 日志增长后只续建新增部分"""
+        if logio.is_compressed(self.log_file_path):
+            raise ValueError(f'压缩日志不支持按时间定位: {self.log_file_path}')
+        index = timeindex.TimeIndex(self.log_file_path, self._line_time, self.log_format.name,
+                                    index_path=index_path)
+        index.update()
+        return index
+    def iter_window_rows(self, start_ms, end_ms, index=None, tail_ms=WINDOW_TAIL_MS):
+        """时间窗口查询: 按索引定位到 start_ms 之前最近的索引点, 只解析窗口所在的一段
+        产出开始时间在 [start_ms, end_ms] 内的序列报表行 (类型, 行), 与全量分析后按开始时间筛选的结果相同
+        窗口内开始的序列都已闭合, 或已超过 end_ms + tail_ms 时停止读取"""
+        index = index or self.time_index()
+        offset, _, _ = index.seek(start_ms)
+        assembler = SequenceAssembler()
+        self.sequence_counts = {'send': 0, 'receive': 0}
+        for line in timeindex.iter_lines_from(self.log_file_path, offset):
+            parsed = self.parse_log_line(line.strip())
+            if not parsed:
+                continue
+            completed = assembler.feed(parsed)
+            if completed:
+                seq_type, sequence = completed
+                if start_ms <= sequence[0].ms <= end_ms:
+                    self.sequence_counts[seq_type] += 1
+                    row_data = self.sequence_to_excel_row(
+                        sequence, "发送" if seq_type == 'send' else "接收", self.sequence_counts[seq_type])
+                    if row_data:
+                        yield seq_type, row_data
+            if parsed.ms > end_ms and (parsed.ms > end_ms + tail_ms or not any(
+                    sequence and sequence[0].ms <= end_ms
+                    for sequence in (assembler.current_send_sequence, assembler.current_receive_sequence))):
+                break
+    def _cache_kind(self, kind):
+        """解析缓存的类别, 同一文件按不同格式解析的结果分开缓存"""
+        return f'{self.log_format.name}-{kind}'
+    def analyze_log(self, workers=None, checkpoint_path=None, cache=None, detector=None):
+        # 缓存命中时直接载入上次解析出的序列, 跳过整个解析过程; 需要异常检测时总是重新解析
+        if detector is not None:
+            cache = None
+        if cache and not checkpoint_path:
+            cached = cache.get(self.log_file_path, self._cache_kind('sequences'))
+            if cached is not None:
+                self.send_sequences, self.receive_sequences = cached
+                return
+        for seq_type, sequence in self.iter_sequences(workers, checkpoint_path, detector):
+            if seq_type == 'send':
+                self.send_sequences.append(sequence)
+            else:
+                self.receive_sequences.append(sequence)
+        if cache and not checkpoint_path:
+            cache.put(self.log_file_path, self._cache_kind('sequences'), (self.send_sequences, self.receive_sequences))
+    def iter_report_rows(self, workers=None, checkpoint_path=None, cache=None, detector=None, output_size=None):
+        """流式模式: 序列闭合后立即归约为报表行 (类型, 行), 不保留帧数据"""
+        use_cache = cache is not None and not checkpoint_path and detector is None
+        if use_cache:
+            cached = cache.get(self.log_file_path, self._cache_kind('rows'))
+            if cached is not None:
+                report_rows, self.sequence_counts = cached
+                yield from report_rows
+                return
+            report_rows = []
+        self.sequence_counts = {'send': 0, 'receive': 0}
+        for seq_type, sequence in self.iter_sequences(workers, checkpoint_path, detector, output_size):
+            self.sequence_counts[seq_type] += 1
+            row_data = self.sequence_to_excel_row(
+                sequence, "发送" if seq_type == 'send' else "接收", self.sequence_counts[seq_type])
+            if row_data:
+                if use_cache:
+                    report_rows.append((seq_type, row_data))
+                yield seq_type, row_data
+        if use_cache:
+            cache.put(self.log_file_path, self._cache_kind('rows'), (report_rows, self.sequence_counts))
     def parse_main_data(self, data_str):
         """解析主报文内容"""
         try:
-            # 将十六进制字符串转换为字节列表
-            bytes_data = [int(x, 16) for x in data_str.split()]
-            if len(bytes_data) < 2:  # 确保至少有两个字节
-                return "数据不完整"
-            action_byte = bytes_data[1]  # 第二个字节是动作类型
-            # 1. 读取状态
-            if action_byte == 0x01:
-                return "读取状态"
-            elif action_byte == 0x08:
-                speed = bytes_data[2]
-                return f'设置速度:{speed}'
-            elif action_byte == 0x06:
-                return '清除错误'
-            elif action_byte == 0x22:
-                return '整机复位'
-            # 2. 执行Macro动作
-            elif action_byte == 0x21:
-                if len(bytes_data) >= 3:
-                    sub_action = bytes_data[2] if len(bytes_data) > 2 else None
-                    if sub_action == 0x04:  # 取片子动作
-                        if len(bytes_data) >= 6:
-                            station = bytes_data[3]
-                            layer = bytes_data[4]
-                            arm = bytes_data[5]
-                            return f"取片 站点{station} 层数{layer} 手臂{arm}"
-                    elif sub_action == 0x05:  # 放片子动作
-                        if len(bytes_data) >= 6:
-                            station = bytes_data[3]
-                            layer = bytes_data[4]
-                            arm = bytes_data[5]
-                            return f"放片 站点{station} 层数{layer} 手臂{arm}"
-                    elif sub_action == 0x0c:  # 准备子动作
-                        if len(bytes_data) >= 6:
-                            station = bytes_data[3]
-                            layer = bytes_data[4]
-                            arm = bytes_data[5]
-                            return f"准备 站点{station} 层数{layer} 手臂{arm} "
-                    return f"执行Macro动作{sub_action}"
-            # 3. 完成
-            elif action_byte == 0x62:
-                if len(bytes_data) >= 3:
-                    completed_action = bytes_data[2]
-                    if completed_action == 0x21:
-                        return "Macro Finish"
-                    elif completed_action == 0x08:
-                        return "速度已设定"
-                    elif completed_action == 0x06:
-                        return "错误已清除"
-                    return f"动作 0x{completed_action:02x} 已完成"
-            # 4. 失败
-            elif action_byte == 0x63:
-                if len(bytes_data) >= 4:
-                    error_action = bytes_data[2]
-                    error_type = bytes_data[3]
-                    error_code = bytes_data[4]
-                    return f"执行0x{error_action:02x}失败 类型:0x{error_type:02x}, 代码:0x{error_code:02x}"
-            # 5. IO事件触发
-            elif action_byte == 0x70:
-                if len(bytes_data) >= 3:
-                    io_event_new = bytes_data[2]
-                    io_event_old = bytes_data[3]
-                    return f"IO事件触发 新:0x{io_event_new:02x}, 旧:0x{io_event_old:02X}"
-            # 6. 模式切换事件
-            elif action_byte == 0x71:
-                if len(bytes_data) >= 3:
-                    mode = bytes_data[2]
-                    return f"模式切换到:0x{mode:02x}"
-            elif action_byte == 0x61:
-                return '状态已获取'
-            # 7. 未知消息
-            else:
-                return f"其他消息 0x{action_byte:02x}"
-        except Exception as e:
-            return f"解析错误: {str(e)}"
+            # 将十六进制字符串转换为字节
+            payload = bytes.fromhex(data_str)
+        except ValueError:
+            try:
+                payload = bytes(int(x, 16) for x in data_str.split())
+            except ValueError as e:
+                return f"解析错误: {str(e)}"
+        return decode_payload(payload)
     def sequence_to_excel_row(self, sequence, seq_type, idx):
         if len(sequence) >= 4:  # 确保至少包含完整的通信过程
-            start_time = sequence[0]['timestamp']
-            end_time = sequence[-1]['timestamp']
-            # 计算时间差（需要特殊处理）
-            t1 = datetime.combine(datetime.today(), start_time)
-            t2 = datetime.combine(datetime.today(), end_time)
-            duration = (t2 - t1).total_seconds() * 1000
+            start_time = sequence[0].timestamp
+            end_time = sequence[-1].timestamp
+            duration = float(sequence[-1].ms - sequence[0].ms)
             
             # 提取主体报文
-            main_data = []
-            found_04 = False
-            direction04 = 'Rcv'
-            for msg in sequence:
-                if found_04 and msg['data'] != '06' or (msg['data'] == '06' and msg['direction'] == 'Rcv'):  # 在找到04之后，06之前的都是主体报文
-                    main_data.append(msg['data'])
-                if msg['data'] == '04':
-                    found_04 = True
-                    direction04 = msg['direction']
-                elif msg['data'] == '06' and msg['direction'] == direction04 :
-                    break
+            main_data = extract_main_data(sequence)
             
             # 解析主报文内容
             main_data_str = ' '.join(main_data)
             parsed_main_data = self.parse_main_data(main_data_str) if main_data else ''
             
-            # 构建完整的通信过程字符串
-            sequence_str = []
-            for msg in sequence:
-                sequence_str.append(f"{msg['timestamp'].strftime('%H:%M:%S.%f')[:-3]} "
-                                    f"{msg['direction']}: {msg['data']}")
             return {
                 #'序列号': idx,
+                'start_ms': sequence[0].ms,
+                'end_ms': sequence[-1].ms,
+                '日期': sequence[0].date,
                 '开始时间': start_time,
                 '结束时间': end_time,
                 '持续时间(ms)': round(duration, 2),
@@ -193,92 +620,171 @@ class LogAnalyzer:
                 #'完整通信过程': '\n'.join(sequence_str)
             }
         return None
-    def generate_excel_report(self):
-        # 准备所有序列的数据
-        all_sequences = []
-        # 处理发送序列
-        for idx, sequence in enumerate(self.send_sequences, 1):
-            row_data = self.sequence_to_excel_row(sequence, "发送", idx)
-            if row_data:
-                #row_data['类型'] = '发送'  # 添加类型标识
-                all_sequences.append(row_data)
-        # 处理接收序列
-        for idx, sequence in enumerate(self.receive_sequences, 1):
-            row_data = self.sequence_to_excel_row(sequence, "接收", idx)
-            if row_data:
-                #row_data['类型'] = '接收'  # 添加类型标识
-                all_sequences.append(row_data)
-        # 按开始时间排序
-        all_sequences.sort(key=lambda x: x['开始时间'])
-        # 创建输出目录
-        output_dir = rootpath + 'analysis_results'
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-        
-        # 生成文件名
-        current_time = datetime.now().strftime('%Y%m%d_%H%M%S')
-        excel_path = f'{output_dir}/log_analysis_{current_time}.xlsx'
+    def generate_excel_report(self, report_rows=None, excel_path=None):
+        # 准备所有序列的数据, report_rows 为 iter_report_rows() 的流式输出
+        send_rows = []
+        receive_rows = []
+        if report_rows is None:
+            # 处理发送序列
+            for idx, sequence in enumerate(self.send_sequences, 1):
+                row_data = self.sequence_to_excel_row(sequence, "发送", idx)
+                if row_data:
+                    #row_data['类型'] = '发送'  # 添加类型标识
+                    send_rows.append(row_data)
+            # 处理接收序列
+            for idx, sequence in enumerate(self.receive_sequences, 1):
+                row_data = self.sequence_to_excel_row(sequence, "接收", idx)
+                if row_data:
+                    #row_data['类型'] = '接收'  # 添加类型标识
+                    receive_rows.append(row_data)
+            send_count = len(self.send_sequences)
+            receive_count = len(self.receive_sequences)
+        else:
+            for seq_type, row_data in report_rows:
+                if seq_type == 'send':
+                    send_rows.append(row_data)
+                else:
+                    receive_rows.append(row_data)
+            send_count = self.sequence_counts['send']
+            receive_count = self.sequence_counts['receive']
+        all_sequences = send_rows + receive_rows
+        if excel_path is None:
+            # 创建输出目录
+            output_dir = rootpath + 'analysis_results'
+            if not os.path.exists(output_dir):
+                os.makedirs(output_dir)
+            
+            # 生成文件名
+            current_time = datetime.now().strftime('%Y%m%d_%H%M%S')
+            excel_path = f'{output_dir}/log_analysis_{current_time}.xlsx'
         
-        # 创建Excel写入器
-        with pd.ExcelWriter(excel_path, engine='xlsxwriter') as writer:
+        # 批量写出: 逐行写入, 超过单表行数上限时自动分表
+        with self._stage('comm.export', len(all_sequences)), BulkWorkbook(excel_path) as book:
             # 所有数据序列表
             if all_sequences:
-                #print(all_sequences)
-                df_all = pd.DataFrame(all_sequences)
-                #print(df_all)
-                # 重新排列列顺序，将'类型'列放在序列号后面
                 columns = ['开始时间', '结束时间', '持续时间(ms)', '动作']
-                df_all = df_all[columns]
-                df_all.to_excel(writer, sheet_name='通信序列', index=False)
-                # 调整列宽
-                worksheet = writer.sheets['通信序列']
-                worksheet.set_column('A:A', 8)   # 序列号
-                worksheet.set_column('B:B', 8)   # 类型
-                worksheet.set_column('C:D', 20)  # 时间列
-                worksheet.set_column('E:E', 12)  # 持续时间
-                worksheet.set_column('F:F', 30)  # 主报文
-                worksheet.set_column('G:G', 50)  # 完整通信过程
-                # 添加条件格式，为不同类型设置不同的背景色
-                format_send = writer.book.add_format({'bg_color': '#E6F3FF'})  # 淡蓝色
-                format_receive = writer.book.add_format({'bg_color': '#F3FFE6'})  # 淡绿色
-                # 应用条件格式
-                worksheet.conditional_format('A2:G1048576', {
-                    'type': 'formula',
-                    'criteria': '=$B2="发送"',
-                    'format': format_send
-                })
-                worksheet.conditional_format('A2:G1048576', {
-                    'type': 'formula',
-                    'criteria': '=$B2="接收"',
-                    'format': format_receive
-                })
-                # 添加统计信息表
-                #print('works here')
-                stats_data = {
-                '统计项': ['发送序列总数', '接收序列总数', '总序列数'],
-                '数量': [
-                    len(self.send_sequences), 
-                    len(self.receive_sequences),
-                    len(self.send_sequences) + len(self.receive_sequences)
-                    ]
-                }
-                #print(stats_data)
-            df_stats = pd.DataFrame(stats_data)
-            df_stats.to_excel(writer, sheet_name='统计信息', index=False)
-            
-            # 调整统计信息表的列宽
-            worksheet = writer.sheets['统计信息']
-            worksheet.set_column('A:A', 15)
-            worksheet.set_column('B:B', 10)
+                df_all = sequence_frame(all_sequences)
+                df_all['开始时间'] = excel_clock(df_all['start_ms'])
+                df_all['结束时间'] = excel_clock(df_all['end_ms'])
+                # 条件格式，为不同类型设置不同的背景色
+                format_send = book.add_format({'bg_color': '#E6F3FF'})  # 淡蓝色
+                format_receive = book.add_format({'bg_color': '#F3FFE6'})  # 淡绿色
+                def format_sheet(worksheet):
+                    worksheet.conditional_format('A2:G1048576', {
+                        'type': 'formula',
+                        'criteria': '=$B2="发送"',
+                        'format': format_send
+                    })
+                    worksheet.conditional_format('A2:G1048576', {
+                        'type': 'formula',
+                        'criteria': '=$B2="接收"',
+                        'format': format_receive
+                    })
+                clock_format = book.clock_format()
+                book.write_table('通信序列', columns, df_all[columns].itertuples(index=False, name=None),
+                                 column_formats={0: clock_format, 1: clock_format}, on_sheet=format_sheet)
+            # 异常事件表
+            if self.anomalies:
+                columns = list(self.anomalies[0])
+                book.write_table('异常事件', columns,
+                                 ([item[name] for name in columns] for item in self.anomalies))
+            # 添加统计信息表
+            book.write_table('统计信息', ['统计项', '数量'], [
+                ('发送序列总数', send_count),
+                ('接收序列总数', receive_count),
+                ('总序列数', send_count + receive_count)
+            ])
         print(f"\nExcel报告已生成: {excel_path}")
-    def print_statistics(self):
+    def print_statistics(self, report_rows=None):
         # ... 保持原有的 print_statistics 方法不变 ...
         # 添加生成Excel报告
-        self.generate_excel_report()
+        self.generate_excel_report(report_rows)
+    def follow(self, checkpoint_path, interval=1.0, output_size=None):
+        """持续跟踪日志增长, 每轮只解析新增内容并产出新闭合序列的报表行"""
+        while True:
+            yield from self.iter_report_rows(checkpoint_path=checkpoint_path, output_size=output_size)
+            time.sleep(interval)
+
+def sequence_frame(rows):
+    """报表行转为 DataFrame, 按时间戳整列排序并计算持续时间, 跨日的序列也按实际先后排列"""
+    import numpy as np
+    import pandas as pd
+    df = pd.DataFrame(rows)
+    start_ms = df['start_ms'].to_numpy(dtype=np.int64)
+    order = np.argsort(start_ms, kind='stable')
+    df = df.iloc[order].reset_index(drop=True)
+    df['持续时间(ms)'] = (df['end_ms'] - df['start_ms']).astype(np.float64)
+    return df
+
+def append_rows_csv(csv_path, report_rows):
+    """把报表行追加写入CSV结果文件, 返回写入行数"""
+    columns = ['开始时间', '结束时间', '持续时间(ms)', '动作']
+    # 按长度判断: 没有检查点时 truncate_output 会把已有文件清空, 文件仍在但需重写表头
+    write_header = not os.path.exists(csv_path) or os.path.getsize(csv_path) == 0
+    count = 0
+    with open(csv_path, 'a', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f)
+        if write_header:
+            writer.writerow(columns)
+            f.flush()  # 表头计入检查点记录的长度
+        for _, row_data in report_rows:
+            writer.writerow([
+                row_data['开始时间'].strftime('%H:%M:%S.%f')[:-3],
+                row_data['结束时间'].strftime('%H:%M:%S.%f')[:-3],
+                row_data['持续时间(ms)'],
+                row_data['动作']
+            ])
+            f.flush()
+            count += 1
+    return count
+
 def main():
+    parser = argparse.ArgumentParser(description='通信日志分析')
+    parser.add_argument('--incremental', action='store_true', help='从检查点继续, 只把新序列追加到结果CSV')
+    parser.add_argument('--follow', action='store_true', help='持续跟踪日志增长, 新序列实时追加到结果CSV')
+    parser.add_argument('--interval', type=float, default=1.0, help='跟踪模式的轮询间隔(秒)')
+    parser.add_argument('--excel', action='store_true', help='同时生成Excel报告')
+    parser.add_argument('--no-cache', action='store_true', help='不使用解析缓存, 强制重新解析')
+    parser.add_argument('--anomalies', action='store_true', help='检测 ENQ 无应答、重试风暴和失败报文')
+    stage_profiler.add_arguments(parser)
+    args = parser.parse_args()
+    profiler = stage_profiler.from_args(args)
     #analyzer = LogAnalyzer('F:/01_ProjectsFiles/01_Programs/LogFilse/2024-09-24.log')
-    analyzer = LogAnalyzer(rootpath + 'logs.log')
-    analyzer.analyze_log()
-    analyzer.print_statistics()
+    analyzer = LogAnalyzer(rootpath + 'logs.log', profiler=profiler)
+    if args.incremental or args.follow:
+        output_dir = rootpath + 'analysis_results'
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        checkpoint_path = f'{output_dir}/logs.checkpoint.json'
+        csv_path = f'{output_dir}/log_analysis_incremental.csv'
+        # 结果CSV逐行写出, 检查点同时记录其长度; 上次中途退出多写的行先截掉
+        truncate_output(csv_path, checkpoint_path)
+        output_size = lambda: os.path.getsize(csv_path)
+        if args.follow:
+            append_rows_csv(csv_path, analyzer.follow(checkpoint_path, args.interval, output_size))
+        else:
+            count = append_rows_csv(csv_path, analyzer.iter_report_rows(checkpoint_path=checkpoint_path,
+                                                                        output_size=output_size))
+            print(f"新增 {count} 个通信序列, 已追加到: {csv_path}")
+        stage_profiler.finish(profiler, args)
+        return
+    # 流式模式: 序列闭合即归约为报表行, 内存只与未闭合序列数有关
+    # 日志未变化时从解析缓存直接读取
+    cache = None if args.no_cache else ParseCache(rootpath + 'analysis_results/cache')
+    detector = None
+    if args.anomalies:
+        from anomaly import CommAnomalyDetector
+        detector = CommAnomalyDetector()
+    report_rows = list(analyzer.iter_report_rows(cache=cache, detector=detector))
+    if detector:
+        print(f"发现 {len(analyzer.anomalies)} 个异常")
+    # 结果库是主要输出, Excel 按需从结果库或本次结果导出
+    store_dir = rootpath + 'analysis_results/store'
+    with analyzer._stage('comm.store', len(report_rows)):
+        resultstore.save_sequences(report_rows, store_dir, os.path.basename(analyzer.log_file_path))
+    print(f"已保存 {len(report_rows)} 个通信序列到结果库: {store_dir}")
+    if args.excel:
+        analyzer.print_statistics(report_rows)
+    stage_profiler.finish(profiler, args)
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,326 @@
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+from datetime import datetime
+
+import logformats
+import profiler as stage_profiler
+from latency import CommandLatencyStats, PERCENTILES
+
+# 统一命令行入口: analyze comm|control|combined <日志> [-f 输出格式] [-o 输出路径]
+# 各分析模块在子命令中才导入; summary / json / csv 只用标准库,
+# excel / store 才加载 pandas 和 xlsxwriter, 只看汇总时启动不受其影响
+
+OUTPUT_FORMATS = {
+    'comm': ['summary', 'json', 'csv', 'excel', 'store'],
+    'control': ['summary', 'json', 'csv', 'excel', 'store'],
+    'combined': ['summary', 'json', 'excel'],
+}
+OUTPUT_SUFFIXES = {'json': '.json', 'csv': '.csv', 'excel': '.xlsx'}
+COMPRESSED_SUFFIXES = ('.gz', '.bz2', '.xz', '.zst')
+# 结果库默认目录(相对当前目录)
+DEFAULT_STORE_DIR = os.path.join('analysis_results', 'store')
+# 控制台汇总列出的条目数, JSON 中输出全部
+TOP_ITEMS = 10
+
+def default_output(log_path, kind, output_format):
+    """未指定 -o 时的输出路径: 日志同目录下 <日志名>_<类型>.<扩展名>, 压缩扩展名先去掉"""
+    if output_format == 'store':
+        return DEFAULT_STORE_DIR
+    root = log_path
+    if root.endswith(COMPRESSED_SUFFIXES):
+        root = os.path.splitext(root)[0]
+    return f'{os.path.splitext(root)[0]}_{kind}{OUTPUT_SUFFIXES[output_format]}'
+
+def latency_rows(stats, names=None):
+    """按次数从多到少列出各项的次数、平均/最短/最长耗时和分位数"""
+    rows = []
+    for key, histogram in stats.histograms.items():
+        row = {
+            'name': names.get(key, key) if names else key,
+            'count': histogram.count,
+            'mean': round(histogram.mean, 3),
+            'min': round(histogram.min, 3),
+            'max': round(histogram.max, 3)
+        }
+        for p in PERCENTILES:
+            row[f'p{p}'] = round(histogram.quantile(p / 100), 3)
+        rows.append(row)
+    rows.sort(key=lambda row: (-row['count'], str(row['name'])))
+    return rows
+
+class SequenceSummary:
+    """通信序列汇总: 透传报表行的同时累计各方向序列数、时间范围和各动作耗时(ms)"""
+    def __init__(self):
+        self.counts = {'send': 0, 'receive': 0}
+        self.stats = CommandLatencyStats()
+        self.first_ms = None
+        self.last_ms = None
+    def observe(self, report_rows):
+        for seq_type, row_data in report_rows:
+            self.counts[seq_type] += 1
+            self.stats.add(row_data['动作'] or '(无主报文)', row_data['持续时间(ms)'])
+            if self.first_ms is None or row_data['start_ms'] < self.first_ms:
+                self.first_ms = row_data['start_ms']
+            if self.last_ms is None or row_data['end_ms'] > self.last_ms:
+                self.last_ms = row_data['end_ms']
+            yield seq_type, row_data
+    def to_dict(self):
+        from LogFiles import epoch_ms_to_datetime
+        def stamp(ms):
+            return None if ms is None else epoch_ms_to_datetime(ms).isoformat(sep=' ', timespec='milliseconds')
+        return {
+            'send_sequences': self.counts['send'],
+            'receive_sequences': self.counts['receive'],
+            'first': stamp(self.first_ms),
+            'last': stamp(self.last_ms),
+            'actions': latency_rows(self.stats)
+        }
+
+def summarize_actions(actions, stats):
+    """控制动作汇总: 动作数、时间范围(控制日志只有时刻, 另给出跨越的天数)和各指令耗时(秒)"""
+    import ControlLog
+    def clock(timestamp):
+        return timestamp.strftime('%H:%M:%S.%f')[:-3]
+    summary = {'actions': len(actions), 'first': None, 'last': None, 'days': 0,
+               'commands': latency_rows(stats, ControlLog.motion_dict)}
+    if actions:
+        last_end = max(action['end_time'] for action in actions)
+        summary['first'] = clock(actions[0]['start_time'])
+        summary['last'] = clock(last_end)
+        summary['days'] = (last_end - ControlLog.CLOCK_BASE).days + 1
+    return summary
+
+def print_latency_table(title, rows, unit):
+    print(f"\n{title} (耗时单位: {unit}, 按次数列出前 {min(len(rows), TOP_ITEMS)} 项, 共 {len(rows)} 项)")
+    header = f"{'次数':>8}{'平均':>10}" + ''.join(f"{'P' + format(p, 'g'):>10}" for p in PERCENTILES) + f"{'最长':>10}  名称"
+    print(header)
+    for row in rows[:TOP_ITEMS]:
+        print(f"{row['count']:>8}{row['mean']:>10.3f}" + ''.join(f"{row[f'p{p}']:>10.3f}" for p in PERCENTILES)
+              + f"{row['max']:>10.3f}  {row['name']}")
+
+def print_summary(kind, summary):
+    """控制台汇总"""
+    if kind in ('comm', 'combined'):
+        comm = summary if kind == 'comm' else summary['comm']
+        print(f"通信序列: 发送 {comm['send_sequences']}, 接收 {comm['receive_sequences']}, "
+              f"时间范围 {comm['first'] or '-'} ~ {comm['last'] or '-'}")
+        if kind == 'comm':
+            print_latency_table('各动作通信耗时', comm['actions'], 'ms')
+    if kind in ('control', 'combined'):
+        control = summary if kind == 'control' else summary['control']
+        days = f" (跨 {control['days']} 天)" if control.get('days') else ''
+        print(f"控制动作: {control['actions']} 个, 时间范围 {control['first'] or '-'} ~ {control['last'] or '-'}{days}")
+        print_latency_table('各指令耗时', control['commands'], '秒')
+    if kind == 'combined':
+        print(f"\n关联: {summary['linked_actions']} 个动作关联到通信序列, 共 {summary['links']} 处关联")
+    if summary.get('anomalies') is not None:
+        print(f"\n发现 {summary['anomalies']} 个异常")
+
+def write_json(summary, output):
+    """汇总写为 JSON; 未指定 -o 时输出到标准输出, 便于接管道"""
+    if output is None:
+        json.dump(summary, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+        return
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    print(f"汇总已写入: {output}")
+
+def write_csv(path, columns, rows):
+    """写出 CSV, 返回行数; utf-8-sig 便于 Excel 直接打开"""
+    count = 0
+    with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    return count
+
+def make_cache(args):
+    if not args.cache:
+        return None
+    from parsecache import ParseCache
+    return ParseCache(args.cache)
+
+def run_comm(args, profiler):
+    from LogFiles import LogAnalyzer
+    analyzer = LogAnalyzer(args.log_path, args.log_format, profiler)
+    detector = None
+    if args.anomalies:
+        from anomaly import CommAnomalyDetector
+        detector = CommAnomalyDetector()
+    summary = SequenceSummary()
+    rows = summary.observe(analyzer.iter_report_rows(args.workers, cache=make_cache(args), detector=detector))
+    if args.format == 'csv':
+        output = args.output or default_output(args.log_path, 'comm', 'csv')
+        count = write_csv(output, ['类型', '日期', '开始时间', '结束时间', '持续时间(ms)', '动作'], (
+            ('发送' if seq_type == 'send' else '接收', row_data['日期'],
+             row_data['开始时间'].strftime('%H:%M:%S.%f')[:-3], row_data['结束时间'].strftime('%H:%M:%S.%f')[:-3],
+             row_data['持续时间(ms)'], row_data['动作']) for seq_type, row_data in rows))
+        print(f"已写出 {count} 个通信序列: {output}")
+    elif args.format == 'excel':
+        analyzer.generate_excel_report(list(rows), args.output or default_output(args.log_path, 'comm', 'excel'))
+    elif args.format == 'store':
+        import resultstore
+        output = args.output or default_output(args.log_path, 'comm', 'store')
+        with analyzer._stage('comm.store'):
+            resultstore.save_sequences(rows, output, os.path.basename(args.log_path))
+        print(f"已保存到结果库: {output}")
+    else:
+        for _ in rows:
+            pass
+    result = summary.to_dict()
+    if detector is not None:
+        result['anomalies'] = len(analyzer.anomalies)
+    return result
+
+def run_control(args, profiler):
+    import ControlLog
+    detector = None
+    if args.anomalies:
+        from anomaly import ControlAnomalyDetector
+        detector = ControlAnomalyDetector()
+    actions, stats = ControlLog.analyze_actions(args.log_path, make_cache(args), detector, args.log_format,
+                                                profiler)
+    if args.format == 'csv':
+        output = args.output or default_output(args.log_path, 'control', 'csv')
+        count = write_csv(output, ['开始时间', '结束时间', '指令ID', '指令', '耗时(秒)'], (
+            (action['start_time'].strftime('%H:%M:%S.%f')[:-3], action['end_time'].strftime('%H:%M:%S.%f')[:-3],
+             action['cmd_id'], ControlLog.motion_dict.get(action['cmd_id'], ''), round(action['duration'], 3))
+            for action in actions))
+        print(f"已写出 {count} 个动作: {output}")
+    elif args.format == 'excel':
+        output = args.output or default_output(args.log_path, 'control', 'excel')
+        ControlLog.create_excel_report(actions, output, stats, detector.findings if detector else None, profiler)
+        print(f"Excel报告已生成: {output}")
+    elif args.format == 'store':
+        import resultstore
+        output = args.output or default_output(args.log_path, 'control', 'store')
+        # 控制日志只有时刻, 首日默认由文件修改日期减去跨日天数得出
+        log_day = args.date or ControlLog.log_first_day(args.log_path, actions)
+        with ControlLog._stage(profiler, 'control.store', len(actions)):
+            resultstore.save_actions(actions, output, os.path.basename(args.log_path), log_day)
+            resultstore.save_latency(stats, output, os.path.basename(args.log_path), log_day)
+        print(f"已保存到结果库: {output}")
+    result = summarize_actions(actions, stats)
+    if detector is not None:
+        result['anomalies'] = len(detector.findings)
+    return result
+
+def run_combined(args, profiler):
+    from combine import CombinedLogAnalyzer
+    comm_detector = control_detector = None
+    if args.anomalies:
+        from anomaly import CommAnomalyDetector, ControlAnomalyDetector
+        comm_detector = CommAnomalyDetector()
+        control_detector = ControlAnomalyDetector()
+    analyzer = CombinedLogAnalyzer(args.comm_log, args.control_log, control_log_date=args.date,
+                                   comm_format=args.comm_format, control_format=args.control_format,
+                                   profiler=profiler, comm_detector=comm_detector,
+                                   control_detector=control_detector)
+    analyzer.analyze()
+    if args.format == 'excel':
+        analyzer.generate_excel_report(excel_path=args.output or default_output(args.comm_log, 'combined', 'excel'))
+    sequences = SequenceSummary()
+    for _ in sequences.observe(('send' if row_data['类型'] == '发送' else 'receive', row_data)
+                               for row_data in analyzer.sequence_rows):
+        pass
+    commands = CommandLatencyStats()
+    first = last = None
+    for record in analyzer.control_records:
+        commands.add(record['指令ID'], record['耗时(秒)'])
+        first = record['开始时间'] if first is None else first
+        last = record['结束时间']
+    linked = [record for record in analyzer.control_records if record['关联通信数']]
+    result = {
+        'comm': sequences.to_dict(),
+        # 关联结果中的时刻已格式化为字符串, 时间范围取首尾记录
+        'control': {'actions': len(analyzer.control_records), 'first': first, 'last': last,
+                    'commands': latency_rows(commands)},
+        'linked_actions': len(linked),
+        'links': sum(record['关联通信数'] for record in linked)
+    }
+    if args.anomalies:
+        result['anomalies'] = len(analyzer.anomalies)
+    return result
+
+def existing_file(path):
+    if not os.path.isfile(path):
+        raise argparse.ArgumentTypeError(f'日志文件不存在: {path}')
+    return path
+
+def parse_date(text):
+    try:
+        return datetime.strptime(text, '%Y-%m-%d').date()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'无法识别的日期: {text}, 应为 YYYY-MM-DD') from None
+
+def add_common_arguments(parser, kind):
+    parser.add_argument('-f', '--format', choices=OUTPUT_FORMATS[kind], default='summary',
+                        help='输出格式: summary 控制台汇总(默认), json 汇总, csv 明细, excel 报告, store 写入结果库')
+    parser.add_argument('-o', '--output', help='输出路径; 默认 json 输出到标准输出, csv/excel 写在日志旁, '
+                                               f'store 为 {DEFAULT_STORE_DIR}')
+    parser.add_argument('--formats', help='额外的日志格式定义 JSON 文件, 见 logformats.FormatRegistry.load')
+    parser.add_argument('--anomalies', action='store_true', help='同时做异常检测')
+    parser.add_argument('--quiet', action='store_true', help='写出文件后不在控制台打印汇总')
+    stage_profiler.add_arguments(parser)
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='analyze', description='通信日志 / 控制日志分析')
+    commands = parser.add_subparsers(dest='kind', required=True, metavar='comm|control|combined')
+
+    comm = commands.add_parser('comm', help='通信日志: 拼接通信序列并解码主报文')
+    comm.add_argument('log_path', type=existing_file, help='通信日志, 可为 gzip/bz2/xz/zstd 压缩文件')
+    comm.add_argument('--log-format', help='日志行格式名, 默认 comm')
+    comm.add_argument('--workers', type=int, help='多进程解析的进程数, 仅未压缩日志')
+    comm.add_argument('--cache', help='解析缓存目录, 日志未变化时直接读取上次结果')
+    add_common_arguments(comm, 'comm')
+
+    control = commands.add_parser('control', help='控制日志: 配对动作的开始和结束并统计耗时')
+    control.add_argument('log_path', type=existing_file, help='控制日志, 可为压缩文件')
+    control.add_argument('--log-format', help='日志行格式名, 默认 control')
+    control.add_argument('--date', type=parse_date, help='store: 日志首日日期 YYYY-MM-DD, 默认为文件修改日期减去日志中的跨日天数')
+    control.add_argument('--cache', help='解析缓存目录, 日志未变化时直接读取上次结果')
+    add_common_arguments(control, 'control')
+
+    combined = commands.add_parser('combined', help='两路日志按时间关联')
+    combined.add_argument('comm_log', type=existing_file, help='通信日志')
+    combined.add_argument('control_log', type=existing_file, help='控制日志')
+    combined.add_argument('--comm-format', help='通信日志行格式名, 默认 comm')
+    combined.add_argument('--control-format', help='控制日志行格式名, 默认 control')
+    combined.add_argument('--date', type=parse_date, help='控制日志首日日期 YYYY-MM-DD, 默认取通信日志第一帧的日期')
+    add_common_arguments(combined, 'combined')
+    return parser
+
+RUNNERS = {
+    'comm': run_comm,
+    'control': run_control,
+    'combined': run_combined,
+}
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.formats:
+        logformats.REGISTRY.load(args.formats)
+    for name in ('log_format', 'comm_format', 'control_format'):
+        value = getattr(args, name, None)
+        if value is not None and value not in logformats.REGISTRY.formats:
+            parser.error(f'未登记的日志格式: {value}')
+    profiler = stage_profiler.from_args(args)
+    start = time.perf_counter()
+    summary = RUNNERS[args.kind](args, profiler)
+    if args.format == 'json':
+        write_json(summary, args.output)
+    elif args.format == 'summary' or not args.quiet:
+        print_summary(args.kind, summary)
+        print(f"\n用时 {time.perf_counter() - start:.2f}s")
+    stage_profiler.finish(profiler, args)
+
+if __name__ == "__main__":
+    main()
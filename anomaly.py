@@ -0,0 +1,258 @@
+import heapq
+import json
+import argparse
+from collections import deque
+from datetime import timedelta
+from LogFiles import LogAnalyzer, decode_payload, epoch_ms_to_datetime
+import ControlLog
+
+# 异常类型
+ENQ_TIMEOUT = 'ENQ无应答'
+RETRY_STORM = '重试风暴'
+FAILURE_FRAME = '执行失败'
+ACTION_TIMEOUT = '动作未完成'
+LATENCY_OUTLIER = '耗时异常'
+ANOMALY_COLUMNS = ['时间', '类型', '对象', '详情']
+
+ENQ_TIMEOUT_MS = 3000        # ENQ 发出后等待序列闭合(06)的时限
+STORM_WINDOW_MS = 10000      # NAK/重发计数的滑动窗口
+STORM_THRESHOLD = 5          # 窗口内达到该次数视为重试风暴
+ACTION_TIMEOUT_MS = 600000   # SHM_Updated 后等待 Finish 的时限, 与关联分析的动作窗口一致
+BASELINE_WINDOW = 200        # 每个指令保留最近多少次耗时作为基线
+BASELINE_MIN_SAMPLES = 20    # 样本不足时不判定耗时异常
+BASELINE_SIGMA = 4.0         # 超过基线均值若干倍标准差视为异常
+
+def finding(time_str, kind, subject, detail):
+    return {'时间': time_str, '类型': kind, '对象': subject, '详情': detail}
+
+def format_epoch_ms(ms):
+    return epoch_ms_to_datetime(ms).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+
+def format_clock(timestamp):
+    return timestamp.strftime('%H:%M:%S.%f')[:-3]
+
+class DeadlineQueue:
+    """到期时间小顶堆, 增删均为 O(log n)
+    已解决的条目只从 pending 中删除, 留在堆里的记录到期弹出时按 token 跳过"""
+    def __init__(self):
+        self.heap = []
+        self.pending = {}
+        self.counter = 0
+    def add(self, deadline, item):
+        token = self.counter
+        self.counter += 1
+        self.pending[token] = item
+        heapq.heappush(self.heap, (deadline, token))
+        return token
+    def resolve(self, token):
+        return self.pending.pop(token, None)
+    def expire(self, now):
+        """弹出到期时间不晚于 now 且仍未解决的条目 [(token, item)]"""
+        expired = []
+        while self.heap and self.heap[0][0] <= now:
+            _, token = heapq.heappop(self.heap)
+            item = self.pending.pop(token, None)
+            if item is not None:
+                expired.append((token, item))
+        return expired
+    def drain(self):
+        """日志结束时剩余的未解决条目, 按到期时间排列"""
+        remaining = []
+        while self.heap:
+            _, token = heapq.heappop(self.heap)
+            item = self.pending.pop(token, None)
+            if item is not None:
+                remaining.append((token, item))
+        return remaining
+    def __len__(self):
+        return len(self.pending)
+
+class BurstWindow:
+    """滑动时间窗口内的事件计数; 计数升到阈值时报告一次, 回落到阈值以下后才会再次报告"""
+    def __init__(self, window, threshold):
+        self.window = window
+        self.threshold = threshold
+        self.times = deque()
+        self.active = False
+    def add(self, t):
+        self.times.append(t)
+        while self.times[0] <= t - self.window:
+            self.times.popleft()
+        if len(self.times) < self.threshold:
+            self.active = False
+            return False
+        if self.active:
+            return False
+        self.active = True
+        return True
+
+class RollingBaseline:
+    """最近 window 次耗时的均值和标准差, 增量维护"""
+    def __init__(self, window=BASELINE_WINDOW):
+        self.window = window
+        self.values = deque()
+        self.total = 0.0
+        self.total_sq = 0.0
+    def add(self, value):
+        self.values.append(value)
+        self.total += value
+        self.total_sq += value * value
+        if len(self.values) > self.window:
+            old = self.values.popleft()
+            self.total -= old
+            self.total_sq -= old * old
+    def threshold(self, sigma):
+        """均值 + sigma 倍标准差"""
+        n = len(self.values)
+        mean = self.total / n
+        variance = max(self.total_sq / n - mean * mean, 0.0)
+        return mean + sigma * variance ** 0.5
+    def __len__(self):
+        return len(self.values)
+
+class CommAnomalyDetector:
+    """通信日志异常检测: 逐帧输入, 返回新发现的异常, 全部异常累积在 findings 中
+    ENQ(05) 超时未闭合、未闭合就重发 ENQ、NAK(15)/重发过于密集、0x63 失败报文"""
+    def __init__(self, enq_timeout_ms=ENQ_TIMEOUT_MS, storm_window_ms=STORM_WINDOW_MS,
+                 storm_threshold=STORM_THRESHOLD):
+        self.enq_timeout_ms = enq_timeout_ms
+        self.deadlines = DeadlineQueue()
+        self.open_enq = {}  # 发起方向 -> 未闭合 ENQ 的 token
+        self.storms = {direction: BurstWindow(storm_window_ms, storm_threshold) for direction in ('Snd', 'Rcv')}
+        self.findings = []
+    def feed(self, frame):
+        now = frame.ms
+        new = [self._enq_finding(token, item, '超时未闭合') for token, item in self.deadlines.expire(now)]
+        direction, data = frame.direction, frame.data
+        if data == '05':
+            token = self.open_enq.pop(direction, None)
+            if token is not None:
+                # 上一个 ENQ 尚未闭合又发 ENQ, 即重发
+                item = self.deadlines.resolve(token)
+                if item is not None:
+                    new.append(self._enq_finding(token, item, '未闭合即重发'))
+                self._count_retry(direction, now, new)
+            self.open_enq[direction] = self.deadlines.add(now + self.enq_timeout_ms, (now, direction))
+        elif data == '06':
+            # 对方回 06 闭合本方发起的序列, 与 SequenceAssembler 一致
+            opener = 'Snd' if direction == 'Rcv' else 'Rcv'
+            token = self.open_enq.pop(opener, None)
+            if token is not None:
+                self.deadlines.resolve(token)
+        elif data == '15':
+            # NAK 计入被拒绝一方的重试计数
+            self._count_retry('Snd' if direction == 'Rcv' else 'Rcv', now, new)
+        elif len(data) > 2:
+            try:
+                payload = bytes.fromhex(data)
+            except ValueError:
+                payload = b''
+            if len(payload) >= 2 and payload[1] == 0x63:
+                new.append(finding(format_epoch_ms(now), FAILURE_FRAME, direction, decode_payload(payload)))
+        self.findings.extend(new)
+        return new
+    def finish(self):
+        """日志读完时仍未闭合的 ENQ"""
+        new = [self._enq_finding(token, item, '日志结束时仍未闭合') for token, item in self.deadlines.drain()]
+        self.findings.extend(new)
+        return new
+    def _enq_finding(self, token, item, reason):
+        start_ms, direction = item
+        if self.open_enq.get(direction) == token:
+            del self.open_enq[direction]
+        return finding(format_epoch_ms(start_ms), ENQ_TIMEOUT, direction, reason)
+    def _count_retry(self, direction, now, new):
+        storm = self.storms[direction]
+        if storm.add(now):
+            new.append(finding(format_epoch_ms(now), RETRY_STORM, direction,
+                               f'{storm.window}ms 内 NAK/重发 {len(storm.times)} 次'))
+
+class ControlAnomalyDetector:
+    """控制日志异常检测: SHM_Updated 超时未等到 Finish、耗时超出该指令的滚动基线
+    每行在交给 ActionMatcher 之前调用 feed, 配对出动作后调用 complete"""
+    def __init__(self, action_timeout_ms=ACTION_TIMEOUT_MS, baseline_window=BASELINE_WINDOW,
+                 min_samples=BASELINE_MIN_SAMPLES, sigma=BASELINE_SIGMA):
+        self.action_timeout = timedelta(milliseconds=action_timeout_ms)
+        self.baseline_window = baseline_window
+        self.min_samples = min_samples
+        self.sigma = sigma
+        self.deadlines = DeadlineQueue()
+        self.open_starts = {}  # (cmd_id, 开始时间) -> token
+        self.baselines = {}
+        self.findings = []
+    def feed(self, parsed, matcher=None):
+        """先处理到期的开始事件; 传入 matcher 时把超时的开始从中移除, 之后的 Finish 不会与之误配"""
+        now = parsed['timestamp']
+        new = []
+        for _, key in self.deadlines.expire(now):
+            del self.open_starts[key]
+            if matcher is not None:
+                matcher.discard(*key)
+            new.append(self._timeout_finding(key, '超时未完成'))
+        if 'SHM_Updated' in parsed['action_stat']:
+            key = (parsed['cmd_id'], now)
+            # 同一指令同一时刻的重复开始只记一次, 与 ActionMatcher 的覆盖行为一致
+            if key not in self.open_starts:
+                self.open_starts[key] = self.deadlines.add(now + self.action_timeout, key)
+        self.findings.extend(new)
+        return new
+    def complete(self, action):
+        """动作完成: 解除超时并与该指令的耗时基线比较"""
+        token = self.open_starts.pop((action['cmd_id'], action['start_time']), None)
+        if token is not None:
+            self.deadlines.resolve(token)
+        cmd_id = action['cmd_id']
+        duration = action['duration']
+        baseline = self.baselines.get(cmd_id)
+        if baseline is None:
+            baseline = self.baselines[cmd_id] = RollingBaseline(self.baseline_window)
+        new = []
+        if len(baseline) >= self.min_samples:
+            limit = baseline.threshold(self.sigma)
+            if duration > limit:
+                new.append(finding(format_clock(action['start_time']), LATENCY_OUTLIER,
+                                   ControlLog.motion_dict.get(cmd_id, cmd_id),
+                                   f'耗时 {duration:.3f}s, 基线上限 {limit:.3f}s'))
+        baseline.add(duration)
+        self.findings.extend(new)
+        return new
+    def finish(self):
+        """日志读完时仍未完成的动作"""
+        new = [self._timeout_finding(key, '日志结束时仍未完成') for _, key in self.deadlines.drain()]
+        self.open_starts.clear()
+        self.findings.extend(new)
+        return new
+    def _timeout_finding(self, key, reason):
+        cmd_id, start_time = key
+        return finding(format_clock(start_time), ACTION_TIMEOUT,
+                       ControlLog.motion_dict.get(cmd_id, cmd_id), reason)
+
+def iter_comm_anomalies(log_path, detector=None):
+    """按日志顺序逐个产出通信日志中的异常"""
+    detector = detector or CommAnomalyDetector()
+    for frame in LogAnalyzer(log_path).iter_parsed():
+        yield from detector.feed(frame)
+    yield from detector.finish()
+
+def iter_control_anomalies(log_path, detector=None):
+    """按日志顺序逐个产出控制日志中的异常"""
+    detector = detector or ControlAnomalyDetector()
+    matcher = ControlLog.ActionMatcher()
+    for parsed in ControlLog.iter_parsed_lines(ControlLog.iter_lines(log_path)):
+        yield from detector.feed(parsed, matcher)
+        action = matcher.feed(parsed)
+        if action:
+            yield from detector.complete(action)
+    yield from detector.finish()
+
+def main():
+    parser = argparse.ArgumentParser(description='日志异常检测, 每个异常输出一行 JSON')
+    parser.add_argument('kind', choices=['comm', 'control'], help='日志类型')
+    parser.add_argument('log_path', help='日志文件')
+    args = parser.parse_args()
+    anomalies = iter_comm_anomalies(args.log_path) if args.kind == 'comm' else iter_control_anomalies(args.log_path)
+    for item in anomalies:
+        print(json.dumps(item, ensure_ascii=False), flush=True)
+
+if __name__ == "__main__":
+    main()
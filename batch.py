@@ -0,0 +1,137 @@
+import os
+import glob
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from LogFiles import LogAnalyzer
+import ControlLog
+import resultstore
+from latency import CommandLatencyStats
+from parsecache import ParseCache
+
+LOG_PATTERNS = ('*.log', '*.txt', '*.gz', '*.xz', '*.bz2', '*.zst')
+
+def expand_inputs(inputs):
+    """展开文件、目录和通配符, 去重后按文件大小从大到小排列"""
+    paths = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            for pattern in LOG_PATTERNS:
+                paths.update(glob.glob(os.path.join(item, pattern)))
+        else:
+            paths.update(p for p in glob.glob(item) if os.path.isfile(p))
+    # 大文件先调度, 避免最后剩一个大文件单独拖尾
+    return sorted(paths, key=lambda p: (-os.path.getsize(p), p))
+
+def file_day(path, actions):
+    """控制日志没有日期, 首日由文件修改日期减去跨日天数得出"""
+    return ControlLog.log_first_day(path, actions)
+
+def analyze_comm_file(path, store_dir=None, cache_dir=None):
+    """子进程任务: 分析一个通信日志, 返回报表行和序列计数"""
+    analyzer = LogAnalyzer(path)
+    cache = ParseCache(cache_dir) if cache_dir else None
+    report_rows = list(analyzer.iter_report_rows(cache=cache))
+    if store_dir:
+        resultstore.save_sequences(report_rows, store_dir, os.path.basename(path))
+    return report_rows, analyzer.sequence_counts
+
+def analyze_control_file(path, store_dir=None, cache_dir=None):
+    """子进程任务: 分析一个控制日志, 返回动作列表和耗时统计"""
+    cache = ParseCache(cache_dir) if cache_dir else None
+    actions, stats = ControlLog.analyze_actions(path, cache)
+    if store_dir:
+        day = file_day(path, actions)
+        resultstore.save_actions(actions, store_dir, os.path.basename(path), day)
+        resultstore.save_latency(stats, store_dir, os.path.basename(path), day)
+    return actions, stats
+
+TASKS = {
+    'comm': analyze_comm_file,
+    'control': analyze_control_file,
+}
+
+def run_task(kind, path, store_dir=None, cache_dir=None):
+    """在子进程中执行分析任务并计时"""
+    start = time.perf_counter()
+    result = TASKS[kind](path, store_dir, cache_dir)
+    return result, time.perf_counter() - start
+
+def run_batch(kind, paths, workers=None, store_dir=None, cache_dir=None):
+    """多进程逐文件分析, 打印每个文件的进度和吞吐量, 返回 {路径: 结果}"""
+    total_bytes = sum(os.path.getsize(p) for p in paths)
+    results = {}
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # 按传入顺序(大文件在前)提交
+        futures = {executor.submit(run_task, kind, path, store_dir, cache_dir): path for path in paths}
+        done_bytes = 0
+        for future in as_completed(futures):
+            path = futures[future]
+            results[path], elapsed = future.result()
+            size = os.path.getsize(path)
+            done_bytes += size
+            print(f"[{len(results)}/{len(paths)}] {os.path.basename(path)}: "
+                  f"{size / 1024 / 1024:.1f} MB, {elapsed:.1f}s, {size / 1024 / 1024 / max(elapsed, 1e-6):.1f} MB/s | "
+                  f"总进度 {done_bytes / total_bytes:.0%}, "
+                  f"{done_bytes / 1024 / 1024 / (time.perf_counter() - start):.1f} MB/s")
+    return results
+
+def merge_comm_results(results):
+    """合并各文件的报表行和序列计数"""
+    report_rows = []
+    sequence_counts = {'send': 0, 'receive': 0}
+    for path in sorted(results):
+        rows, counts = results[path]
+        report_rows.extend(rows)
+        sequence_counts['send'] += counts['send']
+        sequence_counts['receive'] += counts['receive']
+    return report_rows, sequence_counts
+
+def merge_control_results(results):
+    """合并各文件的动作和耗时统计, 动作按 (文件日期, 开始时间) 排序"""
+    keyed_actions = []
+    stats = CommandLatencyStats()
+    for path in sorted(results):
+        actions, file_stats = results[path]
+        day = file_day(path, actions)
+        keyed_actions.extend(((day, action['start_time']), action) for action in actions)
+        stats.merge(file_stats)
+    keyed_actions.sort(key=lambda item: item[0])
+    return [action for _, action in keyed_actions], stats
+
+def main():
+    parser = argparse.ArgumentParser(description='多文件批量分析')
+    parser.add_argument('kind', choices=list(TASKS), help='日志类型')
+    parser.add_argument('inputs', nargs='+', help='日志文件、目录或通配符')
+    parser.add_argument('--workers', type=int, default=None, help='进程数, 默认为CPU核数')
+    parser.add_argument('--store', help='结果库目录, 每个文件的结果写入对应分区')
+    parser.add_argument('--excel', help='汇总Excel报告输出路径')
+    parser.add_argument('--cache', help='解析缓存目录, 未变化的文件直接读取缓存')
+    args = parser.parse_args()
+
+    paths = expand_inputs(args.inputs)
+    if not paths:
+        parser.error('没有找到日志文件')
+    print(f"共 {len(paths)} 个文件, {sum(os.path.getsize(p) for p in paths) / 1024 / 1024:.1f} MB")
+    start = time.perf_counter()
+    results = run_batch(args.kind, paths, args.workers, args.store, args.cache)
+
+    if args.kind == 'comm':
+        report_rows, sequence_counts = merge_comm_results(results)
+        print(f"共 {sequence_counts['send'] + sequence_counts['receive']} 个通信序列")
+        if args.excel:
+            analyzer = LogAnalyzer(None)
+            analyzer.sequence_counts = sequence_counts
+            analyzer.generate_excel_report(report_rows, args.excel)
+    else:
+        actions, stats = merge_control_results(results)
+        print(f"共 {len(actions)} 个动作")
+        if args.excel:
+            ControlLog.create_excel_report(actions, args.excel, stats)
+            print(f"Excel报告已生成: {args.excel}")
+    print(f"总耗时 {time.perf_counter() - start:.1f}s")
+
+if __name__ == "__main__":
+    main()
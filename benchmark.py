@@ -0,0 +1,420 @@
+import os
+import re
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+import gzip
+import shutil
+import json
+import platform
+import subprocess
+from datetime import datetime
+from itertools import islice, zip_longest
+
+import LogFiles
+import ControlLog
+import logio
+import loggen
+from latency import CommandLatencyStats
+
+# 改造前的 parse_log_line, 作为对照基准和结果校验的参考实现
+def legacy_parse_log_line(line):
+    pattern = r'Debug:\s+(\d{4}-\d{2}-\d{2}\s+\d{2}:\d{2}:\d{2}\.(\d{3}|\d{1}|\d{2})):\s+(Snd|Rcv):\s+(.+)'
+    match = re.match(pattern, line)
+    if match:
+        timestamp_str = match.group(1)
+        time_parts = timestamp_str.split('.')
+        ms_part = time_parts[1].zfill(3) if len(time_parts) > 1 else '000'
+        time_without_date = timestamp_str.split(' ')[1].split('.')[0]
+        full_time_str = f"{time_without_date}.{ms_part}"
+        timestamp = datetime.strptime(full_time_str, '%H:%M:%S.%f').time()
+        direction = match.group(3)
+        data = match.group(4).strip()
+        return {
+            'timestamp': timestamp,
+            'direction': direction,
+            'data': data
+        }
+    return None
+
+def generate_comm_lines(count, seed=0):
+    """生成通信日志行, 见 loggen.iter_comm_lines"""
+    return loggen.generate_lines('comm', count, seed)
+
+def bench_parse_log_line(count=200000):
+    """对比 parse_log_line 改造前后的吞吐量, 并校验输出完全一致"""
+    lines = generate_comm_lines(count)
+    analyzer = LogFiles.LogAnalyzer('')
+
+    start = time.perf_counter()
+    expected = [legacy_parse_log_line(line) for line in lines]
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = [analyzer.parse_log_line(line) for line in lines]
+    new_time = time.perf_counter() - start
+
+    actual = [frame and {'timestamp': frame.timestamp, 'direction': frame.direction, 'data': frame.data}
+              for frame in actual]
+    if actual != expected:
+        raise AssertionError('新解析器输出与原实现不一致')
+    print(f'parse_log_line: {count} 行')
+    print(f'  原实现: {count / legacy_time:,.0f} 行/秒')
+    print(f'  新实现: {count / new_time:,.0f} 行/秒 (加速 {legacy_time / new_time:.2f}x)')
+
+def write_comm_log(path, size_mb, seed=0):
+    """写出约 size_mb 大小的通信日志, 重复同一批生成行以加快造数"""
+    block = ('\n'.join(generate_comm_lines(50000, seed)) + '\n').encode()
+    target = size_mb * 1024 * 1024
+    with open(path, 'wb') as f:
+        written = 0
+        while written < target:
+            f.write(block)
+            written += len(block)
+
+def bench_parallel(size_mb=2048):
+    """多进程分块解析相对串行解析的加速比"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'comm.log')
+        write_comm_log(path, size_mb)
+        size = os.path.getsize(path)
+        print(f'多进程解析: {size / 1024 / 1024:.0f} MB')
+
+        analyzer = LogFiles.LogAnalyzer(path)
+        start = time.perf_counter()
+        expected = [(t, len(s), s[0], s[-1]) for t, s in analyzer.iter_sequences()]
+        serial_time = time.perf_counter() - start
+        print(f'  串行: {serial_time:.2f}s ({size / serial_time / 1024 / 1024:.1f} MB/s)')
+
+        workers = 2
+        while workers <= (os.cpu_count() or 1):
+            start = time.perf_counter()
+            actual = [(t, len(s), s[0], s[-1]) for t, s in analyzer.iter_sequences(workers)]
+            elapsed = time.perf_counter() - start
+            if actual != expected:
+                raise AssertionError(f'{workers} 进程结果与串行不一致')
+            print(f'  {workers:>2} 进程: {elapsed:.2f}s (加速 {serial_time / elapsed:.2f}x)')
+            workers *= 2
+
+def bench_frame_memory(count=200000):
+    """每百万帧的内存占用 (按 count 帧实测后折算): 原字典格式与 Frame 对比"""
+    lines = [line for line in generate_comm_lines(count + count // 4) if line.startswith('Debug:')][:count]
+    results = {}
+    for name, parse in (('字典', legacy_parse_log_line), ('Frame', LogFiles.LogAnalyzer('').parse_log_line)):
+        tracemalloc.start()
+        frames = [parse(line) for line in lines]
+        used = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del frames
+        results[name] = used * 1000000 / len(lines)
+    print(f'每百万帧内存占用 ({len(lines)} 帧):')
+    for name, used in results.items():
+        print(f'  {name}: {used / 1024 / 1024:.1f} MB')
+
+# 改造前 parse_specific_actions 的配对逻辑 (去掉了逐条 print), 作为对照基准
+def legacy_match_actions(parsed_lines):
+    action_starts = {}
+    completed_actions = []
+    for parsed in parsed_lines:
+        cmd_id = parsed['cmd_id']
+        action_stat = parsed['action_stat']
+        timestamp = parsed['timestamp']
+        if 'SHM_Updated' in action_stat:
+            key = f"{cmd_id}_{timestamp.strftime('%H:%M:%S.%f')}"
+            action_starts[key] = {
+                'start_time': timestamp,
+                'cmd_id': cmd_id,
+                'action_stat': action_stat
+            }
+        elif 'Finish' in action_stat:
+            matching_key = None
+            for key in list(action_starts.keys()):
+                if key.startswith(f"{cmd_id}_"):
+                    matching_key = key
+                    break
+            if matching_key:
+                start_info = action_starts[matching_key]
+                completed_actions.append({
+                    'action_stat': start_info['action_stat'],
+                    'cmd_id': cmd_id,
+                    'start_time': start_info['start_time'],
+                    'end_time': timestamp,
+                    'duration': (timestamp - start_info['start_time']).total_seconds()
+                })
+                del action_starts[matching_key]
+    return sorted(completed_actions, key=lambda x: x['start_time'])
+
+def generate_ctrl_lines(count, window=256, seed=0):
+    """生成控制日志行, 见 loggen.iter_ctrl_lines"""
+    return list(islice(loggen.iter_ctrl_lines(window, seed), count))
+
+def bench_action_matching(count=1000000):
+    """开始/结束配对: 原线性扫描与按 cmd_id 队列配对的对比 (只计配对阶段)"""
+    parsed_lines = [parsed for parsed in map(ControlLog.parse_log_line, generate_ctrl_lines(count)) if parsed]
+
+    start = time.perf_counter()
+    expected = legacy_match_actions(parsed_lines)
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    matcher = ControlLog.ActionMatcher()
+    actual = []
+    for parsed in parsed_lines:
+        action = matcher.feed(parsed)
+        if action:
+            actual.append(action)
+    actual.sort(key=lambda x: x['start_time'])
+    new_time = time.perf_counter() - start
+
+    if actual != expected:
+        raise AssertionError('配对结果与原实现不一致')
+    print(f'动作配对: {count} 条指令记录, 完成 {len(actual)} 个动作')
+    print(f'  原实现: {legacy_time:.2f}s')
+    print(f'  新实现: {new_time:.2f}s (加速 {legacy_time / new_time:.1f}x)')
+
+def bench_compressed_input(size_mb=2048):
+    """原始文件与 gzip / zstd 压缩文件的读取和完整分析吞吐量"""
+    try:
+        import zstandard
+    except ImportError:
+        zstandard = None
+    with tempfile.TemporaryDirectory() as tmp:
+        raw_path = os.path.join(tmp, 'comm.log')
+        write_comm_log(raw_path, size_mb)
+        size = os.path.getsize(raw_path)
+        paths = {'raw': raw_path}
+        with open(raw_path, 'rb') as src, gzip.open(raw_path + '.gz', 'wb', compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst, logio.READ_BUFFER_SIZE)
+        paths['gzip'] = raw_path + '.gz'
+        if zstandard is not None:
+            with open(raw_path, 'rb') as src, open(raw_path + '.zst', 'wb') as dst:
+                zstandard.ZstdCompressor(level=3).copy_stream(src, dst)
+            paths['zstd'] = raw_path + '.zst'
+        print(f'压缩日志读取: 解压后 {size / 1024 / 1024:.0f} MB' + ('' if zstandard else ' (未安装 zstandard, 跳过 zstd)'))
+        for name, path in paths.items():
+            start = time.perf_counter()
+            with logio.open_text(path) as f:
+                for _ in f:
+                    pass
+            read_time = time.perf_counter() - start
+            start = time.perf_counter()
+            sequence_count = sum(1 for _ in LogFiles.LogAnalyzer(path).iter_sequences())
+            analyze_time = time.perf_counter() - start
+            print(f'  {name:>4}: 文件 {os.path.getsize(path) / 1024 / 1024:.0f} MB, '
+                  f'读取 {size / 1024 / 1024 / read_time:.0f} MB/s, '
+                  f'完整分析 {size / 1024 / 1024 / analyze_time:.1f} MB/s ({sequence_count} 个序列)')
+
+def bench_binary_parse(size_mb=2048):
+    """整块 bytes 正则解析与逐行文本解析的吞吐量, 并逐帧核对两者结果一致"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'comm.log')
+        write_comm_log(path, size_mb)
+        size = os.path.getsize(path)
+        print(f'二进制解析: {size / 1024 / 1024:.0f} MB')
+        timings = {}
+        for name, binary in (('文本逐行', False), ('bytes 整块', True)):
+            start = time.perf_counter()
+            count = sum(1 for _ in LogFiles.LogAnalyzer(path, binary=binary).iter_parsed())
+            timings[name] = time.perf_counter() - start
+            print(f'  {name}: {timings[name]:.2f}s ({size / timings[name] / 1024 / 1024:.1f} MB/s, {count} 帧)')
+        text_frames = LogFiles.LogAnalyzer(path, binary=False).iter_parsed()
+        binary_frames = LogFiles.LogAnalyzer(path, binary=True).iter_parsed()
+        for expected, actual in zip_longest(text_frames, binary_frames):
+            if expected != actual:
+                raise AssertionError(f'二进制解析结果与文本解析不一致: {expected!r} / {actual!r}')
+        print(f"  加速 {timings['文本逐行'] / timings['bytes 整块']:.2f}x, 逐帧结果一致")
+
+def generate_report_rows(count, seed=0):
+    """生成通信序列报表行, 格式与 LogAnalyzer.iter_report_rows() 的输出相同"""
+    rng = random.Random(seed)
+    actions = ['取片 站点1 层数2 手臂1', '放片 站点3 层数1 手臂2', 'Macro Finish', '设置速度:50',
+               '执行0x21失败 类型:0x01, 代码:0x05', 'IO事件触发 新:0x01, 旧:0x00', '读取状态']
+    ms = LogFiles.date_to_epoch_ms('2024-09-24') + 8 * 3600000
+    rows = []
+    for _ in range(count):
+        ms += rng.randint(20, 200)
+        end_ms = ms + rng.randint(10, 120)
+        rows.append(('send' if rng.random() < 0.5 else 'receive', {
+            'start_ms': ms,
+            'end_ms': end_ms,
+            '日期': '2024-09-24',
+            '开始时间': LogFiles.ms_to_time(ms),
+            '结束时间': LogFiles.ms_to_time(end_ms),
+            '持续时间(ms)': float(end_ms - ms),
+            '动作': rng.choice(actions)
+        }))
+    return rows
+
+def bench_excel_export(count=1000000):
+    """Excel 报告写出速度: 原 DataFrame.to_excel 方式(取十分之一行数)与批量写出对比"""
+    report_rows = generate_report_rows(count)
+    columns = ['开始时间', '结束时间', '持续时间(ms)', '动作']
+    with tempfile.TemporaryDirectory() as tmp:
+        import pandas as pd
+        sample = [row for _, row in report_rows[:count // 10]]
+        start = time.perf_counter()
+        with pd.ExcelWriter(os.path.join(tmp, 'legacy.xlsx'), engine='xlsxwriter') as writer:
+            pd.DataFrame(sample)[columns].to_excel(writer, sheet_name='通信序列', index=False)
+        legacy_rate = len(sample) / (time.perf_counter() - start)
+
+        analyzer = LogFiles.LogAnalyzer(None)
+        analyzer.sequence_counts = {'send': 0, 'receive': 0}
+        path = os.path.join(tmp, 'bulk.xlsx')
+        start = time.perf_counter()
+        analyzer.generate_excel_report(report_rows, path)
+        bulk_rate = count / (time.perf_counter() - start)
+        size = os.path.getsize(path)
+    print(f'Excel 报告写出: {count} 行, 文件 {size / 1024 / 1024:.0f} MB')
+    print(f'  原实现 (to_excel, {len(sample)} 行): {legacy_rate:,.0f} 行/秒')
+    print(f'  批量写出 (含排序和格式化): {bulk_rate:,.0f} 行/秒 (加速 {bulk_rate / legacy_rate:.2f}x)')
+
+class StageTimer:
+    """按阶段计时, 结果为 {阶段: {'seconds', 'items', 'items_per_sec'[, 'mb_per_sec']}}"""
+    def __init__(self):
+        self.results = {}
+    def run(self, stage, func, count=len, size=None):
+        """执行 func() 并计时; count(结果) 为处理条数, size 为处理字节数"""
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        items = count(result)
+        entry = {'seconds': round(elapsed, 4), 'items': items,
+                 'items_per_sec': round(items / max(elapsed, 1e-9), 1)}
+        if size is not None:
+            entry['mb_per_sec'] = round(size / 1024 / 1024 / max(elapsed, 1e-9), 2)
+        self.results[stage] = entry
+        print(f'  {stage:<12} {elapsed:8.3f}s {items:>10} 条 {entry["items_per_sec"]:>14,.0f} 条/秒'
+              + (f' {entry["mb_per_sec"]:8.1f} MB/s' if size is not None else ''))
+        return result
+
+def read_lines(path):
+    with logio.open_text(path) as f:
+        return [line.strip() for line in f]
+
+def comm_stages(path, tmp):
+    """通信日志: 读取 → 解析 → 序列重组 → 主报文解码 → 排序汇总 → 导出"""
+    size = os.path.getsize(path)
+    timer = StageTimer()
+    analyzer = LogFiles.LogAnalyzer(path)
+    lines = timer.run('read', lambda: read_lines(path), size=size)
+    frames = timer.run('parse', lambda: [f for f in map(analyzer.parse_log_line, lines) if f], size=size)
+    def reassemble():
+        assembler = LogFiles.SequenceAssembler()
+        return [completed for completed in map(assembler.feed, frames) if completed]
+    sequences = timer.run('reassemble', reassemble)
+    # 解码阶段从空缓存开始, 计入缓存预热
+    LogFiles.decode_payload.cache_clear()
+    def decode():
+        rows = []
+        counts = {'send': 0, 'receive': 0}
+        for seq_type, sequence in sequences:
+            counts[seq_type] += 1
+            row_data = analyzer.sequence_to_excel_row(sequence, seq_type, counts[seq_type])
+            if row_data:
+                rows.append((seq_type, row_data))
+        analyzer.sequence_counts = counts
+        return rows
+    report_rows = timer.run('decode', decode)
+    timer.run('aggregate', lambda: LogFiles.sequence_frame([row for _, row in report_rows]))
+    timer.run('export', lambda: analyzer.generate_excel_report(report_rows, os.path.join(tmp, 'comm.xlsx'))
+              or report_rows)
+    return timer.results
+
+def control_stages(path, tmp):
+    """控制日志: 读取 → 解析(含跨日检测) → 开始/结束配对 → 排序和耗时统计 → 导出"""
+    size = os.path.getsize(path)
+    timer = StageTimer()
+    lines = timer.run('read', lambda: read_lines(path), size=size)
+    parsed_lines = timer.run('parse', lambda: list(ControlLog.iter_parsed_lines(lines)), size=size)
+    def match():
+        matcher = ControlLog.ActionMatcher()
+        return [action for action in map(matcher.feed, parsed_lines) if action]
+    actions = timer.run('match', match)
+    def aggregate():
+        stats = CommandLatencyStats()
+        return ControlLog.sort_actions(list(stats.observe(actions))), stats
+    actions, stats = timer.run('aggregate', aggregate, count=lambda result: len(result[0]))
+    timer.run('export', lambda: ControlLog.create_excel_report(actions, os.path.join(tmp, 'control.xlsx'), stats)
+              or actions)
+    return timer.results
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare_results(results, baseline):
+    """与基线结果对比各阶段耗时, 比值 > 1 表示变快"""
+    print(f"与基线对比 (基线提交 {baseline['meta'].get('commit')}):")
+    for kind in ('comm', 'control'):
+        for stage, entry in results.get(kind, {}).items():
+            old = baseline.get(kind, {}).get(stage)
+            if old:
+                print(f"  {kind:<8} {stage:<12} {old['seconds']:8.3f}s -> {entry['seconds']:8.3f}s "
+                      f"({old['seconds'] / max(entry['seconds'], 1e-9):.2f}x)")
+
+def bench_stages(lines=1000000, output=None, baseline=None, seed=0):
+    """两种日志各生成 lines 行造数, 分阶段计时; 结果写入 JSON, 可与之前提交的结果对比"""
+    results = {'meta': {
+        'commit': git_commit(),
+        'time': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'lines': lines,
+        'seed': seed
+    }}
+    with tempfile.TemporaryDirectory() as tmp:
+        for kind, run_stages in (('comm', comm_stages), ('control', control_stages)):
+            path = os.path.join(tmp, f'{kind}.log')
+            _, size = loggen.write_log(kind, path, lines=lines, seed=seed)
+            print(f'{kind}: {lines} 行, {size / 1024 / 1024:.1f} MB')
+            results[kind] = run_stages(path, tmp)
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f'结果已写入: {output}')
+    if baseline:
+        with open(baseline, 'r', encoding='utf-8') as f:
+            compare_results(results, json.load(f))
+    return results
+
+BENCHMARKS = {
+    'parse': bench_parse_log_line,
+    'parallel': bench_parallel,
+    'memory': bench_frame_memory,
+    'match': bench_action_matching,
+    'compressed': bench_compressed_input,
+    'binary': bench_binary_parse,
+    'excel': bench_excel_export,
+    'stages': bench_stages,
+}
+
+# 按大小造数的测试项
+SIZED_BENCHMARKS = {'parallel', 'compressed', 'binary'}
+
+def main():
+    parser = argparse.ArgumentParser(description='LogAnalyzer 性能测试')
+    parser.add_argument('names', nargs='*', help=f"要运行的测试项 {'/'.join(BENCHMARKS)}, 默认全部")
+    parser.add_argument('--size-mb', type=int, default=2048, help='造数日志大小(MB)')
+    parser.add_argument('--lines', type=int, default=1000000, help='stages: 每种日志的造数行数')
+    parser.add_argument('--seed', type=int, default=0, help='stages: 造数随机种子')
+    parser.add_argument('--output', help='stages: 结果 JSON 输出路径')
+    parser.add_argument('--baseline', help='stages: 与之前保存的结果 JSON 对比')
+    args = parser.parse_args()
+    unknown = set(args.names) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"未知的测试项: {', '.join(sorted(unknown))}")
+    for name in args.names or list(BENCHMARKS):
+        if name in SIZED_BENCHMARKS:
+            BENCHMARKS[name](args.size_mb)
+        elif name == 'stages':
+            bench_stages(args.lines, args.output, args.baseline, args.seed)
+        else:
+            BENCHMARKS[name]()
+
+if __name__ == "__main__":
+    main()
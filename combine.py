@@ -1,102 +1,253 @@
 import re
-from datetime import datetime
-import pandas as pd
+import heapq
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
 import os
-class CombinedLogAnalyzer:
-    def __init__(self, comm_log_path, control_log_path):
+import argparse
+from LogFiles import LogAnalyzer, extract_main_data, date_to_epoch_ms, sequence_frame, MS_PER_DAY
+from excelwriter import BulkWorkbook, excel_clock
+import ControlLog
+import logformats
+import logio
+import profiler as stage_profiler
+
+# 合并流中的事件类型
+SEQUENCE_EVENT = 0
+ACTION_EVENT = 1
+
+def clock_to_ms(timestamp, base_ms=0):
+    """ControlLog 的时间戳换算为毫秒时间戳, 与通信日志的 Frame.ms 对齐
+    控制日志的跨日天数已计入 timestamp, base_ms 为控制日志首日零点的毫秒时间戳"""
+    return base_ms + (timestamp - ControlLog.CLOCK_BASE) // timedelta(milliseconds=1)
+
+class IntervalWindow:
+    """按结束时间排序的已结束区间, 用于查找与新区间重叠的记录; 过旧的区间随时间淘汰"""
+    def __init__(self):
+        self.ends = []
+        self.starts = []
+        self.items = []
+        self.head = 0
+    def add(self, start, end, item):
+        # 两路日志基本按结束时间递增到达, 通常直接追加在末尾
+        index = bisect_right(self.ends, end, self.head)
+        self.ends.insert(index, end)
+        self.starts.insert(index, start)
+        self.items.insert(index, item)
+    def overlapping(self, start, end):
+        """与 [start, end] 有交集的区间"""
+        index = bisect_left(self.ends, start, self.head)
+        return [item for s, item in zip(self.starts[index:], self.items[index:]) if s <= end]
+    def evict_before(self, t):
+        """淘汰结束时间早于 t 的区间"""
+        self.head = bisect_left(self.ends, t, self.head)
+        # 淘汰的部分过半时再整体收缩, 摊还 O(1)
+        if self.head > 1024 and self.head * 2 > len(self.ends):
+            del self.ends[:self.head]
+            del self.starts[:self.head]
+            del self.items[:self.head]
+            self.head = 0
+    def __len__(self):
+        return len(self.ends) - self.head
+
+class CombinedLogAnalyzer(LogAnalyzer):
+    def __init__(self, comm_log_path, control_log_path, max_action_ms=600000, max_sequence_ms=60000,
+                 control_log_date=None, comm_format=None, control_format=None, profiler=None,
+                 comm_detector=None, control_detector=None):
+        super().__init__(comm_log_path, comm_format, profiler)
         self.comm_log_path = comm_log_path
         self.control_log_path = control_log_path
-        self.send_sequences = []    
+        # 两路日志按各自格式的字面量过滤, 同一个混合格式文件可以同时作为两路输入
+        self.control_format = logformats.REGISTRY.resolve(control_format, 'control')
+        # 控制日志首行所在日期 (date), 未指定时取通信日志第一帧的日期
+        self.control_log_date = control_log_date
+        self.send_sequences = []
         self.receive_sequences = []
         self.control_records = []  # 用于存储控制日志的记录
-        
-    # ... 保持原有的 parse_log_line, parse_main_data 等方法 ...
-    def analyze_control_log(self):
-        """分析控制日志"""
-        with open(self.control_log_path, 'r') as f:
-            # 这里添加控制日志的分析逻辑
-            # 将结果存储在 self.control_records 中
-            pass
-    def generate_excel_report(self):
-        # 准备通信序列数据
-        all_sequences = []
-        for idx, sequence in enumerate(self.send_sequences, 1):
-            row_data = self.sequence_to_excel_row(sequence, "发送", idx)
-            if row_data:
-                row_data['类型'] = '发送'
-                all_sequences.append(row_data)
-        
-        for idx, sequence in enumerate(self.receive_sequences, 1):
-            row_data = self.sequence_to_excel_row(sequence, "接收", idx)
+        self.sequence_rows = []    # 通信序列报表行, 按完成顺序
+        self.sequence_counts = {'send': 0, 'receive': 0}
+        # 关联窗口: 动作/通信序列的最长持续时间, 超过窗口的旧区间不再参与关联
+        self.max_action_ms = max_action_ms
+        self.max_sequence_ms = max_sequence_ms
+        # 通信日志第一帧的毫秒时间戳, 读取通信日志时顺带记下; first_frame_known 为 False 时尚未读取
+        self.first_frame_ms = None
+        self.first_frame_known = False
+        # 异常检测, 见 anomaly; 两路的结果在 analyze() 后都汇总到 self.anomalies
+        self.comm_detector = comm_detector
+        self.control_detector = control_detector
+
+    def sequence_to_excel_row(self, sequence, seq_type, idx):
+        """在通信日志报表行的基础上补充原始报文和完整通信过程"""
+        row_data = super().sequence_to_excel_row(sequence, seq_type, idx)
+        if row_data:
+            row_data['序列号'] = idx
+            row_data['类型'] = seq_type
+            row_data['主报文'] = row_data['动作']
+            row_data['原始报文'] = ' '.join(extract_main_data(sequence))
+            row_data['完整通信过程'] = '\n'.join(
+                f"{msg.timestamp.strftime('%H:%M:%S.%f')[:-3]} {msg.direction}: {msg.data}"
+                for msg in sequence)
+        return row_data
+    def iter_sequence_events(self):
+        """通信序列事件流 (结束时间, 类型, 开始时间, 报表行), 按完成顺序"""
+        for seq_type, sequence in self.iter_sequences(detector=self.comm_detector):
+            self.sequence_counts[seq_type] += 1
+            row_data = self.sequence_to_excel_row(
+                sequence, "发送" if seq_type == 'send' else "接收", self.sequence_counts[seq_type])
             if row_data:
-                row_data['类型'] = '接收'
-                all_sequences.append(row_data)
-        
-        # 按开始时间排序
-        all_sequences.sort(key=lambda x: x['开始时间'])
-        
-        # 创建输出目录
-        output_dir = 'analysis_results'
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-        
-        # 生成文件名
-        current_time = datetime.now().strftime('%Y%m%d_%H%M%S')
-        excel_path = f'{output_dir}/combined_analysis_{current_time}.xlsx'
-        
-        # 创建Excel写入器
-        with pd.ExcelWriter(excel_path, engine='xlsxwriter') as writer:
+                yield sequence[-1].ms, SEQUENCE_EVENT, sequence[0].ms, row_data
+    def iter_parsed(self):
+        """记下第一帧的时间, 控制日志首日默认取其日期, 不必为此再读一遍通信日志"""
+        frames = super().iter_parsed()
+        first = next(frames, None)
+        self.first_frame_ms = None if first is None else first.ms
+        self.first_frame_known = True
+        if first is not None:
+            yield first
+            yield from frames
+    def _read_first_frame_ms(self):
+        """只读到通信日志第一条匹配的行, 不经过分阶段计时"""
+        with logio.open_text(self.comm_log_path) as f:
+            for line in f:
+                parsed = self.parse_log_line(line.strip())
+                if parsed:
+                    return parsed.ms
+        return None
+    def control_base_ms(self):
+        """控制日志首日零点的毫秒时间戳, 未指定 control_log_date 时取通信日志第一帧的日期"""
+        if self.control_log_date is not None:
+            return date_to_epoch_ms(self.control_log_date.isoformat())
+        if not self.first_frame_known:
+            # 单独分析控制日志时通信日志还未读取
+            self.first_frame_ms = self._read_first_frame_ms()
+            self.first_frame_known = True
+        if self.first_frame_ms is None:
+            return 0
+        return self.first_frame_ms - self.first_frame_ms % MS_PER_DAY
+    def iter_action_events(self):
+        """控制动作事件流 (结束时间, 类型, 开始时间, 记录), 按完成顺序"""
+        base_ms = self.control_base_ms()
+        for action in ControlLog.iter_specific_actions(self.control_log_path, self.control_detector,
+                                                       self.control_format, self.profiler):
+            record = {
+                '开始时间': action['start_time'].strftime('%H:%M:%S.%f')[:-3],
+                '结束时间': action['end_time'].strftime('%H:%M:%S.%f')[:-3],
+                '指令ID': ControlLog.motion_dict.get(action['cmd_id'], action['cmd_id']),
+                '耗时(秒)': round(action['duration'], 3),
+                '关联通信数': 0,
+                '关联动作': []
+            }
+            yield (clock_to_ms(action['end_time'], base_ms), ACTION_EVENT,
+                   clock_to_ms(action['start_time'], base_ms), record)
+    def analyze_control_log(self):
+        """分析控制日志, 不做关联"""
+        for _, _, _, record in self.iter_action_events():
+            record['关联动作'] = ''
+            self.control_records.append(record)
+    def analyze(self):
+        """按时间顺序归并两路日志, 把每个控制动作与时间上重叠的通信序列关联"""
+        # 分阶段计时时, 关联阶段的耗时扣除了两路日志各自的读取、解析和配对
+        with self._stage('combined.correlate') as stats:
+            self._correlate()
+            if stats is not None:
+                stats.items += len(self.sequence_rows) + len(self.control_records)
+        if self.control_detector is not None:
+            self.anomalies.extend(self.control_detector.findings)
+    def _correlate(self):
+        sequence_window = IntervalWindow()
+        action_window = IntervalWindow()
+        # merge 按参数顺序先取各流的第一个事件: 通信日志在前, 控制日志开始时第一帧已读出
+        events = heapq.merge(self.iter_sequence_events(), self.iter_action_events(),
+                             key=lambda event: event[0])
+        # 每一对重叠区间在两者中后结束的一方到达时恰好被发现一次
+        for end, kind, start, item in events:
+            if kind == SEQUENCE_EVENT:
+                action_window.evict_before(end - self.max_sequence_ms)
+                for record in action_window.overlapping(start, end):
+                    self._link(record, item)
+                sequence_window.add(start, end, item)
+                self.sequence_rows.append(item)
+            else:
+                sequence_window.evict_before(end - self.max_action_ms)
+                for row_data in sequence_window.overlapping(start, end):
+                    self._link(item, row_data)
+                action_window.add(start, end, item)
+                self.control_records.append(item)
+        for record in self.control_records:
+            record['关联动作'] = '\n'.join(record['关联动作'])
+    def _link(self, record, row_data):
+        record['关联通信数'] += 1
+        record['关联动作'].append(f"{row_data['开始时间'].strftime('%H:%M:%S.%f')[:-3]} {row_data['动作']}")
+    def generate_excel_report(self, report_rows=None, excel_path=None):
+        # 准备通信序列数据: report_rows 为 iter_report_rows() 的流式输出;
+        # 未提供时取 analyze() 的结果, analyze_log 单独运行时由保存的序列生成
+        if report_rows is not None:
+            all_sequences = [row_data for _, row_data in report_rows]
+        else:
+            all_sequences = list(self.sequence_rows)
+        if report_rows is None and not all_sequences:
+            for idx, sequence in enumerate(self.send_sequences, 1):
+                row_data = self.sequence_to_excel_row(sequence, "发送", idx)
+                if row_data:
+                    all_sequences.append(row_data)
+
+            for idx, sequence in enumerate(self.receive_sequences, 1):
+                row_data = self.sequence_to_excel_row(sequence, "接收", idx)
+                if row_data:
+                    all_sequences.append(row_data)
+            send_count = len(self.send_sequences)
+            receive_count = len(self.receive_sequences)
+        else:
+            send_count = self.sequence_counts['send']
+            receive_count = self.sequence_counts['receive']
+
+        if excel_path is None:
+            # 创建输出目录
+            output_dir = 'analysis_results'
+            if not os.path.exists(output_dir):
+                os.makedirs(output_dir)
+
+            # 生成文件名
+            current_time = datetime.now().strftime('%Y%m%d_%H%M%S')
+            excel_path = f'{output_dir}/combined_analysis_{current_time}.xlsx'
+
+        # 批量写出, 超过单表行数上限时自动分表
+        with self._stage('combined.export', len(all_sequences)), BulkWorkbook(excel_path) as book:
             # 通信序列表
             if all_sequences:
-                df_comm = pd.DataFrame(all_sequences)
-                columns = ['序列号', '类型', '开始时间', '结束时间', '持续时间(ms)', 
+                # 按开始时间戳排序
+                df_comm = sequence_frame(all_sequences)
+                df_comm['开始时间'] = excel_clock(df_comm['start_ms'])
+                df_comm['结束时间'] = excel_clock(df_comm['end_ms'])
+                columns = ['序列号', '类型', '开始时间', '结束时间', '持续时间(ms)',
                             '主报文', '原始报文', '完整通信过程']
-                df_comm = df_comm[columns]
-                df_comm.to_excel(writer, sheet_name='通信序列', index=False)
-                
-                # 设置通信序列表格式
-                worksheet = writer.sheets['通信序列']
-                self._format_comm_sheet(worksheet, writer.book)
-                # 控制日志表
+                clock_format = book.clock_format()
+                book.write_table('通信序列', columns, df_comm[columns].itertuples(index=False, name=None),
+                                 column_formats={2: clock_format, 3: clock_format},
+                                 on_sheet=lambda worksheet: self._format_comm_sheet(worksheet, book))
+            # 控制日志表
             if self.control_records:
-                df_control = pd.DataFrame(self.control_records)
-                df_control.to_excel(writer, sheet_name='控制日志', index=False)
-                
-                # 设置控制日志表格式
-                worksheet = writer.sheets['控制日志']
-                self._format_control_sheet(worksheet)
-                # 统计信息表
-            stats_data = {
-                '统计项': ['发送序列总数', '接收序列总数', '总序列数', '控制日志记录数'],
-                '数量': [
-                    len(self.send_sequences),
-                    len(self.receive_sequences),
-                    len(self.send_sequences) + len(self.receive_sequences),
-                    len(self.control_records)
-                ]
-            }
-            df_stats = pd.DataFrame(stats_data)
-            df_stats.to_excel(writer, sheet_name='统计信息', index=False)
-            
-            # 设置统计信息表格式
-            worksheet = writer.sheets['统计信息']
-            worksheet.set_column('A:A', 15)
-            worksheet.set_column('B:B', 10)
+                columns = list(self.control_records[0])
+                book.write_table('控制日志', columns,
+                                 ([record[name] for name in columns] for record in self.control_records),
+                                 column_formats={5: book.add_format({'text_wrap': True})})  # 关联动作
+            # 异常事件表
+            if self.anomalies:
+                columns = list(self.anomalies[0])
+                book.write_table('异常事件', columns,
+                                 ([item[name] for name in columns] for item in self.anomalies))
+            # 统计信息表
+            book.write_table('统计信息', ['统计项', '数量'], [
+                ('发送序列总数', send_count),
+                ('接收序列总数', receive_count),
+                ('总序列数', send_count + receive_count),
+                ('控制日志记录数', len(self.control_records))
+            ])
         print(f"\nExcel报告已生成: {excel_path}")
-    def _format_comm_sheet(self, worksheet, workbook):
-        """设置通信序列表的格式"""
-        worksheet.set_column('A:A', 8)   # 序列号
-        worksheet.set_column('B:B', 8)   # 类型
-        worksheet.set_column('C:D', 20)  # 时间列
-        worksheet.set_column('E:E', 12)  # 持续时间
-        worksheet.set_column('F:F', 40)  # 主报文解析
-        worksheet.set_column('G:G', 30)  # 原始报文
-        worksheet.set_column('H:H', 50)  # 完整通信过程
-        
-        # 添加条件格式
-        format_send = workbook.add_format({'bg_color': '#E6F3FF'})
-        format_receive = workbook.add_format({'bg_color': '#F3FFE6'})
-        
+    def _format_comm_sheet(self, worksheet, book):
+        """通信序列表按类型设置背景色; 列宽由写出时记录的内容长度决定"""
+        format_send = book.add_format({'bg_color': '#E6F3FF'})
+        format_receive = book.add_format({'bg_color': '#F3FFE6'})
+
         worksheet.conditional_format('A2:H1048576', {
             'type': 'formula',
             'criteria': '=$B2="发送"',
@@ -107,17 +258,18 @@ class CombinedLogAnalyzer:
             'criteria': '=$B2="接收"',
             'format': format_receive
         })
-    def _format_control_sheet(self, worksheet):
-        """设置控制日志表的格式"""
-        # 根据控制日志的具体列来设置格式
-        pass
 def main():
+    parser = argparse.ArgumentParser(description='通信日志与控制日志关联分析')
+    stage_profiler.add_arguments(parser)
+    args = parser.parse_args()
+    profiler = stage_profiler.from_args(args)
     analyzer = CombinedLogAnalyzer(
         'LogFiles/comm.log',
-        'LogFiles/control.log'
+        'LogFiles/control.log',
+        profiler=profiler
     )
-    analyzer.analyze_log()  # 分析通信日志
-    analyzer.analyze_control_log()  # 分析控制日志
+    analyzer.analyze()  # 归并分析通信日志和控制日志
     analyzer.generate_excel_report()
+    stage_profiler.finish(profiler, args)
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
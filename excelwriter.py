@@ -0,0 +1,107 @@
+from datetime import datetime, timedelta
+
+# Excel 单表最多 1048576 行, 扣除标题行后为数据行上限
+MAX_DATA_ROWS = 1048575
+MIN_COLUMN_WIDTH = 8
+MAX_COLUMN_WIDTH = 80
+NUMBER_COLUMN_WIDTH = 12
+# 时刻列写为 Excel 时间数值(一天为 1)并设置显示格式; 数值单元格比字符串写出快, 也可直接参与计算
+CLOCK_FORMAT = 'hh:mm:ss.000'
+MS_PER_DAY = 86400000
+# 跨日的结果(如结果库按时间窗口导出)写为含日期的 Excel 日期数值, 自 1899-12-30 起的天数
+DATETIME_FORMAT = 'yyyy-mm-dd hh:mm:ss.000'
+DATETIME_WIDTH = len(DATETIME_FORMAT)
+EXCEL_EPOCH = datetime(1899, 12, 30)
+
+def excel_clock(ms):
+    """毫秒时间戳整列换算为 Excel 当日时刻数值"""
+    return (ms % MS_PER_DAY) / MS_PER_DAY
+
+def excel_datetime(times):
+    """pandas 时间列整列换算为 Excel 日期时间数值"""
+    return (times - EXCEL_EPOCH) / timedelta(days=1)
+
+def text_width(text):
+    """显示宽度: ASCII 字符计 1, 中文(UTF-8 三字节)计 2"""
+    return (len(text.encode('utf-8')) + len(text)) // 2
+
+class BulkWorkbook:
+    """xlsxwriter constant_memory 模式的批量写出: 逐行写入并立即落盘, 内存与行数无关
+    列宽在写入时顺带记录字符串长度, 不需要写完后再遍历一遍单元格"""
+    def __init__(self, path):
+        # 导出时才加载 xlsxwriter, 只看汇总时不需要
+        import xlsxwriter
+        self.path = path
+        self.workbook = xlsxwriter.Workbook(path, {
+            'constant_memory': True,
+            # 报文内容不需要识别为链接, 省去每个字符串的 URL 匹配
+            'strings_to_urls': False,
+            # 缺失值写为 #NUM! 而不是抛出异常
+            'nan_inf_to_errors': True
+        })
+        self.header_format = self.workbook.add_format({'bold': True, 'border': 1})
+        self._clock_format = None
+        self._datetime_format = None
+    def add_format(self, properties):
+        return self.workbook.add_format(properties)
+    def clock_format(self):
+        if self._clock_format is None:
+            self._clock_format = self.workbook.add_format({'num_format': CLOCK_FORMAT})
+        return self._clock_format
+    def datetime_format(self):
+        if self._datetime_format is None:
+            self._datetime_format = self.workbook.add_format({'num_format': DATETIME_FORMAT})
+        return self._datetime_format
+    def write_table(self, sheet_name, columns, rows, max_rows=MAX_DATA_ROWS,
+                    column_formats=None, header_format=None, on_sheet=None, min_widths=None):
+        """写出一张表, rows 为按 columns 顺序排列的值序列
+        超过 max_rows 行时自动续写到 '表名_2'、'表名_3' …, 返回 [(表名, 数据行数)]
+        column_formats: {列序号: 格式}; on_sheet(worksheet): 每新建一张表时调用, 用于条件格式等
+        min_widths: {列序号: 最小宽度}, 数值按格式显示较宽时使用"""
+        column_formats = column_formats or {}
+        min_widths = min_widths or {}
+        header_format = header_format or self.header_format
+        widths = [max(text_width(str(name)), min_widths.get(col, 0)) for col, name in enumerate(columns)]
+        sheets = []
+        worksheet = None
+        row_index = max_rows
+        for values in rows:
+            if row_index >= max_rows:
+                worksheet = self._add_sheet(sheet_name, len(sheets) + 1, columns, column_formats,
+                                            header_format, on_sheet)
+                sheets.append([worksheet, 0])
+                row_index = 0
+            row_index += 1
+            worksheet.write_row(row_index, 0, values)
+            for col, value in enumerate(values):
+                if isinstance(value, str):
+                    width = text_width(value)
+                    if width > widths[col]:
+                        widths[col] = width
+                elif widths[col] < NUMBER_COLUMN_WIDTH:
+                    widths[col] = NUMBER_COLUMN_WIDTH
+            sheets[-1][1] = row_index
+        if not sheets:
+            # 没有数据时仍输出只有标题行的表
+            worksheet = self._add_sheet(sheet_name, 1, columns, column_formats, header_format, on_sheet)
+            sheets.append([worksheet, 0])
+        for worksheet, _ in sheets:
+            for col, width in enumerate(widths):
+                worksheet.set_column(col, col, min(max(width + 2, MIN_COLUMN_WIDTH), MAX_COLUMN_WIDTH),
+                                     column_formats.get(col))
+        return [(worksheet.name, count) for worksheet, count in sheets]
+    def _add_sheet(self, sheet_name, part, columns, column_formats, header_format, on_sheet):
+        worksheet = self.workbook.add_worksheet(sheet_name if part == 1 else f'{sheet_name}_{part}')
+        # constant_memory 模式下列格式须在写入数据前设置
+        for col, cell_format in column_formats.items():
+            worksheet.set_column(col, col, None, cell_format)
+        worksheet.write_row(0, 0, columns, header_format)
+        if on_sheet:
+            on_sheet(worksheet)
+        return worksheet
+    def close(self):
+        self.workbook.close()
+    def __enter__(self):
+        return self
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
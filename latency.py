@@ -0,0 +1,122 @@
+import json
+import math
+from typing import Dict, Any, Iterable, Iterator
+
+# 统计表输出的分位数
+PERCENTILES = [50, 90, 99, 99.9]
+
+class LatencyHistogram:
+    """对数分桶的耗时直方图: 分位数相对误差不超过 precision, 内存与样本数无关, 可直接合并"""
+    def __init__(self, precision: float = 0.01):
+        self.precision = precision
+        self.gamma = (1 + precision) / (1 - precision)
+        self.log_gamma = math.log(self.gamma)
+        self.buckets: Dict[int, int] = {}
+        self.zero_count = 0  # 耗时 <= 0 的样本单独计数
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+    def add(self, value: float):
+        self.count += 1
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        if value <= 0:
+            self.zero_count += 1
+            return
+        index = math.ceil(math.log(value) / self.log_gamma)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+    def merge(self, other: 'LatencyHistogram'):
+        """合并另一段(其他分块或其他日期)的统计, 两者精度须一致"""
+        if other.precision != self.precision:
+            raise ValueError('无法合并精度不同的直方图')
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+    def quantile(self, q: float) -> float:
+        """q 取 0~1; 结果限制在实际最小/最大值之间"""
+        if self.count == 0:
+            return math.nan
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        value = 0.0
+        if rank >= seen:
+            value = self.max
+            for index in sorted(self.buckets):
+                seen += self.buckets[index]
+                if rank < seen:
+                    # 取桶的中点, 保证相对误差不超过 precision
+                    value = 2 * self.gamma ** index / (self.gamma + 1)
+                    break
+        return min(max(value, self.min), self.max)
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else math.nan
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'precision': self.precision,
+            'buckets': {str(index): count for index, count in self.buckets.items()},
+            'zero_count': self.zero_count,
+            'count': self.count,
+            'total': self.total,
+            'min': self.min if self.count else None,
+            'max': self.max if self.count else None
+        }
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'LatencyHistogram':
+        histogram = cls(data['precision'])
+        histogram.buckets = {int(index): count for index, count in data['buckets'].items()}
+        histogram.zero_count = data['zero_count']
+        histogram.count = data['count']
+        histogram.total = data['total']
+        if histogram.count:
+            histogram.min = data['min']
+            histogram.max = data['max']
+        return histogram
+
+class CommandLatencyStats:
+    """按 cmd_id 汇总动作耗时, 动作完成时即更新, 不保留动作列表"""
+    def __init__(self, precision: float = 0.01):
+        self.precision = precision
+        self.histograms: Dict[str, LatencyHistogram] = {}
+    def add(self, cmd_id: str, duration: float):
+        histogram = self.histograms.get(cmd_id)
+        if histogram is None:
+            histogram = self.histograms[cmd_id] = LatencyHistogram(self.precision)
+        histogram.add(duration)
+    def observe(self, actions: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """透传动作流, 同时更新统计"""
+        for action in actions:
+            self.add(action['cmd_id'], action['duration'])
+            yield action
+    def merge(self, other: 'CommandLatencyStats'):
+        for cmd_id, histogram in other.histograms.items():
+            if cmd_id in self.histograms:
+                self.histograms[cmd_id].merge(histogram)
+            else:
+                merged = self.histograms[cmd_id] = LatencyHistogram(histogram.precision)
+                merged.merge(histogram)
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'precision': self.precision,
+            'commands': {cmd_id: h.to_dict() for cmd_id, h in self.histograms.items()}
+        }
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'CommandLatencyStats':
+        stats = cls(data['precision'])
+        stats.histograms = {cmd_id: LatencyHistogram.from_dict(h) for cmd_id, h in data['commands'].items()}
+        return stats
+    def save(self, path: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f)
+    @classmethod
+    def load(cls, path: str) -> 'CommandLatencyStats':
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
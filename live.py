@@ -0,0 +1,367 @@
+import sys
+import json
+import time
+import asyncio
+import argparse
+from collections import Counter, deque
+
+import logformats
+import loggen
+import ControlLog
+from LogFiles import LogAnalyzer, SequenceAssembler
+from latency import CommandLatencyStats, PERCENTILES
+
+READ_CHUNK_SIZE = 64 * 1024  # 每次从连接读取的字节数, 一次读到的完整行作为一批
+QUEUE_BATCHES = 64           # 待处理队列最多积压的批数; 队列满时读取端暂停, 发送端随之被 TCP/管道阻塞
+STATS_WINDOW_S = 300         # 滚动统计的时间窗口
+STATS_BUCKET_S = 10          # 滚动窗口的分桶粒度, 过期的桶整桶淘汰
+EMIT_TICK_S = 0.05           # 模拟发送端按速率分批发送的间隔
+
+class RollingStats:
+    """最近 window_s 秒的吞吐量和按指令的耗时分位数
+    按 bucket_s 分桶, 每桶一个 CommandLatencyStats, 查询时合并窗口内的桶"""
+    def __init__(self, window_s=STATS_WINDOW_S, bucket_s=STATS_BUCKET_S):
+        self.window_s = window_s
+        self.bucket_s = bucket_s
+        self.buckets = deque()  # (桶起始时刻, 计数, 动作耗时, 序列耗时)
+        self.totals = Counter()
+        self.start = time.monotonic()
+    def _bucket(self):
+        now = time.monotonic()
+        start = now - now % self.bucket_s
+        if not self.buckets or self.buckets[-1][0] != start:
+            self.buckets.append((start, Counter(), CommandLatencyStats(), CommandLatencyStats()))
+            while self.buckets[0][0] <= now - self.window_s - self.bucket_s:
+                self.buckets.popleft()
+        return self.buckets[-1]
+    def count(self, name, n=1):
+        self._bucket()[1][name] += n
+        self.totals[name] += n
+    def add_action(self, cmd_id, duration):
+        bucket = self._bucket()
+        bucket[1]['actions'] += 1
+        bucket[2].add(cmd_id, duration)
+        self.totals['actions'] += 1
+    def add_sequence(self, seq_type, duration_ms):
+        bucket = self._bucket()
+        bucket[1]['sequences'] += 1
+        bucket[3].add(seq_type, duration_ms / 1000)
+        self.totals['sequences'] += 1
+    def snapshot(self):
+        now = time.monotonic()
+        counts = Counter()
+        actions = CommandLatencyStats()
+        sequences = CommandLatencyStats()
+        for start, bucket_counts, bucket_actions, bucket_sequences in self.buckets:
+            if start > now - self.window_s - self.bucket_s:
+                counts.update(bucket_counts)
+                actions.merge(bucket_actions)
+                sequences.merge(bucket_sequences)
+        span = max(min(now - self.start, self.window_s), 1e-9)
+        return {
+            'uptime_s': round(now - self.start, 1),
+            'window_s': self.window_s,
+            'per_sec': {name: round(count / span, 1) for name, count in counts.items()},
+            'totals': dict(self.totals),
+            'commands': {ControlLog.motion_dict.get(cmd_id, cmd_id): self._latency(h, span)
+                         for cmd_id, h in actions.histograms.items()},
+            'sequences': {seq_type: self._latency(h, span) for seq_type, h in sequences.histograms.items()}
+        }
+    @staticmethod
+    def _latency(histogram, span):
+        """单个直方图的汇总, 耗时单位为秒"""
+        entry = {
+            'count': histogram.count,
+            'per_sec': round(histogram.count / span, 2),
+            'mean': round(histogram.mean, 4),
+            'max': round(histogram.max, 4)
+        }
+        for p in PERCENTILES:
+            entry[f'p{p}'] = round(histogram.quantile(p / 100), 4)
+        return entry
+
+class StreamProcessor:
+    """一路输入流的解析状态, 按批处理; 序列重组与 analyze_log、CmdID 配对与 parse_specific_actions 共用同一套逻辑
+    kind 为 'comm'/'control' 时只解析该格式, 'auto' 时同一流中两种行按各自的字面量分流"""
+    def __init__(self, name, kind, stats, on_record=None):
+        self.name = name
+        self.kind = kind
+        self.stats = stats
+        self.on_record = on_record
+        self.analyzer = LogAnalyzer(None)
+        self.assembler = SequenceAssembler()
+        self.sequence_counts = {'send': 0, 'receive': 0}
+        self.control_format = logformats.get('control')
+        self.matcher = ControlLog.ActionMatcher()
+        self.previous = None  # 上一条控制记录的时间戳, 跨批次检测跨日
+    def process(self, lines):
+        matched = 0
+        if self.kind != 'control':
+            matched += self._process_comm(lines)
+        if self.kind != 'comm':
+            matched += self._process_control(lines)
+        self.stats.count('lines', len(lines))
+        self.stats.count('rejected', len(lines) - matched)
+    def _process_comm(self, lines):
+        log_format = self.analyzer.log_format
+        frames = 0
+        for line in lines:
+            if not log_format.accepts(line):
+                continue
+            parsed = self.analyzer.parse_log_line(line.strip())
+            if not parsed:
+                continue
+            frames += 1
+            completed = self.assembler.feed(parsed)
+            if completed:
+                seq_type, sequence = completed
+                self.sequence_counts[seq_type] += 1
+                row_data = self.analyzer.sequence_to_excel_row(
+                    sequence, "发送" if seq_type == 'send' else "接收", self.sequence_counts[seq_type])
+                if row_data:
+                    self.stats.add_sequence(seq_type, row_data['持续时间(ms)'])
+                    if self.on_record:
+                        self.on_record(self.name, 'sequence', {
+                            '类型': seq_type,
+                            '日期': row_data['日期'],
+                            '开始时间': row_data['开始时间'].strftime('%H:%M:%S.%f')[:-3],
+                            '持续时间(ms)': row_data['持续时间(ms)'],
+                            '动作': row_data['动作']
+                        })
+        self.stats.count('frames', frames)
+        return frames
+    def _process_control(self, lines):
+        records = 0
+        for parsed in ControlLog.iter_parsed_lines(lines, self.control_format, self.previous):
+            records += 1
+            self.previous = parsed['timestamp']
+            action = self.matcher.feed(parsed)
+            if action:
+                self.stats.add_action(action['cmd_id'], action['duration'])
+                if self.on_record:
+                    self.on_record(self.name, 'action', {
+                        '指令ID': ControlLog.motion_dict.get(action['cmd_id'], action['cmd_id']),
+                        '开始时间': action['start_time'].strftime('%H:%M:%S.%f')[:-3],
+                        '耗时(秒)': round(action['duration'], 3)
+                    })
+        self.stats.count('records', records)
+        return records
+
+def print_record(stream, record_type, record):
+    print(json.dumps({'stream': stream, 'type': record_type, **record}, ensure_ascii=False), flush=True)
+
+class LiveService:
+    """实时接入: 各连接/管道按块读取, 完整的行作为一批放入有界队列, 单个处理任务按到达顺序逐批处理
+    队列满时读取端停止读取, 背压经由 TCP 窗口或管道缓冲传到发送端"""
+    def __init__(self, kind='auto', window_s=STATS_WINDOW_S, queue_batches=QUEUE_BATCHES, on_record=None):
+        self.kind = kind
+        self.on_record = on_record
+        self.stats = RollingStats(window_s)
+        self.queue = asyncio.Queue(queue_batches)
+        self.consumer = None  # 处理任务, 见 start
+        self.streams = 0
+        self.active = 0
+    def start(self):
+        """启动处理任务; 须在事件循环中调用"""
+        self.consumer = asyncio.create_task(self.process_batches())
+        return self.consumer
+    async def guard(self, awaitable):
+        """等待 awaitable 完成; 处理任务先行退出时不再等待(满队列不会再被取走), 抛出异常结束服务"""
+        task = asyncio.ensure_future(awaitable)
+        if self.consumer is None:
+            return await task
+        await asyncio.wait([task, self.consumer], return_when=asyncio.FIRST_COMPLETED)
+        if task.done():
+            return task.result()
+        task.cancel()
+        error = None if self.consumer.cancelled() else self.consumer.exception()
+        raise RuntimeError('日志处理任务已退出, 停止接收') from error
+    async def put(self, processor, lines):
+        if self.queue.full():
+            await self.guard(self.queue.put((processor, lines)))
+        else:
+            self.queue.put_nowait((processor, lines))
+    async def read_stream(self, reader, name):
+        """读取一路输入直到结束; 末尾不完整的行留到下一块拼接"""
+        processor = StreamProcessor(name, self.kind, self.stats, self.on_record)
+        self.streams += 1
+        self.active += 1
+        pending = b''
+        try:
+            while True:
+                chunk = await reader.read(READ_CHUNK_SIZE)
+                if not chunk:
+                    break
+                data = pending + chunk
+                end = data.rfind(b'\n')
+                if end < 0:
+                    pending = data
+                    continue
+                pending = data[end + 1:]
+                await self.put(processor, data[:end].decode('utf-8', 'replace').split('\n'))
+            if pending:
+                await self.put(processor, [pending.decode('utf-8', 'replace')])
+        finally:
+            self.active -= 1
+    async def handle_connection(self, reader, writer):
+        peer = writer.get_extra_info('peername') or writer.get_extra_info('sockname')
+        try:
+            await self.read_stream(reader, str(peer))
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+    async def process_batches(self):
+        while True:
+            processor, lines = await self.queue.get()
+            try:
+                processor.process(lines)
+            except Exception as e:
+                # 单批出错只记录并跳过, 处理任务继续取队列, 否则读取端会阻塞在满队列上
+                self.stats.count('errors')
+                print(f"处理 {processor.name} 的 {len(lines)} 行时出错, 已跳过: {e!r}", file=sys.stderr)
+            finally:
+                self.queue.task_done()
+    def snapshot(self):
+        snapshot = self.stats.snapshot()
+        snapshot['streams'] = {'active': self.active, 'total': self.streams}
+        snapshot['queue'] = {'batches': self.queue.qsize(), 'max': self.queue.maxsize}
+        return snapshot
+    async def handle_http(self, reader, writer):
+        """最小的 HTTP/JSON 接口: GET /stats 返回滚动统计, GET /health 返回运行状态"""
+        try:
+            request = await reader.readline()
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+            parts = request.decode('latin-1').split()
+            path = parts[1].split('?')[0] if len(parts) > 1 else '/'
+            if path in ('/', '/stats'):
+                status, body = '200 OK', self.snapshot()
+            elif path == '/health':
+                status, body = '200 OK', {'status': 'ok', 'active_streams': self.active}
+            else:
+                status, body = '404 Not Found', {'error': f'未知路径: {path}'}
+            data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+            writer.write(f'HTTP/1.1 {status}\r\nContent-Type: application/json; charset=utf-8\r\n'
+                         f'Content-Length: {len(data)}\r\nConnection: close\r\n\r\n'.encode('latin-1') + data)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+def split_address(address):
+    """'HOST:PORT' 或 ':PORT'"""
+    host, _, port = address.rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+async def open_pipe(path):
+    """管道(或 FIFO 文件)作为输入流; '-' 为标准输入"""
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=READ_CHUNK_SIZE)
+    pipe = sys.stdin.buffer if path == '-' else open(path, 'rb')
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), pipe)
+    return reader
+
+async def serve(args):
+    on_record = print_record if args.print else None
+    service = LiveService(args.kind, args.window, args.queue, on_record)
+    consumer = service.start()
+    servers = []
+    if args.tcp:
+        host, port = split_address(args.tcp)
+        servers.append(await asyncio.start_server(service.handle_connection, host, port))
+        print(f"接收 TCP: {host}:{port}", file=sys.stderr)
+    if args.unix:
+        servers.append(await asyncio.start_unix_server(service.handle_connection, args.unix))
+        print(f"接收 UNIX socket: {args.unix}", file=sys.stderr)
+    if args.http:
+        host, port = split_address(args.http)
+        servers.append(await asyncio.start_server(service.handle_http, host, port))
+        print(f"统计接口: http://{host}:{port}/stats", file=sys.stderr)
+    try:
+        if args.pipe:
+            print(f"接收管道: {args.pipe}", file=sys.stderr)
+            await service.read_stream(await open_pipe(args.pipe), args.pipe)
+            await service.guard(service.queue.join())
+            if not servers:
+                # 只有管道输入时, 管道结束即输出最终统计并退出
+                print(json.dumps(service.snapshot(), ensure_ascii=False, indent=2))
+                return
+        # 处理任务意外退出时 gather 随之抛出, 服务停止而不是挂起
+        await asyncio.gather(consumer, *(server.serve_forever() for server in servers))
+    finally:
+        consumer.cancel()
+        for server in servers:
+            server.close()
+
+class _StdoutWriter:
+    """标准输出按 StreamWriter 的接口使用; 写满管道时阻塞, 即为背压"""
+    def write(self, data):
+        sys.stdout.buffer.write(data)
+    async def drain(self):
+        sys.stdout.buffer.flush()
+    def close(self):
+        sys.stdout.buffer.flush()
+    async def wait_closed(self):
+        pass
+
+async def emit(args):
+    """模拟发送端: 用 loggen 造数, 按 rate 行/秒(0 为不限速)发送到 TCP/UNIX socket 或标准输出"""
+    if args.tcp:
+        _, writer = await asyncio.open_connection(*split_address(args.tcp))
+    elif args.unix:
+        _, writer = await asyncio.open_unix_connection(args.unix)
+    else:
+        writer = _StdoutWriter()
+    lines = loggen.GENERATORS[args.kind](seed=args.seed)
+    batch_size = max(int(args.rate * EMIT_TICK_S), 1) if args.rate else 1000
+    sent = 0
+    start = time.monotonic()
+    try:
+        while args.lines is None or sent < args.lines:
+            count = batch_size if args.lines is None else min(batch_size, args.lines - sent)
+            writer.write(''.join(next(lines) + '\n' for _ in range(count)).encode('utf-8'))
+            await writer.drain()
+            sent += count
+            if args.rate:
+                delay = start + sent / args.rate - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+    except (BrokenPipeError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+        await writer.wait_closed()
+    print(f"已发送 {sent} 行, {time.monotonic() - start:.1f}s", file=sys.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description='实时接入通信/控制日志, 滚动统计经 HTTP/JSON 提供')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    serve_parser = subparsers.add_parser('serve', help='接收日志流')
+    serve_parser.add_argument('--tcp', help='监听 TCP 地址 HOST:PORT')
+    serve_parser.add_argument('--unix', help='监听 UNIX socket 路径')
+    serve_parser.add_argument('--pipe', help="从管道或 FIFO 读取, '-' 为标准输入")
+    serve_parser.add_argument('--http', help='统计接口监听地址 HOST:PORT')
+    serve_parser.add_argument('--kind', choices=['auto', 'comm', 'control'], default='auto',
+                              help='日志类型, auto 时按行分流')
+    serve_parser.add_argument('--window', type=float, default=STATS_WINDOW_S, help='滚动统计窗口(秒)')
+    serve_parser.add_argument('--queue', type=int, default=QUEUE_BATCHES, help='待处理队列的最大批数')
+    serve_parser.add_argument('--print', action='store_true', help='每个完成的序列/动作输出一行 JSON')
+    emit_parser = subparsers.add_parser('emit', help='模拟发送端')
+    emit_parser.add_argument('kind', choices=list(loggen.GENERATORS), help='日志类型')
+    emit_parser.add_argument('--tcp', help='发送到 TCP 地址 HOST:PORT')
+    emit_parser.add_argument('--unix', help='发送到 UNIX socket 路径')
+    emit_parser.add_argument('--rate', type=float, default=1000, help='每秒行数, 0 为不限速')
+    emit_parser.add_argument('--lines', type=int, help='发送行数, 默认不停发送')
+    emit_parser.add_argument('--seed', type=int, default=0, help='造数随机种子')
+    args = parser.parse_args()
+    if args.command == 'serve' and not (args.tcp or args.unix or args.pipe):
+        parser.error('serve 至少需要 --tcp、--unix 或 --pipe 之一')
+    try:
+        asyncio.run(serve(args) if args.command == 'serve' else emit(args))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
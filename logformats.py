@@ -0,0 +1,160 @@
+import os
+import re
+import json
+import argparse
+from collections import Counter
+from datetime import datetime
+import logio
+
+# 日志和结果文件的默认根目录, 可用环境变量 LOGANALYZER_ROOT 覆盖
+DEFAULT_ROOT = os.environ.get('LOGANALYZER_ROOT', 'D:/00_PROJECT/04_Python/LogAnalyzer/')
+
+def clock_ms(clock):
+    """'HH:MM:SS.f' 换算为当日毫秒数; 毫秒不足3位时按原值计, 即 '5' 表示 5ms"""
+    return (int(clock[0:2]) * 3600000 + int(clock[3:5]) * 60000
+            + int(clock[6:8]) * 1000 + int(clock[9:]))
+
+def parse_clock(clock):
+    """按固定偏移解析 'HH:MM:SS.mmm', 结果与 strptime(..., '%H:%M:%S.%f') 相同"""
+    return datetime(1900, 1, 1, int(clock[0:2]), int(clock[3:5]),
+                    int(clock[6:8]), int(clock[9:12]) * 1000)
+
+# 外部格式定义(JSON)中按名称引用的字段转换函数
+CONVERTERS = {
+    'clock_ms': clock_ms,
+    'clock': parse_clock,
+    'strip': str.strip,
+    'int': int,
+}
+
+class LogFormat:
+    """一种日志行格式: 前缀过滤字面量 + 带命名分组的正则 + 字段转换
+    fields 为输出字段(即分组名)的顺序; as_dict 为 False 时输出元组, 否则输出字典
+    anchored 为 True 时字面量须出现在行首, 否则出现在行内任意位置即可"""
+    def __init__(self, name, pattern, prefilter, fields, converters=None, anchored=False, as_dict=False):
+        self.name = name
+        self.regex = re.compile(pattern)
+        self.prefilter = prefilter
+        self.fields = tuple(fields)
+        self.converters = dict(converters or {})
+        self.anchored = anchored
+        self.as_dict = as_dict
+        missing = set(self.fields) - set(self.regex.groupindex)
+        if missing:
+            raise ValueError(f'格式 {name} 的正则缺少命名分组: {", ".join(sorted(missing))}')
+        # 按字段序号预先排好转换函数, 解析时不再查字典
+        self._converters = [(i, self.converters[field]) for i, field in enumerate(self.fields)
+                            if field in self.converters]
+    def accepts(self, line):
+        """只做一次字面量判断"""
+        if self.anchored:
+            return line.startswith(self.prefilter)
+        return self.prefilter in line
+    def match(self, line):
+        """不做字面量判断, 直接匹配正则并转换字段, 不匹配时返回 None"""
+        m = self.regex.match(line)
+        if m is None:
+            return None
+        values = m.group(*self.fields) if len(self.fields) > 1 else (m.group(self.fields[0]),)
+        if self._converters:
+            values = list(values)
+            for i, converter in self._converters:
+                values[i] = converter(values[i])
+        if self.as_dict:
+            return dict(zip(self.fields, values))
+        return tuple(values)
+    def parse(self, line):
+        if not self.accepts(line):
+            return None
+        return self.match(line)
+    def __repr__(self):
+        return f'LogFormat({self.name!r})'
+
+class FormatRegistry:
+    """已登记的日志格式; 混合格式的文件逐行分类, 每种格式先做一次字面量判断再进入正则"""
+    def __init__(self):
+        self.formats = {}
+    def register(self, log_format):
+        """登记格式, 同名格式被替换"""
+        self.formats[log_format.name] = log_format
+        return log_format
+    def get(self, name):
+        try:
+            return self.formats[name]
+        except KeyError:
+            raise KeyError(f'未登记的日志格式: {name}') from None
+    def resolve(self, log_format, default):
+        """log_format 可以是格式名、LogFormat 或 None(使用 default 格式)"""
+        if log_format is None:
+            return self.get(default)
+        if isinstance(log_format, str):
+            return self.get(log_format)
+        return log_format
+    def classify(self, line):
+        """返回该行所属的格式, 都不匹配时返回 None"""
+        for log_format in self.formats.values():
+            if log_format.accepts(line) and log_format.regex.match(line):
+                return log_format
+        return None
+    def parse(self, line):
+        """返回 (格式名, 解析结果), 都不匹配时返回 None"""
+        for log_format in self.formats.values():
+            if log_format.accepts(line):
+                record = log_format.match(line)
+                if record is not None:
+                    return log_format.name, record
+        return None
+    def load(self, path):
+        """从 JSON 文件登记格式, 如:
+        [{"name": "comm-v2", "pattern": "...", "prefilter": "TX", "anchored": true,
+          "fields": ["date", "clock", "direction", "data"], "converters": {"clock": "clock_ms"}}]"""
+        with open(path, 'r', encoding='utf-8') as f:
+            definitions = json.load(f)
+        loaded = []
+        for definition in definitions:
+            converters = {field: CONVERTERS[name] for field, name in definition.get('converters', {}).items()}
+            loaded.append(self.register(LogFormat(
+                definition['name'], definition['pattern'], definition['prefilter'], definition['fields'],
+                converters, definition.get('anchored', False), definition.get('as_dict', False))))
+        return loaded
+
+REGISTRY = FormatRegistry()
+
+# 通信日志行格式: Debug: 2024-09-24 10:00:00.123: Snd: 05
+# 输出 (日期, 当日毫秒数, 方向, 数据)
+REGISTRY.register(LogFormat(
+    'comm',
+    r'Debug:\s+(?P<date>\d{4}-\d{2}-\d{2})\s+(?P<clock>\d{2}:\d{2}:\d{2}\.(?:\d{3}|\d{1}|\d{2})):'
+    r'\s+(?P<direction>Snd|Rcv):\s+(?P<data>.+)',
+    'Debug:', ('date', 'clock', 'direction', 'data'),
+    {'clock': clock_ms, 'data': str.strip}, anchored=True))
+
+# 控制日志行格式: 10:00:00.123 [CmdID / UniID = [769 ][Exec][1 SHM_Updated]
+# 输出 {'timestamp', 'cmd_id', 'status', 'action_code', 'action_stat'}
+REGISTRY.register(LogFormat(
+    'control',
+    r'(?P<timestamp>\d{2}:\d{2}:\d{2}\.\d{3})\s+\[CmdID / UniID = \[(?P<cmd_id>\d+)\s+\]'
+    r'\[(?P<status>\w+)\]\[(?P<action_code>\d+)\s+(?P<action_stat>.*?)\]',
+    'CmdID', ('timestamp', 'cmd_id', 'status', 'action_code', 'action_stat'),
+    {'timestamp': parse_clock, 'action_stat': str.strip}, as_dict=True))
+
+def get(name):
+    return REGISTRY.get(name)
+
+def main():
+    parser = argparse.ArgumentParser(description='按已登记的日志格式逐行分类, 统计各格式行数')
+    parser.add_argument('log_path', help='日志文件')
+    parser.add_argument('--formats', help='额外的格式定义 JSON 文件')
+    args = parser.parse_args()
+    if args.formats:
+        REGISTRY.load(args.formats)
+    counts = Counter()
+    with logio.open_text(args.log_path) as f:
+        for line in f:
+            log_format = REGISTRY.classify(line.strip())
+            counts[log_format.name if log_format else '未识别'] += 1
+    for name, count in counts.most_common():
+        print(f"{name}: {count} 行")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import random
+import argparse
+from itertools import islice
+
+import LogFiles
+import ControlLog
+
+# 造数日志的起始时刻
+START_DAY = '2024-09-24'
+START_CLOCK_MS = 8 * 3600000
+
+def _payload(rng, head, min_len):
+    """主报文字节: head 之后用随机参数字节补足 min_len, 末尾再加一个校验字节"""
+    data = list(head)
+    while len(data) < min_len:
+        data.append(rng.randint(0, 9))
+    data.append(rng.randint(0, 255))
+    return ' '.join(f'{b:02x}' for b in data)
+
+def protocol_payloads(rng):
+    """覆盖协议表中每个动作和子动作的主报文, 另含未登记子动作、未知动作和字节数不足的报文"""
+    payloads = []
+    for action, entry in LogFiles.ACTION_TABLE.items():
+        min_len, template = entry[0], entry[1]
+        if isinstance(template, dict):
+            for sub, (sub_len, _) in template.items():
+                payloads.append(_payload(rng, (0x02, action, sub), max(min_len, sub_len)))
+            # 未登记的子动作走缺省模板
+            payloads.append(_payload(rng, (0x02, action, 0x7f), min_len))
+        else:
+            payloads.append(_payload(rng, (0x02, action), min_len))
+    payloads.append(_payload(rng, (0x02, 0x7e), 2))
+    payloads.append('02 63 21')
+    return payloads
+
+def iter_comm_lines(seed=0):
+    """无限产出通信日志行: 05/04/主报文/06 握手, 双向交替, 夹杂非 Debug 行; 时间连续递增并跨日"""
+    rng = random.Random(seed)
+    ms = LogFiles.date_to_epoch_ms(START_DAY) + START_CLOCK_MS
+    while True:
+        # 每一轮按顺序覆盖全部主报文, 之后的握手随机挑选
+        payloads = protocol_payloads(rng)
+        for payload in payloads + [rng.choice(payloads) for _ in range(len(payloads) * 20)]:
+            snd, rcv = ('Snd', 'Rcv') if rng.random() < 0.5 else ('Rcv', 'Snd')
+            for direction, data in ((snd, '05'), (rcv, '04'), (snd, payload), (rcv, '06')):
+                ms += rng.randint(1, 40)
+                # 毫秒位数不固定, 覆盖 1/2/3 位毫秒的写法
+                ms_str = str(ms % 1000) if rng.random() < 0.1 else f'{ms % 1000:03d}'
+                clock = LogFiles.ms_to_time(ms)
+                yield (f'Debug: {LogFiles.epoch_ms_to_date(ms // LogFiles.MS_PER_DAY)} '
+                       f'{clock.hour:02d}:{clock.minute:02d}:{clock.second:02d}.{ms_str}: {direction}: {data}')
+            if rng.random() < 0.2:
+                yield f'Info: {LogFiles.epoch_ms_to_date(ms // LogFiles.MS_PER_DAY)} heartbeat {rng.randint(0, 999)}'
+
+def iter_ctrl_lines(window=256, seed=0):
+    """无限产出控制日志行: 各 motion_dict 指令交错执行, 同时未完成的指令最多 window 条
+    先按顺序把每个指令各执行一次, 之后随机挑选; 夹杂不含 CmdID 的行, 时刻过午夜后从 00 点重新开始"""
+    rng = random.Random(seed)
+    cmd_ids = list(ControlLog.motion_dict)
+    pending = []
+    started = 0
+    ms = START_CLOCK_MS
+    while True:
+        ms += rng.randint(1, 5)
+        stamp = f'{ms // 3600000 % 24:02d}:{ms // 60000 % 60:02d}:{ms // 1000 % 60:02d}.{ms % 1000:03d}'
+        if rng.random() < 0.1:
+            yield f'{stamp} [Info] heartbeat {rng.randint(0, 999)}'
+        elif pending and (len(pending) >= window or rng.random() < 0.5):
+            cmd_id = pending.pop(rng.randrange(len(pending)))
+            yield f'{stamp} [CmdID / UniID = [{cmd_id} ][Done][2 Finish]'
+        else:
+            cmd_id = cmd_ids[started] if started < len(cmd_ids) else rng.choice(cmd_ids)
+            started += 1
+            pending.append(cmd_id)
+            yield f'{stamp} [CmdID / UniID = [{cmd_id} ][Exec][1 SHM_Updated]'
+
+GENERATORS = {
+    'comm': iter_comm_lines,
+    'control': iter_ctrl_lines,
+}
+
+def generate_lines(kind, count, seed=0):
+    return list(islice(GENERATORS[kind](seed=seed), count))
+
+def write_log(kind, path, lines=None, size_mb=None, seed=0):
+    """写出 lines 行或约 size_mb 大小的日志, 返回 (行数, 字节数)"""
+    target = size_mb * 1024 * 1024 if size_mb else None
+    count = 0
+    written = 0
+    with open(path, 'w', encoding='utf-8', newline='\n') as f:
+        batch = []
+        for line in GENERATORS[kind](seed=seed):
+            if (lines is not None and count >= lines) or (target is not None and written >= target):
+                break
+            batch.append(line)
+            count += 1
+            written += len(line.encode('utf-8')) + 1
+            if len(batch) >= 10000:
+                f.write('\n'.join(batch) + '\n')
+                batch = []
+        if batch:
+            f.write('\n'.join(batch) + '\n')
+    return count, written
+
+def main():
+    parser = argparse.ArgumentParser(description='生成可复现的通信/控制造数日志')
+    parser.add_argument('kind', choices=list(GENERATORS), help='日志类型')
+    parser.add_argument('output', help='输出文件')
+    size = parser.add_mutually_exclusive_group(required=True)
+    size.add_argument('--lines', type=int, help='行数')
+    size.add_argument('--size-mb', type=float, help='文件大小(MB)')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子, 相同种子生成相同内容')
+    args = parser.parse_args()
+    count, written = write_log(args.kind, args.output, args.lines, args.size_mb, args.seed)
+    print(f"已生成 {count} 行, {written / 1024 / 1024:.1f} MB: {args.output}")
+
+if __name__ == "__main__":
+    main()
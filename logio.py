@@ -0,0 +1,148 @@
+import io
+import os
+import mmap
+import bz2
+import gzip
+import lzma
+import queue
+import threading
+
+# 按文件头魔数识别压缩格式
+COMPRESSION_MAGIC = [
+    (b'\x1f\x8b', 'gzip'),
+    (b'\xfd7zXZ\x00', 'xz'),
+    (b'\x28\xb5\x2f\xfd', 'zstd'),
+    (b'BZh', 'bz2'),
+]
+READ_BUFFER_SIZE = 1 << 20   # 每次读取/解压 1MB
+READ_AHEAD_CHUNKS = 8        # 后台线程最多领先解析的块数
+LINE_BLOCK_SIZE = 4 << 20    # 按块解析时每块约 4MB
+
+def detect_compression(path):
+    """返回压缩格式名, 未压缩返回 None"""
+    with open(path, 'rb') as f:
+        head = f.read(6)
+    for magic, name in COMPRESSION_MAGIC:
+        if head.startswith(magic):
+            return name
+    return None
+
+def _open_zstd(path):
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError('读取 zstd 压缩日志需要安装 zstandard 包') from None
+    f = open(path, 'rb')
+    # read_across_frames: 多帧(分段压缩)的文件连续读出
+    return zstandard.ZstdDecompressor().stream_reader(f, read_size=READ_BUFFER_SIZE,
+                                                      read_across_frames=True, closefd=True)
+
+class ReadAheadStream(io.RawIOBase):
+    """后台线程预先读取并解压, 解压与解析重叠执行 (zlib/lzma/zstd 解压时释放 GIL)"""
+    def __init__(self, raw, chunk_size=READ_BUFFER_SIZE, depth=READ_AHEAD_CHUNKS):
+        super().__init__()
+        self._raw = raw
+        self._chunk_size = chunk_size
+        self._chunks = queue.Queue(depth)
+        self._pending = memoryview(b'')
+        self._stopped = threading.Event()
+        self._eof = False
+        self._error = None  # 后台线程的异常; 线程已退出, 之后每次读取都再次抛出, 不再等待队列
+        self._thread = threading.Thread(target=self._read_ahead, daemon=True)
+        self._thread.start()
+    def _read_ahead(self):
+        try:
+            while not self._stopped.is_set():
+                data = self._raw.read(self._chunk_size)
+                self._put(data)
+                if not data:
+                    break
+        except Exception as e:
+            self._put(e)
+    def _put(self, item):
+        # 读取方提前关闭时不能一直阻塞在满队列上
+        while not self._stopped.is_set():
+            try:
+                self._chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+    def readable(self):
+        return True
+    def readinto(self, buffer):
+        if not self._pending:
+            if self._error is not None:
+                raise self._error
+            if self._eof:
+                return 0
+            item = self._chunks.get()
+            if isinstance(item, Exception):
+                self._error = item
+                raise item
+            if not item:
+                self._eof = True
+                return 0
+            self._pending = memoryview(item)
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+    def close(self):
+        if not self.closed:
+            self._stopped.set()
+            self._thread.join()
+            self._raw.close()
+        super().close()
+
+def open_binary(path):
+    """以二进制流打开日志, 压缩文件按魔数识别后流式解压"""
+    compression = detect_compression(path)
+    if compression is None:
+        return open(path, 'rb', buffering=READ_BUFFER_SIZE)
+    if compression == 'gzip':
+        raw = gzip.open(path, 'rb')
+    elif compression == 'xz':
+        raw = lzma.open(path, 'rb')
+    elif compression == 'bz2':
+        raw = bz2.open(path, 'rb')
+    else:
+        raw = _open_zstd(path)
+    return io.BufferedReader(ReadAheadStream(raw), buffer_size=READ_BUFFER_SIZE)
+
+def open_text(path):
+    """以文本方式逐行读取日志, 编码与内置 open 的默认值一致"""
+    if detect_compression(path) is None:
+        return open(path, 'r', buffering=READ_BUFFER_SIZE)
+    return io.TextIOWrapper(open_binary(path))
+
+def iter_line_blocks(path, block_size=LINE_BLOCK_SIZE):
+    """按整行切分的大块 (缓冲区, 起始, 结束), 供 bytes 正则在 [起始, 结束) 上直接匹配, 不逐行拆分
+    未压缩文件 mmap 后只给出区间, 不复制数据; 压缩文件解压成块, 块尾不完整的行拼到下一块"""
+    if detect_compression(path) is None:
+        if os.path.getsize(path) == 0:
+            return
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            size = len(mm)
+            pos = 0
+            while pos < size:
+                end = mm.find(b'\n', pos + block_size) if pos + block_size < size else -1
+                end = size if end < 0 else end + 1
+                yield mm, pos, end
+                pos = end
+        return
+    with open_binary(path) as f:
+        pending = b''
+        while True:
+            chunk = f.read(block_size)
+            if not chunk:
+                if pending:
+                    yield pending, 0, len(pending)
+                return
+            data = pending + chunk
+            cut = data.rfind(b'\n') + 1
+            pending = data[cut:]
+            if cut:
+                yield data, 0, cut
+
+def is_compressed(path):
+    return detect_compression(path) is not None
@@ -0,0 +1,154 @@
+import os
+import json
+import time
+import pickle
+import hashlib
+import argparse
+
+# 解析逻辑或缓存内容格式变化时递增, 旧缓存自动失效
+CACHE_VERSION = 2
+FINGERPRINT_BLOCK = 64 * 1024       # 内容指纹取文件首尾各 64KB
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3   # 缓存目录默认上限 2GB
+# 命中计数按进程分文件 stats-<pid>.json, 汇总时连同旧版的 stats.json 一起累加
+STATS_PREFIX = 'stats'
+STATS_SUFFIX = '.json'
+ENTRY_SUFFIX = '.pickle'
+
+def cache_key(path, kind):
+    """由路径、大小、修改时间和首尾块内容生成缓存键"""
+    stat = os.stat(path)
+    digest = hashlib.sha1()
+    digest.update(f'{CACHE_VERSION}|{kind}|{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}'.encode())
+    with open(path, 'rb') as f:
+        digest.update(f.read(FINGERPRINT_BLOCK))
+        if stat.st_size > FINGERPRINT_BLOCK:
+            f.seek(max(stat.st_size - FINGERPRINT_BLOCK, FINGERPRINT_BLOCK))
+            digest.update(f.read(FINGERPRINT_BLOCK))
+    return f'{kind}-{digest.hexdigest()}'
+
+def _remove(path):
+    """删除缓存文件; 多个进程同时淘汰同一条目时, 已被删除不算错误"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def _load_counters(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'hits': 0, 'misses': 0}
+
+class ParseCache:
+    """磁盘上的解析结果缓存, 按最近访问时间做容量受限的 LRU 淘汰"""
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key + ENTRY_SUFFIX)
+    def get(self, path, kind):
+        """命中时返回缓存的解析结果, 否则返回 None"""
+        entry_path = self._entry_path(cache_key(path, kind))
+        try:
+            with open(entry_path, 'rb') as f:
+                value = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            self._count('misses')
+            return None
+        # 更新修改时间作为最近访问时间, 供 LRU 淘汰使用; 期间可能已被其他进程淘汰
+        try:
+            os.utime(entry_path)
+        except FileNotFoundError:
+            pass
+        self._count('hits')
+        return value
+    def put(self, path, kind, value):
+        entry_path = self._entry_path(cache_key(path, kind))
+        tmp_path = f'{entry_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, entry_path)
+        self.evict()
+    def entries(self):
+        """[(路径, 大小, 最近访问时间)], 最久未访问的在前"""
+        result = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(ENTRY_SUFFIX):
+                entry_path = os.path.join(self.cache_dir, name)
+                try:
+                    stat = os.stat(entry_path)
+                except FileNotFoundError:
+                    continue  # 列出目录后被其他进程淘汰
+                result.append((entry_path, stat.st_size, stat.st_mtime))
+        return sorted(result, key=lambda entry: entry[2])
+    def evict(self):
+        """删除最久未访问的条目, 直到总大小不超过上限"""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for entry_path, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            _remove(entry_path)
+            total -= size
+    def clear(self):
+        for entry_path, _, _ in self.entries():
+            _remove(entry_path)
+    def _stats_path(self):
+        # batch 多进程共用缓存目录, 各进程只改写自己的计数文件, 互不覆盖
+        return os.path.join(self.cache_dir, f'{STATS_PREFIX}-{os.getpid()}{STATS_SUFFIX}')
+    def _load_stats(self):
+        """累加各进程的命中计数"""
+        totals = {'hits': 0, 'misses': 0}
+        for name in os.listdir(self.cache_dir):
+            if name.startswith(STATS_PREFIX) and name.endswith(STATS_SUFFIX):
+                counters = _load_counters(os.path.join(self.cache_dir, name))
+                for key in totals:
+                    totals[key] += counters.get(key, 0)
+        return totals
+    def _count(self, name):
+        stats_path = self._stats_path()
+        counters = _load_counters(stats_path)
+        counters[name] = counters.get(name, 0) + 1
+        # 先写临时文件再替换, 汇总时不会读到写了一半的文件
+        tmp_path = stats_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(counters, f)
+        os.replace(tmp_path, stats_path)
+    def stats(self):
+        entries = self.entries()
+        counters = self._load_stats()
+        lookups = counters['hits'] + counters['misses']
+        return {
+            'entries': len(entries),
+            'total_bytes': sum(size for _, size, _ in entries),
+            'max_bytes': self.max_bytes,
+            'hits': counters['hits'],
+            'misses': counters['misses'],
+            'hit_rate': counters['hits'] / lookups if lookups else 0.0,
+            'oldest_access': entries[0][2] if entries else None,
+            'newest_access': entries[-1][2] if entries else None
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description='解析缓存管理')
+    parser.add_argument('command', choices=['stats', 'clear'])
+    parser.add_argument('cache_dir', help='缓存目录')
+    args = parser.parse_args()
+    cache = ParseCache(args.cache_dir)
+    if args.command == 'clear':
+        cache.clear()
+        print(f"已清空缓存: {args.cache_dir}")
+        return
+    stats = cache.stats()
+    print(f"缓存目录: {args.cache_dir}")
+    print(f"条目数: {stats['entries']}")
+    print(f"占用: {stats['total_bytes'] / 1024 / 1024:.1f} MB / {stats['max_bytes'] / 1024 / 1024:.0f} MB")
+    print(f"命中: {stats['hits']}, 未命中: {stats['misses']}, 命中率: {stats['hit_rate']:.1%}")
+    for label, key in (('最早访问', 'oldest_access'), ('最近访问', 'newest_access')):
+        if stats[key] is not None:
+            print(f"{label}: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(stats[key]))}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+import io
+import os
+import sys
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块
+    resource = None
+
+# tracemalloc / cProfile 结果保留的条目数
+TOP_ENTRIES = 10
+
+def peak_rss():
+    """进程峰值常驻内存(字节); Windows 下需要 psutil, 都不可用时返回 None"""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux 单位为 KB, macOS 为字节
+        return peak if sys.platform == 'darwin' else peak * 1024
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().peak_wset
+
+class StageStats:
+    """单个阶段的累计结果; seconds 为扣除嵌套阶段后的独占耗时"""
+    __slots__ = ('seconds', 'items', 'bytes', 'source', 'order', 'peak_rss',
+                 'profile', 'trace', 'trace_owner', 'allocations', 'trace_peak')
+    def __init__(self):
+        self.seconds = 0.0
+        self.items = 0
+        self.bytes = None
+        self.source = None   # 输入阶段名, 用于计算未匹配(被拒绝)的条数
+        self.order = None    # 首次完成的次序, 报表按此排列即为流水线顺序
+        self.peak_rss = None
+        self.profile = None  # cProfile.Profile
+        self.trace = False
+        self.trace_owner = False
+        self.allocations = None
+        self.trace_peak = None
+
+class StageProfiler:
+    """可选的分阶段计时: 流式阶段包装迭代器, 一次性阶段用 with stage(), 单个函数用 wrap()
+    阶段可以嵌套, 外层阶段的耗时自动扣除内层阶段, 各阶段耗时之和不会重复计算
+    profile 中的阶段在执行期间开启 cProfile, trace 中的阶段在存续期间开启 tracemalloc
+    (wrap 的阶段没有结束时刻, 采样持续到 report); 采样期间所有阶段都会变慢, 此时的耗时只作相对参考"""
+    def __init__(self, profile=(), trace=(), dump_dir=None):
+        self.stages = {}
+        self.profile_stages = set(profile)
+        self.trace_stages = set(trace)
+        self.dump_dir = dump_dir
+        self.stack = []       # [开始时刻, 嵌套阶段耗时]
+        self.profiling = None  # 正在采样的 cProfile, 同一时刻只能有一个
+        self.completed = 0
+        self.start = time.perf_counter()
+        self.cache_stats = None
+        self.cache_start = None
+    def watch_cache(self, cache_stats):
+        """登记报文解码缓存的统计函数(LogFiles.decoder_cache_stats), 报告其间的命中率"""
+        if self.cache_stats is None:
+            self.cache_stats = cache_stats
+            self.cache_start = cache_stats()
+    def _stats(self, stage):
+        stats = self.stages.get(stage)
+        if stats is None:
+            stats = self.stages[stage] = StageStats()
+            if stage in self.profile_stages:
+                # 指定了 cProfile 阶段时才加载
+                import cProfile
+                stats.profile = cProfile.Profile()
+            stats.trace = stage in self.trace_stages
+        return stats
+    def _enter(self, stats):
+        if stats.trace:
+            # 首次进入时开始采样; 已有其他地方在采样时不接管
+            stats.trace = False
+            if not tracemalloc.is_tracing():
+                stats.trace_owner = True
+                tracemalloc.start()
+        if stats.profile is not None and self.profiling is None:
+            self.profiling = stats.profile
+            stats.profile.enable()
+        self.stack.append([time.perf_counter(), 0.0])
+    def _leave(self, stats):
+        start, nested = self.stack.pop()
+        elapsed = time.perf_counter() - start
+        stats.seconds += elapsed - nested
+        if self.stack:
+            self.stack[-1][1] += elapsed
+        if stats.profile is not None and self.profiling is stats.profile:
+            stats.profile.disable()
+            self.profiling = None
+        if stats.order is None:
+            stats.order = self.completed
+            self.completed += 1
+    def _close(self, stats):
+        """阶段结束: 记录峰值内存, 结束 tracemalloc 采样"""
+        stats.peak_rss = peak_rss()
+        if stats.trace_owner and tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+            stats.trace_peak = tracemalloc.get_traced_memory()[1]
+            stats.allocations = [str(stat) for stat in snapshot.statistics('lineno')[:TOP_ENTRIES]]
+            tracemalloc.stop()
+            stats.trace_owner = False
+    def iterate(self, stage, iterable, measure=None, source=None, count=None):
+        """流式阶段: 统计取出每一项的耗时和条数; measure(项) 为该项的字节数
+        source 为输入阶段名, 两者条数之差即被本阶段过滤掉的条数
+        count(项) 为一项代表的条数(如一块中的行数), 默认每项计一条"""
+        stats = self._stats(stage)
+        stats.source = source
+        if measure is not None and stats.bytes is None:
+            stats.bytes = 0
+        return self._iterate(stats, iter(iterable), measure, count)
+    def _iterate(self, stats, iterator, measure, count):
+        try:
+            while True:
+                self._enter(stats)
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    self._leave(stats)
+                stats.items += 1 if count is None else count(item)
+                if measure is not None:
+                    stats.bytes += measure(item)
+                yield item
+        finally:
+            self._close(stats)
+    @contextmanager
+    def stage(self, stage, items=None):
+        """一次性阶段, 如排序和导出"""
+        stats = self._stats(stage)
+        self._enter(stats)
+        try:
+            yield stats
+        finally:
+            self._leave(stats)
+            if items is not None:
+                stats.items += items
+            self._close(stats)
+    def wrap(self, stage, func):
+        """逐次调用的阶段: 返回计时版本的 func, 每次调用计一条"""
+        stats = self._stats(stage)
+        enter, leave = self._enter, self._leave
+        def wrapped(*args, **kwargs):
+            enter(stats)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                leave(stats)
+                stats.items += 1
+        return wrapped
+    def report(self):
+        """汇总为可直接写入 JSON 的字典"""
+        wall = time.perf_counter() - self.start
+        stages = {}
+        for name, stats in sorted(self.stages.items(), key=lambda item: (item[1].order is None, item[1].order)):
+            if stats.trace_owner:
+                self._close(stats)
+            entry = {
+                'seconds': round(stats.seconds, 4),
+                'share': round(stats.seconds / wall, 4) if wall else 0.0,
+                'items': stats.items,
+                'items_per_sec': round(stats.items / stats.seconds, 1) if stats.seconds else None
+            }
+            if stats.bytes is not None:
+                entry['bytes'] = stats.bytes
+                entry['mb_per_sec'] = round(stats.bytes / 1024 / 1024 / stats.seconds, 2) if stats.seconds else None
+            source = self.stages.get(stats.source)
+            if source is not None:
+                entry['matched'] = stats.items
+                entry['rejected'] = source.items - stats.items
+            if stats.peak_rss is not None:
+                entry['peak_rss_mb'] = round(stats.peak_rss / 1024 / 1024, 1)
+            if stats.profile is not None:
+                entry['profile'] = self._profile_summary(name, stats.profile)
+            if stats.allocations is not None:
+                entry['trace_peak_mb'] = round(stats.trace_peak / 1024 / 1024, 2)
+                entry['allocations'] = stats.allocations
+            stages[name] = entry
+        decoder_cache = None
+        if self.cache_stats is not None:
+            cache_end = self.cache_stats()
+            hits = cache_end['hits'] - self.cache_start['hits']
+            misses = cache_end['misses'] - self.cache_start['misses']
+            decoder_cache = {
+                'hits': hits,
+                'misses': misses,
+                'hit_rate': round(hits / (hits + misses), 4) if hits + misses else None
+            }
+        rss = peak_rss()
+        return {
+            'wall_seconds': round(wall, 4),
+            'peak_rss_mb': round(rss / 1024 / 1024, 1) if rss is not None else None,
+            'decoder_cache': decoder_cache,
+            'stages': stages
+        }
+    def _profile_summary(self, name, profile):
+        """cProfile 结果: 指定 dump_dir 时另存为 .prof, 报告中保留累计耗时最多的函数"""
+        if self.dump_dir:
+            os.makedirs(self.dump_dir, exist_ok=True)
+            profile.dump_stats(os.path.join(self.dump_dir, f'{name}.prof'))
+        import pstats
+        try:
+            stream = io.StringIO()
+            pstats.Stats(profile, stream=stream).sort_stats('cumulative').print_stats(TOP_ENTRIES)
+        except TypeError:  # 从未开启过采样, 没有数据
+            return []
+        return [line for line in stream.getvalue().splitlines() if line.strip()]
+    def print_table(self, report=None):
+        report = report or self.report()
+        print(f"\n{'阶段':<18}{'耗时(s)':>10}{'占比':>8}{'条数':>12}{'条/秒':>14}{'MB/s':>10}{'拒绝':>10}{'峰值RSS(MB)':>13}")
+        for name, entry in report['stages'].items():
+            rate = entry['items_per_sec']
+            mb_rate = entry.get('mb_per_sec')
+            print(f"{name:<18}{entry['seconds']:>10.3f}{entry['share']:>8.1%}{entry['items']:>12}"
+                  f"{rate if rate is not None else 0:>14,.0f}"
+                  f"{mb_rate if mb_rate is not None else '':>10}"
+                  f"{entry.get('rejected', ''):>10}{entry.get('peak_rss_mb', ''):>13}")
+        summary = f"总耗时 {report['wall_seconds']:.3f}s, 峰值RSS {report['peak_rss_mb']} MB"
+        cache = report['decoder_cache']
+        if cache is not None:
+            hit_rate = f"{cache['hit_rate']:.1%}" if cache['hit_rate'] is not None else '-'
+            summary += f", 报文解码缓存命中率 {hit_rate} ({cache['hits']}/{cache['hits'] + cache['misses']})"
+        print(summary)
+        for name, entry in report['stages'].items():
+            if entry.get('profile'):
+                print(f"\n[{name}] cProfile:")
+                print('\n'.join(entry['profile']))
+            if entry.get('allocations'):
+                print(f"\n[{name}] tracemalloc 峰值 {entry['trace_peak_mb']} MB, 分配最多的代码行:")
+                print('\n'.join(entry['allocations']))
+
+def add_arguments(parser):
+    """给各脚本的命令行加上分阶段计时选项"""
+    parser.add_argument('--profile', action='store_true', help='分阶段计时, 结束时打印汇总表')
+    parser.add_argument('--profile-json', help='分阶段计时结果写入 JSON 文件')
+    parser.add_argument('--profile-stage', action='append', default=[],
+                        help='对该阶段开启 cProfile, 可重复指定')
+    parser.add_argument('--trace-stage', action='append', default=[],
+                        help='对该阶段开启 tracemalloc, 可重复指定')
+    parser.add_argument('--profile-dump', help='cProfile 结果另存为 <阶段>.prof 的目录')
+
+def from_args(args):
+    """按命令行选项创建 StageProfiler, 未开启时返回 None"""
+    if not (args.profile or args.profile_json or args.profile_stage or args.trace_stage):
+        return None
+    return StageProfiler(args.profile_stage, args.trace_stage, args.profile_dump)
+
+def finish(profiler, args):
+    """输出汇总表和/或 JSON"""
+    if profiler is None:
+        return
+    report = profiler.report()
+    if args.profile_json:
+        with open(args.profile_json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"分阶段计时结果已写入: {args.profile_json}")
+    if args.profile or args.profile_stage or args.trace_stage or not args.profile_json:
+        profiler.print_table(report)
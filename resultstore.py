@@ -0,0 +1,164 @@
+import os
+import argparse
+from datetime import datetime, date
+from latency import CommandLatencyStats
+
+# 结果库目录结构: <store_dir>/<表>/day=YYYY-MM-DD/<来源日志名>.parquet
+# 同一来源重复分析时覆盖原分区文件, 不会产生重复记录
+SEQUENCE_TABLE = 'sequences'
+ACTION_TABLE = 'actions'
+# 耗时统计草图按日保存为 JSON: <store_dir>/latency/day=YYYY-MM-DD/<来源日志名>.json
+LATENCY_TABLE = 'latency'
+TIME_COLUMNS = {
+    SEQUENCE_TABLE: '开始时间',
+    ACTION_TABLE: 'start_time'
+}
+
+def _write_partitions(df, store_dir, table, part_name):
+    """按开始时间所在日期分区写入 parquet, 返回写入的文件列表"""
+    paths = []
+    time_column = TIME_COLUMNS[table]
+    for day, part in df.groupby(df[time_column].dt.date):
+        day_dir = os.path.join(store_dir, table, f'day={day.isoformat()}')
+        os.makedirs(day_dir, exist_ok=True)
+        path = os.path.join(day_dir, f'{part_name}.parquet')
+        part.to_parquet(path, index=False)
+        paths.append(path)
+    return paths
+
+def save_sequences(report_rows, store_dir, part_name):
+    """保存 LogAnalyzer.iter_report_rows() 产出的通信序列"""
+    types = []
+    rows = []
+    for seq_type, row_data in report_rows:
+        types.append('发送' if seq_type == 'send' else '接收')
+        rows.append(row_data)
+    if not rows:
+        return []
+    # pandas 在读写结果库时才加载, 分析脚本只看汇总时不需要
+    import pandas as pd
+    # 报表行带毫秒时间戳, 整列换算为完整时间
+    df = pd.DataFrame(rows)
+    records = pd.DataFrame({
+        '类型': types,
+        '开始时间': pd.to_datetime(df['start_ms'], unit='ms'),
+        '结束时间': pd.to_datetime(df['end_ms'], unit='ms'),
+        '持续时间(ms)': df['持续时间(ms)'],
+        '动作': df['动作']
+    })
+    return _write_partitions(records, store_dir, SEQUENCE_TABLE, part_name)
+
+def save_actions(actions, store_dir, part_name, day):
+    """保存 ControlLog 解析出的动作; 控制日志只有时刻, day 为日志首行所在日期"""
+    if not actions:
+        return []
+    import pandas as pd
+    df = pd.DataFrame(actions, columns=['cmd_id', 'action_stat', 'start_time', 'end_time', 'duration'])
+    # 动作时间以 ControlLog.CLOCK_BASE 为第一天, 跨日部分已加上天数, 整列平移到 day
+    shift = pd.Timestamp(day) - pd.Timestamp(1900, 1, 1)
+    df['start_time'] = pd.to_datetime(df['start_time']) + shift
+    df['end_time'] = pd.to_datetime(df['end_time']) + shift
+    return _write_partitions(df, store_dir, ACTION_TABLE, part_name)
+
+def save_latency(stats, store_dir, part_name, day):
+    """保存一份日志的按指令耗时统计, 之后可跨日合并而无需重新读取原始日志"""
+    day_dir = os.path.join(store_dir, LATENCY_TABLE, f'day={day.isoformat()}')
+    os.makedirs(day_dir, exist_ok=True)
+    path = os.path.join(day_dir, f'{part_name}.json')
+    stats.save(path)
+    return path
+
+def load_latency(store_dir, start_day=None, end_day=None):
+    """合并 [start_day, end_day] 日期范围内的所有耗时统计"""
+    merged = CommandLatencyStats()
+    table_dir = os.path.join(store_dir, LATENCY_TABLE)
+    if not os.path.isdir(table_dir):
+        return merged
+    for name in sorted(os.listdir(table_dir)):
+        if not name.startswith('day='):
+            continue
+        day = date.fromisoformat(name[len('day='):])
+        if start_day is not None and day < start_day:
+            continue
+        if end_day is not None and day > end_day:
+            continue
+        day_dir = os.path.join(table_dir, name)
+        for file_name in sorted(os.listdir(day_dir)):
+            if file_name.endswith('.json'):
+                merged.merge(CommandLatencyStats.load(os.path.join(day_dir, file_name)))
+    return merged
+
+def load_table(store_dir, table, start=None, end=None):
+    """读取 [start, end) 时间窗口内的记录, 先按日期分区裁剪再按时间过滤"""
+    import pandas as pd
+    table_dir = os.path.join(store_dir, table)
+    if not os.path.isdir(table_dir):
+        return pd.DataFrame()
+    frames = []
+    for name in sorted(os.listdir(table_dir)):
+        if not name.startswith('day='):
+            continue
+        day = date.fromisoformat(name[len('day='):])
+        if start is not None and day < start.date():
+            continue
+        if end is not None and day > end.date():
+            continue
+        day_dir = os.path.join(table_dir, name)
+        for file_name in sorted(os.listdir(day_dir)):
+            if file_name.endswith('.parquet'):
+                frames.append(pd.read_parquet(os.path.join(day_dir, file_name)))
+    if not frames:
+        return pd.DataFrame()
+    df = pd.concat(frames, ignore_index=True)
+    time_column = TIME_COLUMNS[table]
+    if start is not None:
+        df = df[df[time_column] >= start]
+    if end is not None:
+        df = df[df[time_column] < end]
+    return df.sort_values(time_column, kind='stable', ignore_index=True)
+
+def export_excel(store_dir, output_file, start=None, end=None):
+    """把时间窗口内的通信序列和控制动作导出为Excel; 超过单表行数上限时自动续写到下一张表"""
+    import pandas as pd
+    from ControlLog import motion_dict
+    from excelwriter import BulkWorkbook, excel_datetime, DATETIME_WIDTH
+    sequences = load_table(store_dir, SEQUENCE_TABLE, start, end)
+    actions = load_table(store_dir, ACTION_TABLE, start, end)
+    with BulkWorkbook(output_file) as book:
+        # 时间窗口可跨多日, 时间列带日期
+        datetime_format = book.datetime_format()
+        if not sequences.empty:
+            columns = ['类型', '开始时间', '结束时间', '持续时间(ms)', '动作']
+            sequences['开始时间'] = excel_datetime(sequences['开始时间'])
+            sequences['结束时间'] = excel_datetime(sequences['结束时间'])
+            book.write_table('通信序列', columns, sequences[columns].itertuples(index=False, name=None),
+                             column_formats={1: datetime_format, 2: datetime_format},
+                             min_widths={1: DATETIME_WIDTH, 2: DATETIME_WIDTH})
+        if not actions.empty:
+            timeline = pd.DataFrame({
+                '开始时间': excel_datetime(actions['start_time']),
+                '结束时间': excel_datetime(actions['end_time']),
+                '指令ID': actions['cmd_id'].map(lambda cmd_id: motion_dict.get(cmd_id, cmd_id)),
+                '耗时(秒)': actions['duration'].round(3)
+            })
+            book.write_table('动作时间线', list(timeline.columns), timeline.itertuples(index=False, name=None),
+                             column_formats={0: datetime_format, 1: datetime_format},
+                             min_widths={0: DATETIME_WIDTH, 1: DATETIME_WIDTH})
+        book.write_table('统计信息', ['统计项', '数量'], [
+            ('通信序列数', len(sequences)),
+            ('控制动作数', len(actions))
+        ])
+    return len(sequences), len(actions)
+
+def main():
+    parser = argparse.ArgumentParser(description='从结果库按时间窗口导出Excel')
+    parser.add_argument('store_dir', help='结果库目录')
+    parser.add_argument('output_file', help='导出的Excel文件')
+    parser.add_argument('--start', type=datetime.fromisoformat, help='开始时间, 如 2024-09-24T14:02:00')
+    parser.add_argument('--end', type=datetime.fromisoformat, help='结束时间(不含)')
+    args = parser.parse_args()
+    sequence_count, action_count = export_excel(args.store_dir, args.output_file, args.start, args.end)
+    print(f"已导出 {sequence_count} 个通信序列, {action_count} 个控制动作: {args.output_file}")
+
+if __name__ == "__main__":
+    main()
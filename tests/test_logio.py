@@ -0,0 +1,65 @@
+import io
+import threading
+
+import pytest
+
+import logio
+
+class FailingRaw(io.RawIOBase):
+    """先返回一块数据, 之后读取时抛出异常, 模拟压缩文件中途损坏"""
+    def __init__(self):
+        self.calls = 0
+    def readable(self):
+        return True
+    def read(self, size=-1):
+        self.calls += 1
+        if self.calls == 1:
+            return b'Debug: first\n'
+        raise EOFError('压缩流意外结束')
+
+def read_with_timeout(func, timeout=5):
+    """在线程中执行读取; 超时说明读取阻塞在队列上"""
+    result = {}
+    def run():
+        try:
+            result['value'] = func()
+        except Exception as e:
+            result['error'] = e
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), '读取阻塞'
+    return result
+
+def test_read_after_error_raises_again():
+    stream = logio.ReadAheadStream(FailingRaw(), chunk_size=64)
+    try:
+        assert stream.read(64) == b'Debug: first\n'
+        for _ in range(3):
+            result = read_with_timeout(lambda: stream.read(64))
+            assert isinstance(result.get('error'), EOFError)
+    finally:
+        stream.close()
+
+def test_readinto_after_error_raises_again():
+    stream = logio.ReadAheadStream(FailingRaw(), chunk_size=64)
+    try:
+        buffer = bytearray(64)
+        assert stream.readinto(buffer) == len(b'Debug: first\n')
+        for _ in range(2):
+            result = read_with_timeout(lambda: stream.readinto(buffer))
+            assert isinstance(result.get('error'), EOFError)
+    finally:
+        stream.close()
+
+def test_read_to_eof_returns_empty():
+    stream = logio.ReadAheadStream(io.BytesIO(b'a\nb\n'), chunk_size=2)
+    try:
+        assert stream.read() == b'a\nb\n'
+        assert stream.read(10) == b''
+        assert stream.read(10) == b''
+    finally:
+        stream.close()
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-q'])
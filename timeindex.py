@@ -0,0 +1,205 @@
+import os
+import json
+import time
+import argparse
+from bisect import bisect_left
+
+INDEX_VERSION = 1
+INDEX_SUFFIX = '.tidx'
+# 每隔多少字节记录一个索引点; 定位后最多多读这么多字节, 5GB 日志约 2 万个索引点
+INDEX_INTERVAL = 256 * 1024
+MS_PER_DAY = 86400000
+# 只有时刻的日志: 比上一行倒退超过该间隔视为跨日, 与 ControlLog.ROLLOVER_GAP 一致
+ROLLOVER_GAP_MS = 12 * 3600000
+
+def parse_clock_arg(text):
+    """命令行时刻 'HH:MM[:SS[.fff]]' 换算为当日毫秒数"""
+    clock, _, frac = text.partition('.')
+    parts = clock.split(':')
+    if not 2 <= len(parts) <= 3 or not all(p.isdigit() for p in parts) or (frac and not frac.isdigit()):
+        raise ValueError(f'无法识别的时刻: {text}')
+    hour, minute, second = [int(p) for p in parts] + [0] * (3 - len(parts))
+    return ((hour * 60 + minute) * 60 + second) * 1000 + (int(frac[:3].ljust(3, '0')) if frac else 0)
+
+class TimeIndex:
+    """日志旁的稀疏时间索引 (默认为 <日志>.tidx)
+    每隔 interval 字节记录一个行首偏移, 以及该偏移之前所有行的最大时间和最后一行的时间;
+    最大时间单调不减, 少量乱序的行也不会被跳过, 二分查找即可定位时间窗口的起点
+    line_time(行) 返回该行的毫秒时间, 不是日志记录时返回 None;
+    rollover 为 True 时行内只有时刻, 倒退超过 12 小时视为跨日, 之后的时间依次加一天
+    tracker 用于跨行的解析状态(如控制日志未完成的开始事件): 每条记录调用 tracker.feed(时间),
+    每个索引点保存 tracker.get_state(), 从索引点开始读取时用 set_state 恢复, 结果与从头读取相同"""
+    def __init__(self, log_path, line_time, format_name, rollover=False, index_path=None,
+                 interval=INDEX_INTERVAL, tracker=None):
+        self.log_path = log_path
+        self.line_time = line_time
+        self.tracker = tracker
+        self.format_name = format_name
+        self.rollover = rollover
+        self.index_path = index_path or log_path + INDEX_SUFFIX
+        self.interval = interval
+        self.reset()
+    def reset(self):
+        self.offsets = []
+        self.max_times = []
+        self.last_times = []
+        self.states = []
+        # 续建所需的状态: 已索引到的字节偏移和当时的时间
+        self.size = 0
+        self.inode = None
+        self.max_time = None
+        self.last_time = None
+        self.day = 0
+        self.next_mark = 0
+        self.tracker_state = None
+    def load(self):
+        """读取索引文件, 版本、格式或索引间隔不一致时视为没有索引"""
+        if not os.path.exists(self.index_path):
+            return False
+        with open(self.index_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if (data.get('version') != INDEX_VERSION or data.get('format') != self.format_name
+                or data.get('interval') != self.interval or data.get('rollover') != self.rollover
+                or data.get('tracked') != (self.tracker is not None)):
+            return False
+        for name in ('offsets', 'max_times', 'last_times', 'states', 'size', 'inode',
+                     'max_time', 'last_time', 'day', 'next_mark', 'tracker_state'):
+            setattr(self, name, data[name])
+        return True
+    def save(self):
+        """先写临时文件再替换, 与检查点的写法一致"""
+        data = {
+            'version': INDEX_VERSION,
+            'format': self.format_name,
+            'interval': self.interval,
+            'rollover': self.rollover,
+            'tracked': self.tracker is not None,
+            'offsets': self.offsets,
+            'max_times': self.max_times,
+            'last_times': self.last_times,
+            'states': self.states,
+            'size': self.size,
+            'inode': self.inode,
+            'max_time': self.max_time,
+            'last_time': self.last_time,
+            'day': self.day,
+            'next_mark': self.next_mark,
+            'tracker_state': self.tracker_state
+        }
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(tmp_path, self.index_path)
+    def update(self):
+        """建立索引, 或从上次索引到的位置续建新增内容; 返回本次扫描的字节数
+        日志被轮转(inode 变化或文件变短)时重新建立"""
+        stat = os.stat(self.log_path)
+        if not self.load() or self.inode != stat.st_ino or stat.st_size < self.size:
+            self.reset()
+        if stat.st_size == self.size and self.inode == stat.st_ino:
+            return 0
+        start = offset = self.size
+        line_time, tracker = self.line_time, self.tracker
+        if tracker is not None:
+            tracker.set_state(self.tracker_state)
+        max_time, last_time, day, next_mark = self.max_time, self.last_time, self.day, self.next_mark
+        with open(self.log_path, 'rb') as f:
+            f.seek(offset)
+            for raw in f:
+                if not raw.endswith(b'\n'):
+                    break  # 末尾还没写完的半行留到下次续建
+                if offset >= next_mark and max_time is not None:
+                    self.offsets.append(offset)
+                    self.max_times.append(max_time)
+                    self.last_times.append(last_time)
+                    if tracker is not None:
+                        self.states.append(tracker.get_state())
+                    next_mark = offset + self.interval
+                offset += len(raw)
+                t = line_time(raw.decode('utf-8', 'replace').strip())
+                if t is None:
+                    continue
+                if self.rollover:
+                    t += day * MS_PER_DAY
+                    if last_time is not None and t < last_time - ROLLOVER_GAP_MS:
+                        day += 1
+                        t += MS_PER_DAY
+                last_time = t
+                if max_time is None or t > max_time:
+                    max_time = t
+                if tracker is not None:
+                    tracker.feed(t)
+        self.size, self.inode = offset, stat.st_ino
+        if tracker is not None:
+            self.tracker_state = tracker.get_state()
+        self.max_time, self.last_time, self.day, self.next_mark = max_time, last_time, day, next_mark
+        self.save()
+        return offset - start
+    def seek(self, t):
+        """返回 (偏移, 该偏移前最后一行的时间, 该处的 tracker 状态): 偏移之前的行时间都早于 t
+        没有合适的索引点时从文件开头读起, 此时时间和状态为 None"""
+        i = bisect_left(self.max_times, t) - 1
+        if i < 0:
+            return 0, None, None
+        return self.offsets[i], self.last_times[i], self.states[i] if self.states else None
+    def __len__(self):
+        return len(self.offsets)
+
+def iter_lines_from(path, offset):
+    """从字节偏移 offset(行首)开始逐行读取"""
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        for raw in f:
+            yield raw.decode('utf-8', 'replace')
+
+def main():
+    parser = argparse.ArgumentParser(description='按时间窗口查询日志, 首次查询时建立稀疏时间索引')
+    parser.add_argument('kind', choices=['comm', 'control'], help='日志类型')
+    parser.add_argument('log_path', help='日志文件')
+    parser.add_argument('--from', dest='start', required=True, help='窗口起点 HH:MM[:SS[.fff]]')
+    parser.add_argument('--to', dest='end', required=True, help='窗口终点 HH:MM[:SS[.fff]]')
+    parser.add_argument('--date', help='通信日志: 窗口所在日期 YYYY-MM-DD, 默认为日志第一帧的日期')
+    parser.add_argument('--day', type=int, default=0, help='控制日志: 窗口在日志的第几天(从 0 开始)')
+    parser.add_argument('--rebuild', action='store_true', help='删除已有索引后重新建立')
+    args = parser.parse_args()
+    try:
+        start_ms, end_ms = parse_clock_arg(args.start), parse_clock_arg(args.end)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.rebuild and os.path.exists(args.log_path + INDEX_SUFFIX):
+        os.remove(args.log_path + INDEX_SUFFIX)
+
+    if args.kind == 'comm':
+        from LogFiles import LogAnalyzer, date_to_epoch_ms
+        begin = time.perf_counter()
+        analyzer = LogAnalyzer(args.log_path)
+        index = analyzer.time_index()
+        indexed = time.perf_counter() - begin
+        if args.date:
+            base_ms = date_to_epoch_ms(args.date)
+        else:
+            first = next(analyzer.iter_parsed(), None)
+            base_ms = date_to_epoch_ms(first.date) if first else 0
+        rows = list(analyzer.iter_window_rows(base_ms + start_ms, base_ms + end_ms, index))
+        elapsed = time.perf_counter() - begin - indexed
+        for seq_type, row_data in rows:
+            print(f"{row_data['日期']} {row_data['开始时间'].strftime('%H:%M:%S.%f')[:-3]} "
+                  f"{'发送' if seq_type == 'send' else '接收'} {row_data['持续时间(ms)']:>8.0f}ms {row_data['动作']}")
+        found = f"{len(rows)} 个通信序列"
+    else:
+        import ControlLog
+        begin = time.perf_counter()
+        index = ControlLog.time_index(args.log_path)
+        indexed = time.perf_counter() - begin
+        base_ms = args.day * MS_PER_DAY
+        actions = ControlLog.sort_actions(list(
+            ControlLog.iter_window_actions(args.log_path, base_ms + start_ms, base_ms + end_ms, index)))
+        elapsed = time.perf_counter() - begin - indexed
+        for action in actions:
+            print(f"{action['start_time'].strftime('%H:%M:%S.%f')[:-3]} "
+                  f"{ControlLog.motion_dict.get(action['cmd_id'], action['cmd_id']):<14} {action['duration']:.3f}s")
+        found = f"{len(actions)} 个动作"
+    print(f"索引 {len(index)} 个点 ({indexed * 1000:.0f}ms), 查询 {elapsed * 1000:.0f}ms, 找到 {found}")
+
+if __name__ == "__main__":
+    main()